@@ -1,20 +1,85 @@
 import json
+from StringIO import StringIO
 from lxml import etree
 
-from urllib2 import urlopen
-
+import requests
 from pymarc import marcxml
 
 from django.conf import settings
 
+from ui import parallel
+from ui.cache import TieredCache
+from ui.profiling import timed
+from ui.records import Availability, ElectronicData, Holding, Item
 from ui.templatetags.launchpad_extras import clean_isbn
 
 
+def cache_settings():
+    conf = {
+        'TIMEOUT': 60 * 60 * 24,
+        'NEGATIVE_TIMEOUT': 60 * 60,
+        'LOCAL_SIZE': 1000,
+    }
+    conf.update(getattr(settings, 'API_CACHE', {}))
+    return conf
+
+
+# responses from the web services below, keyed by (service, identifier)
+cache = TieredCache('apis', size=cache_settings()['LOCAL_SIZE'],
+                    negative_timeout=cache_settings()['NEGATIVE_TIMEOUT'])
+
+# one keep-alive session per process, shared by every thread
+session = requests.Session()
+session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=20))
+session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=20))
+
+
+def _timeout():
+    return getattr(settings, 'API_TIMEOUT', 5)
+
+
+def _get(url):
+    """
+    Fetch url over the shared session, raising on errors and on any
+    response taking longer than API_TIMEOUT seconds.
+    """
+    with timed('http'):
+        response = session.get(url, timeout=_timeout())
+        response.raise_for_status()
+        return response.content
+
+
+def _cached(service, key, fetch):
+    """
+    Returns fetch() through the cache. Failed fetches raise instead of
+    being cached as not found.
+    """
+    return cache.get_or_set((service, key), fetch,
+                            cache_settings()['TIMEOUT'])
+
+
+def _call(func, *args):
+    return func(*args)
+
+
+def call_all(calls):
+    """
+    Runs (func, args) pairs concurrently and returns their results in the
+    same order, giving up on any still running after API_TIMEOUT seconds.
+    Calls that fail or time out give None.
+    """
+    timeout = _timeout()
+    return parallel.fan_out(
+        _call, [((func,) + tuple(args), timeout) for func, args in calls],
+        lambda *args: None)
+
+
 def get_bib_data(num, num_type):
-    for api in settings.API_LIST:
-        bib = globals()[api['name']](num=num, num_type=num_type,
-                                     url=api.get('url', ''),
-                                     key=api.get('key', ''))
+    # ask every api at once, but prefer them in API_LIST order
+    calls = [(globals()[api['name']],
+              (num, num_type, api.get('url', ''), api.get('key', '')))
+             for api in settings.API_LIST]
+    for bib in call_all(calls):
         if bib:
             return bib
     return None
@@ -23,8 +88,8 @@ def get_bib_data(num, num_type):
 def googlebooks(num, num_type, url, key):
     url = url % (num_type, num)
     try:
-        response = urlopen(url)
-        json_data = json.loads(response.read())
+        json_data = _cached('googlebooks', (num_type, num),
+                            lambda: json.loads(_get(url)))
     except:
         return None
     if json_data['totalItems'] == 0 or len(json_data.get('items', [])) == 0:
@@ -64,7 +129,8 @@ def worldcat(num, num_type, url, key):
 # e.g., /oclc/34473395  /oclc/34474496
     url = url % (num, key)
     try:
-        records = marcxml.parse_xml_to_array(urlopen(url))
+        records = _cached('worldcat', num, lambda: marcxml.parse_xml_to_array(
+            StringIO(_get(url))))
         if not records:
             return None
         record = records[0]
@@ -126,9 +192,8 @@ def openlibrary(num, num_type, force=False, as_holding=True):
     url = 'http://openlibrary.org/api/books?format=json&jscmd=data' + \
         '&bibkeys=%s' % params
     try:
-        response = urlopen(url)
-        json_data = json.loads(response.read())
-        book = json_data.get(params, {})
+        book = _cached('openlibrary', params,
+                       lambda: json.loads(_get(url)).get(params, {}))
         for ebook in book.get('ebooks', []):
             if ebook.get('availability', '') == 'full':
                 return make_openlib_holding(book) if as_holding else book
@@ -140,7 +205,7 @@ def openlibrary(num, num_type, force=False, as_holding=True):
 
 
 def make_openlib_holding(book):
-    holding = {
+    holding = Holding({
         'LIBRARY_NAME': 'IA',
         'LOCATION_NAME': 'OL',
         'LOCATION_DISPLAY_NAME': 'OL: Open Library',
@@ -154,29 +219,29 @@ def make_openlib_holding(book):
         },
         'MFHD_ID': None,
         'ITEMS': [
-            {'ITEM_ENUM': None,
-             'ITEM_STATUS': None,
-             'TEMPLOCATION': None,
-             "ITEM_STATUS_DESC": None,
-             "ITEM_ID": 0,
-             "PERMLOCATION": None,
-             "LIBRARY_FULL_NAME": "Internet Archive",
-             "ELIGIBLE": False,
-             "TRIMMED_LOCATION_DISPLAY_NAME": "Open Library",
-             "CHRON": None,
-             "DISPLAY_CALL_NO": None,
-             "BIB_ID": None},
+            Item({'ITEM_ENUM': None,
+                  'ITEM_STATUS': None,
+                  'TEMPLOCATION': None,
+                  "ITEM_STATUS_DESC": None,
+                  "ITEM_ID": 0,
+                  "PERMLOCATION": None,
+                  "LIBRARY_FULL_NAME": "Internet Archive",
+                  "ELIGIBLE": False,
+                  "TRIMMED_LOCATION_DISPLAY_NAME": "Open Library",
+                  "CHRON": None,
+                  "DISPLAY_CALL_NO": None,
+                  "BIB_ID": None}),
         ],
         'ELIGIBLE': False,
         'LIBRARY_FULL_NAME': 'Internet Archive',
         'TRIMMED_LOCATION_DISPLAY_NAME': 'Open Library',
-        'ELECTRONIC_DATA': {},
+        'ELECTRONIC_DATA': ElectronicData(),
         'LIBRARY_HAS': [],
         'LOCATION_ID': None,
-        'AVAILABILITY': {},
+        'AVAILABILITY': Availability(),
         'DISPLAY_CALL_NO': None,
         'BIB_ID': None,
-    }
+    })
     if book.keys():
         holding['ITEMS'][0]['DISPLAY_CALL_NO'] = \
             book.get('identifiers', {}).get('openlibrary', [])[0]
@@ -198,8 +263,8 @@ def hathitrust(num, num_type):
     params = '%s/%s' % (num_type, num)
     url = 'http://catalog.hathitrust.org/api/volumes/brief/%s.json' % params
     try:
-        response = urlopen(url)
-        json_data = json.loads(response.read())
+        json_data = _cached('hathitrust', params,
+                            lambda: json.loads(_get(url)))
         for item in json_data.get('items', []):
             if item.get('usRightsString', '') == 'Full view':
                 return make_hathi_holding(item.get('itemURL', ''),
@@ -211,7 +276,7 @@ def hathitrust(num, num_type):
 def make_hathi_holding(url, fromRecord):
     # use library name IA
     # add dummy elements to conform with holding model
-    holding = {
+    holding = Holding({
         'LIBRARY_NAME': 'IA',
         'LOCATION_NAME': 'HT',
         'LOCATION_DISPLAY_NAME': 'HT: Hathi Trust',
@@ -225,46 +290,51 @@ def make_hathi_holding(url, fromRecord):
         },
         'MFHD_ID': None,
         'ITEMS': [
-            {'ITEM_ENUM': None,
-             'ITEM_STATUS': None,
-             'TEMPLOCATION': None,
-             "ITEM_STATUS_DESC": None,
-             "ITEM_ID": 0,
-             "PERMLOCATION": None,
-             "LIBRARY_FULL_NAME": "Hathi Trust",
-             "ELIGIBLE": False,
-             "TRIMMED_LOCATION_DISPLAY_NAME": "Hathi Trust Digital Library",
-             "CHRON": None,
-             "DISPLAY_CALL_NO": fromRecord,
-             "BIB_ID": None},
+            Item({'ITEM_ENUM': None,
+                  'ITEM_STATUS': None,
+                  'TEMPLOCATION': None,
+                  "ITEM_STATUS_DESC": None,
+                  "ITEM_ID": 0,
+                  "PERMLOCATION": None,
+                  "LIBRARY_FULL_NAME": "Hathi Trust",
+                  "ELIGIBLE": False,
+                  "TRIMMED_LOCATION_DISPLAY_NAME":
+                  "Hathi Trust Digital Library",
+                  "CHRON": None,
+                  "DISPLAY_CALL_NO": fromRecord,
+                  "BIB_ID": None}),
         ],
         'ELIGIBLE': False,
         'LIBRARY_FULL_NAME': 'Hathi Trust',
         'TRIMMED_LOCATION_DISPLAY_NAME': 'Hathi Trust Digital Library',
-        'ELECTRONIC_DATA': {},
+        'ELECTRONIC_DATA': ElectronicData(),
         'LIBRARY_HAS': [],
         'LOCATION_ID': None,
-        'AVAILABILITY': {},
+        'AVAILABILITY': Availability(),
         'DISPLAY_CALL_NO': 'Record ' + fromRecord,
         'BIB_ID': None,
-    }
+    })
     return holding
 
-def sersol360link(num, num_type, count=0):
+def sersol360link(num, num_type):
     try:
-        count += 1
-        url = '%s&%s=%s' % (settings.SER_SOL_API_URL, num_type, num)
-        response = urlopen(url)
-        tree = etree.fromstring(response.read())
+        return _cached('sersol360link', (num_type, num),
+                       lambda: _sersol360link(num, num_type))
     except:
         return []
+
+
+def _sersol360link(num, num_type, count=0):
+    count += 1
+    url = '%s&%s=%s' % (settings.SER_SOL_API_URL, num_type, num)
+    tree = etree.fromstring(_get(url))
     output = []
     ns = 'http://xml.serialssolutions.com/ns/openurl/v1.0'
     openurls = tree.xpath('/sso:openURLResponse/sso:results/sso:result/sso' +
                           ':linkGroups/sso:linkGroup[@type="holding"]',
                           namespaces={'sso': ns})
     if not openurls and count < settings.SER_SOL_API_MAX_ATTEMPTS:
-        return sersol360link(num, num_type, count)
+        return _sersol360link(num, num_type, count)
     for openurl in openurls:
         dbid = openurl.xpath('sso:holdingData/sso:databaseId',
                              namespaces={'sso': ns})
@@ -0,0 +1,215 @@
+"""
+A two level cache for results fetched from remote services: a small
+in-process LRU in front of the django cache (memcached in production).
+Values are pickled in both tiers, so callers always get their own copy
+and can modify it freely. get_or_refresh adds stale-while-revalidate
+on top, for values too slow to recompute while someone waits.
+"""
+
+import cPickle as pickle
+import hashlib
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from django.core.cache import cache as shared_cache
+
+from ui import parallel
+
+
+# every TieredCache made, so the in-process tiers can be emptied together
+instances = weakref.WeakSet()
+
+# seconds one process may spend refreshing a stale value before another
+# process is allowed to try
+REFRESH_LOCK_SECONDS = 60
+
+
+def clear_local():
+    """
+    Empty the in-process tier of every TieredCache.
+    """
+    for cache in list(instances):
+        with cache.lock:
+            cache.local.clear()
+
+
+class _Flight(object):
+    """
+    A call to fill one key that other threads in the process wait on.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.data = None
+        self.error = None
+
+
+class TieredCache(object):
+    """
+    Caches values under `name` keyed by any repr-able key. Empty results
+    (None, [], {}) count as not found and are kept for `negative_timeout`
+    seconds instead of the normal timeout.
+    """
+
+    def __init__(self, name, size=1000, negative_timeout=300):
+        self.name = name
+        self.size = size
+        self.negative_timeout = negative_timeout
+        self.lock = threading.Lock()
+        self.local = OrderedDict()
+        self.flights = {}
+        instances.add(self)
+
+    def make_key(self, key):
+        # memcached keys are limited to 250 characters without whitespace
+        return '%s:%s' % (self.name, hashlib.sha1(repr(key)).hexdigest())
+
+    def get(self, key):
+        """
+        Returns a (found, value) pair.
+        """
+        key = self.make_key(key)
+        now = time.time()
+        with self.lock:
+            entry = self.local.pop(key, None)
+            if entry is not None and entry[0] > now:
+                self.local[key] = entry
+                return True, pickle.loads(entry[1])
+        entry = shared_cache.get(key)
+        if entry is None:
+            return False, None
+        expires, data = entry
+        self._set_local(key, expires, data)
+        return True, pickle.loads(data)
+
+    def get_many(self, keys):
+        """
+        Returns {key: value} for those of keys that are cached.
+        """
+        found, remote = {}, {}
+        now = time.time()
+        with self.lock:
+            for key in keys:
+                cache_key = self.make_key(key)
+                entry = self.local.pop(cache_key, None)
+                if entry is not None and entry[0] > now:
+                    self.local[cache_key] = entry
+                    found[key] = entry[1]
+                else:
+                    remote[cache_key] = key
+        if remote:
+            entries = shared_cache.get_many(remote.keys())
+            for cache_key, (expires, data) in entries.items():
+                self._set_local(cache_key, expires, data)
+                found[remote[cache_key]] = data
+        return dict([(key, pickle.loads(data))
+                     for key, data in found.items()])
+
+    def set(self, key, value, timeout):
+        if not value:
+            timeout = min(timeout, self.negative_timeout)
+        key = self.make_key(key)
+        expires = time.time() + timeout
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self._set_local(key, expires, data)
+        shared_cache.set(key, (expires, data), timeout)
+
+    def _set_local(self, key, expires, data):
+        with self.lock:
+            self.local.pop(key, None)
+            self.local[key] = (expires, data)
+            while len(self.local) > self.size:
+                self.local.popitem(last=False)
+
+    def delete(self, key):
+        key = self.make_key(key)
+        with self.lock:
+            self.local.pop(key, None)
+        shared_cache.delete(key)
+
+    def get_or_set(self, key, func, timeout):
+        """
+        Returns the cached value for key, calling func() and caching its
+        result on a miss. Exceptions from func are not cached.
+        """
+        found, value = self.get(key)
+        if not found:
+            value = func()
+            self.set(key, value, timeout)
+        return value
+
+    def get_or_refresh(self, key, func, timeout, stale_timeout,
+                       retry=None):
+        """
+        Like get_or_set, but once a value is `timeout` seconds old it is
+        still returned for another `stale_timeout` seconds while a
+        background thread calls func() to replace it. Concurrent misses
+        for a key in one process share a single call to func(), and only
+        one process at a time refreshes a stale value. If given, retry()
+        is what background threads call instead of func(), and when
+        func() fails on a miss a background thread calls it to fill the
+        key for the next request.
+        """
+        found, entry = self.get(key)
+        if found and entry[0] <= time.time():
+            # another process may have refreshed it already
+            with self.lock:
+                self.local.pop(self.make_key(key), None)
+            found, entry = self.get(key)
+        if not found:
+            try:
+                return self._fill(key, func, timeout, stale_timeout)
+            except Exception:
+                if retry is not None:
+                    self._refresh(key, retry, timeout, stale_timeout)
+                raise
+        fresh_until, value = entry
+        if fresh_until <= time.time():
+            self._refresh(key, retry or func, timeout, stale_timeout)
+        return value
+
+    def _fill(self, key, func, timeout, stale_timeout):
+        cache_key = self.make_key(key)
+        with self.lock:
+            flight = self.flights.get(cache_key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[cache_key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return pickle.loads(flight.data)
+        try:
+            value = func()
+            flight.data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            if not value:
+                timeout = min(timeout, self.negative_timeout)
+                stale_timeout = 0
+            self.set(key, (time.time() + timeout, value),
+                     timeout + stale_timeout)
+            return value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[cache_key]
+            flight.done.set()
+
+    def _refresh(self, key, func, timeout, stale_timeout):
+        with self.lock:
+            if self.make_key(key) in self.flights:
+                return
+        lock = self.make_key(('refresh', key))
+        if shared_cache.add(lock, 1, REFRESH_LOCK_SECONDS):
+            parallel.submit(self._refill, key, func, timeout, stale_timeout,
+                            lock)
+
+    def _refill(self, key, func, timeout, stale_timeout, lock):
+        try:
+            self._fill(key, func, timeout, stale_timeout)
+        finally:
+            shared_cache.delete(lock)
@@ -0,0 +1,362 @@
+"""
+A local SQLite copy of the Voyager data behind related-bib lookups: every
+bib's library, title and suppression, and its ISBN, ISSN, OCLC and LCCN
+headings from bib_index. When CLUSTER_INDEX names the file, item pages and
+/related read standard numbers and related bibs from it instead of running
+self-joins on bib_index in Voyager. `manage.py cluster_index` builds it and
+brings it up to date with bibs changed since the last run.
+
+The index stores headings, not clusters: related bibs are found by running
+the same two-step self-join locally, against indexed tables, when they are
+read. Voyager's related bibs are those sharing a heading with a bib that
+has one of the numbers, capped by heading count, not connected components,
+so a cluster id stored per bib would give different answers.
+
+Bibs missing from the index (created since it was last updated), an index
+not updated within CLUSTER_INDEX_MAX_AGE seconds and any error reading it
+send lookups back to Voyager.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from django.conf import settings
+
+from ui.pool import connection
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE bib (
+    bib_id INTEGER PRIMARY KEY,
+    library_name TEXT,
+    title TEXT,
+    suppressed INTEGER);
+CREATE TABLE heading (
+    bib_id INTEGER,
+    index_code TEXT,
+    normal_heading TEXT,
+    display_heading TEXT,
+    setser INTEGER);
+CREATE INDEX heading_normal ON heading (normal_heading, index_code);
+CREATE INDEX heading_bib ON heading (bib_id);
+CREATE TABLE meta (
+    name TEXT PRIMARY KEY,
+    value TEXT);
+"""
+
+BIB_QUERY = """
+SELECT bib_master.bib_id, library.library_name, bib_text.title,
+       bib_master.suppress_in_opac
+FROM bib_master, library, bib_text
+WHERE bib_master.library_id=library.library_id
+AND bib_text.bib_id=bib_master.bib_id"""
+
+HEADING_QUERY = """
+SELECT bib_index.bib_id, bib_index.index_code, bib_index.normal_heading,
+       bib_index.display_heading
+FROM bib_index
+WHERE bib_index.index_code IN (%s)"""
+
+CHANGED_QUERY = """
+SELECT bib_master.bib_id
+FROM bib_master
+WHERE bib_master.update_date >= %s
+OR bib_master.create_date >= %s"""
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _index_codes():
+    codes = set()
+    for num_codes in settings.INDEX_CODES.values():
+        codes.update(num_codes)
+    return sorted(codes)
+
+
+def _fetch_rows(cursor, size=1000):
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+        for row in rows:
+            yield row
+
+
+def _bib_rows(cursor):
+    for bib_id, library_name, title, suppress in _fetch_rows(cursor):
+        yield bib_id, library_name, title, int(suppress != 'N')
+
+
+def _heading_rows(cursor):
+    for bib_id, code, normal, display in _fetch_rows(cursor):
+        # related lookups skip headings for sets and series
+        setser = display is None or 'SET' in display.upper() or \
+            'SER' in display.upper()
+        yield bib_id, code, normal, display, int(setser)
+
+
+def _connect(path):
+    conn = sqlite3.connect(path)
+    conn.text_factory = str
+    return conn
+
+
+def last_built(path):
+    """
+    When the data in the index at path was read from Voyager, or None.
+    """
+    conn = _connect(path)
+    try:
+        row = conn.execute(
+            "SELECT value FROM meta WHERE name = 'built'").fetchone()
+    finally:
+        conn.close()
+    return datetime.strptime(row[0], DATE_FORMAT) if row else None
+
+
+def build(path):
+    """
+    Read every bib and standard number heading from Voyager into a new
+    index, replacing the one at path once it is complete, and return how
+    many bibs it holds.
+    """
+    from ui.db import in_binds
+    started = datetime.now()
+    tmp = path + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = _connect(tmp)
+    try:
+        conn.executescript(SCHEMA)
+        cursor = connection.cursor('bulk')
+        cursor.execute(BIB_QUERY)
+        conn.executemany('INSERT INTO bib VALUES (?, ?, ?, ?)',
+                         _bib_rows(cursor))
+        binds, params = in_binds(_index_codes())
+        cursor = connection.cursor('bulk')
+        cursor.execute(HEADING_QUERY % binds, params)
+        conn.executemany('INSERT INTO heading VALUES (?, ?, ?, ?, ?)',
+                         _heading_rows(cursor))
+        conn.execute("INSERT INTO meta VALUES ('built', ?)",
+                     (started.strftime(DATE_FORMAT),))
+        conn.commit()
+        count = conn.execute('SELECT COUNT(*) FROM bib').fetchone()[0]
+    finally:
+        conn.close()
+    os.rename(tmp, path)
+    return count
+
+
+def update(path, since=None):
+    """
+    Re-read the bibs created or updated in Voyager since `since` (by
+    default, since the index was last built or updated) and return how
+    many there were. Bibs deleted from Voyager stay until the next build.
+    """
+    from ui.db import in_binds, IN_LIST_BUCKETS
+    started = datetime.now()
+    if since is None:
+        since = last_built(path)
+    cursor = connection.cursor('bulk')
+    cursor.execute(CHANGED_QUERY, [since, since])
+    bibids = sorted(set([row[0] for row in _fetch_rows(cursor)]))
+    conn = _connect(path)
+    try:
+        size = IN_LIST_BUCKETS[-1]
+        for i in range(0, len(bibids), size):
+            chunk = bibids[i:i + size]
+            marks = ','.join(['?'] * len(chunk))
+            conn.execute('DELETE FROM bib WHERE bib_id IN (%s)' % marks,
+                         chunk)
+            conn.execute('DELETE FROM heading WHERE bib_id IN (%s)' % marks,
+                         chunk)
+            binds, params = in_binds(chunk)
+            cursor = connection.cursor('bulk')
+            cursor.execute(BIB_QUERY + '\nAND bib_master.bib_id IN (%s)' %
+                           binds, params)
+            conn.executemany('INSERT INTO bib VALUES (?, ?, ?, ?)',
+                             _bib_rows(cursor))
+            codes, code_params = in_binds(_index_codes())
+            cursor = connection.cursor('bulk')
+            cursor.execute(
+                HEADING_QUERY % codes + '\nAND bib_index.bib_id IN (%s)' %
+                binds, code_params + params)
+            conn.executemany('INSERT INTO heading VALUES (?, ?, ?, ?, ?)',
+                             _heading_rows(cursor))
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('built', ?)",
+                     (started.strftime(DATE_FORMAT),))
+        conn.commit()
+    finally:
+        conn.close()
+    return len(bibids)
+
+
+class ClusterIndex(object):
+    """
+    Reads an index built by build(). Each thread keeps its own connection,
+    reopened when a rebuild swaps in a new file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def _connect(self):
+        inode = os.stat(self.path).st_ino
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.inode != inode:
+            conn = _connect(self.path)
+            self.local.conn = conn
+            self.local.inode = inode
+        return conn
+
+    def built(self):
+        """
+        When the data in the index was read from Voyager, or None.
+        """
+        row = self._connect().execute(
+            "SELECT value FROM meta WHERE name = 'built'").fetchone()
+        return datetime.strptime(row[0], DATE_FORMAT) if row else None
+
+    def has(self, bibid):
+        return self._connect().execute(
+            'SELECT 1 FROM bib WHERE bib_id = ?', (bibid,)).fetchone() \
+            is not None
+
+    def std_nums(self, bibid, codes, oclc=False):
+        """
+        (normal, display) headings of a bib, as get_related_std_nums reads
+        them from bib_index.
+        """
+        query = """
+SELECT heading.normal_heading, heading.display_heading
+FROM heading, bib
+WHERE heading.bib_id = bib.bib_id
+AND heading.index_code IN (%s)
+AND heading.bib_id = ?
+AND heading.normal_heading != 'OCOLC'
+AND bib.suppressed = 0""" % ','.join(['?'] * len(codes))
+        if oclc:
+            query += """
+AND heading.normal_heading != heading.display_heading"""
+        query += """
+ORDER BY heading.normal_heading
+LIMIT 11"""
+        return self._connect().execute(
+            query, list(codes) + [bibid]).fetchall()
+
+    def related(self, codes, numbers, oclc=False, limit=None):
+        """
+        Bibs sharing a heading with any bib that has one of `numbers`,
+        ordered by bib_id, as dictionaries with the BIB_ID, DISPLAY_HEADING,
+        LIBRARY_NAME and TITLE of each matching heading. `limit` caps the
+        headings followed from the first set of bibs.
+
+        This is a local copy of the nested bib_index query in
+        voyager.get_related_bibids; its cost grows with the number of
+        headings and bibs it passes through.
+        """
+        marks = ','.join(['?'] * len(codes))
+        not_oclc = """
+        AND normal_heading != display_heading""" if oclc else ''
+        query = """
+SELECT DISTINCT heading.bib_id, heading.display_heading, bib.library_name,
+       bib.title
+FROM heading, bib
+WHERE heading.bib_id = bib.bib_id
+AND bib.suppressed = 0
+AND heading.index_code IN (%(codes)s)
+AND heading.normal_heading != 'OCOLC'
+AND heading.setser = 0
+AND heading.normal_heading IN (
+    SELECT normal_heading
+    FROM heading
+    WHERE index_code IN (%(codes)s)%(not_oclc)s
+    AND setser = 0
+    AND bib_id IN (
+        SELECT bib_id
+        FROM heading
+        WHERE index_code IN (%(codes)s)
+        AND normal_heading IN (%(numbers)s)
+        AND normal_heading != 'OCOLC'%(not_oclc)s
+        AND setser = 0)%(limit)s)
+ORDER BY heading.bib_id""" % {
+            'codes': marks,
+            'numbers': ','.join(['?'] * len(numbers)),
+            'not_oclc': not_oclc,
+            'limit': '\n    LIMIT %d' % limit if limit else '',
+        }
+        params = list(codes) * 2 + list(codes) + list(numbers)
+        rows = self._connect().execute(query, params).fetchall()
+        return [dict(zip(('BIB_ID', 'DISPLAY_HEADING', 'LIBRARY_NAME',
+                          'TITLE'), row)) for row in rows]
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_index():
+    """
+    The ClusterIndex named by CLUSTER_INDEX, or None when there isn't one.
+    """
+    global _index
+    path = getattr(settings, 'CLUSTER_INDEX', '')
+    if not path or not os.path.exists(path):
+        return None
+    with _lock:
+        if _index is None or _index.path != path:
+            _index = ClusterIndex(path)
+        return _index
+
+
+def _usable(index, bibid):
+    """
+    Whether index is recent enough and has bibid, so lookups for it can
+    skip Voyager.
+    """
+    built = index.built()
+    max_age = getattr(settings, 'CLUSTER_INDEX_MAX_AGE', 86400)
+    if built is None or \
+            datetime.now() - built > timedelta(seconds=max_age):
+        return False
+    return index.has(bibid)
+
+
+def std_nums(bibid, codes, oclc=False):
+    """
+    ClusterIndex.std_nums from the configured index, or None when the
+    lookup has to go to Voyager instead.
+    """
+    index = get_index()
+    if index is None:
+        return None
+    try:
+        if not _usable(index, bibid):
+            return None
+        return index.std_nums(bibid, codes, oclc)
+    except sqlite3.Error:
+        logger.exception('unable to read cluster index %s' % index.path)
+        return None
+
+
+def related(bibid, codes, numbers, oclc=False, limit=None):
+    """
+    ClusterIndex.related for the numbers of bibid from the configured
+    index, or None when the lookup has to go to Voyager instead.
+    """
+    index = get_index()
+    if index is None or bibid is None:
+        return None
+    try:
+        if not _usable(index, bibid):
+            return None
+        return index.related(codes, numbers, oclc, limit)
+    except sqlite3.Error:
+        logger.exception('unable to read cluster index %s' % index.path)
+        return None
@@ -8,10 +8,14 @@ import re
 import pymarc
 import logging
 
-from PyZ3950 import zoom
-from django.db import connection
 from django.conf import settings
 
+from ui import clusters
+from ui import parallel
+from ui import z3950
+from ui.cache import TieredCache
+from ui.pool import connection
+
 # oracle specific configuration since Voyager's Oracle requires ASCII
 
 if settings.DATABASES['default']['ENGINE'] == 'django.db.backends.oracle':
@@ -27,17 +31,26 @@ if settings.DATABASES['default']['ENGINE'] == 'django.db.backends.oracle':
     django.db.backends.oracle.base.convert_unicode = \
         django.utils.encoding.force_bytes
 
+# availability JSON-LD by bibid, so the /availability calls from a page of
+# search results can be answered from a prefetch
+availability_cache = TieredCache('availability', size=1000)
+
 
 def get_item(bibid):
     """
     Get JSON-LD for a given bibid.
     """
+    return item_from_marc(bibid, get_marc(bibid))
+
+
+def item_from_marc(bibid, marc):
+    """
+    Get JSON-LD for a bibid from its pymarc.Record.
+    """
     item = {
         '@type': 'Book',
     }
 
-    marc = get_marc(bibid)
-
     item['wrlc'] = bibid
 
     # get item name (title)
@@ -79,7 +92,7 @@ def get_marc(bibid):
     Get pymarc.Record for a given bibid.
     """
     query = "SELECT wrlcdb.getBibBlob(%s) AS marcblob from bib_master"
-    cursor = connection.cursor()
+    cursor = connection.cursor('single')
     cursor.execute(query, [bibid])
     row = cursor.fetchone()
     raw_marc = str(row[0])
@@ -91,38 +104,80 @@ def get_availability(bibid):
     """
     Get availability information as JSON-LD for a given bibid.
     """
-    if not isinstance(bibid, basestring):
-        raise Exception("supplied a non-string: %s" % bibid)
-
-    url = 'http://%s/item/%s' % (_get_hostname(), bibid)
-    results = {
-        '@context': {
-            '@vocab': 'http://schema.org/',
-        },
-        '@id': url,
-        'offers': [],
-        'wrlc': bibid,
-    }
+    return get_availabilities([bibid])[bibid]
 
-    # if the bibid is numeric we can look it up locally in Voyager
-    if re.match('^\d+$', bibid):
-        results['offers'] = _get_offers(bibid)
 
-    # George Mason and Georgetown have special ids in Summon and we need
-    # to talk to their catalogs to determine availability
-    else:
-        if bibid.startswith('m'):
-            results['offers'] = _get_offers_z3950(bibid, 'George Mason')
+def get_availabilities(bibids):
+    """
+    Get availability information as JSON-LD for a list of bibids, returned
+    as a dictionary keyed by bibid. Each bibid's availability is cached for
+    AVAILABILITY_CACHE_SECONDS; the rest are looked up together.
+    """
+    for bibid in bibids:
+        if not isinstance(bibid, basestring):
+            raise Exception("supplied a non-string: %s" % bibid)
+    results = availability_cache.get_many(bibids)
+    missing = [b for b in set(bibids) if b not in results]
+    if missing:
+        timeout = getattr(settings, 'AVAILABILITY_CACHE_SECONDS', 60)
+        for bibid, availability in _fetch_availabilities(missing).items():
+            availability_cache.set(bibid, availability, timeout)
+            results[bibid] = availability
+    return results
+
+
+def _fetch_availabilities(bibids):
+    """
+    Looks up availability for bibids: Voyager bibids together and George
+    Mason/Georgetown ids batched per catalog.
+    """
+    results = {}
+    z3950_lookups = []
+    for bibid in bibids:
+        if not isinstance(bibid, basestring):
+            raise Exception("supplied a non-string: %s" % bibid)
+
+        url = 'http://%s/item/%s' % (_get_hostname(), bibid)
+        results[bibid] = {
+            '@context': {
+                '@vocab': 'http://schema.org/',
+            },
+            '@id': url,
+            'offers': [],
+            'wrlc': bibid,
+        }
+
+        # George Mason and Georgetown have special ids in Summon and we need
+        # to talk to their catalogs to determine availability
+        if re.match('^\d+$', bibid):
+            continue
+        elif bibid.startswith('m'):
+            z3950_lookups.append((bibid, 'George Mason'))
         elif bibid.startswith('b'):
-            results['offers'] = _get_offers_z3950(bibid, 'Georgetown')
+            z3950_lookups.append((bibid, 'Georgetown'))
         else:
             raise Exception("unknown bibid format %s" % bibid)
 
+    # numeric bibids can be looked up locally in Voyager, unless they turn
+    # out to be held by one of the z39.50 libraries
+    numeric = [b for b in results if re.match('^\d+$', b)]
+    for bibid, (offers, library) in _get_offers(numeric).items():
+        if library:
+            z3950_lookups.append((bibid, library))
+        else:
+            results[bibid]['offers'] = offers
+
+    for bibid, offers in _get_offers_z3950_grouped(z3950_lookups).items():
+        results[bibid]['offers'] = offers
+
+    for bibid in results:
+        if re.match('^\d+$', bibid):
+            continue
         # update wrlc id if there is a record in voyager for it
         wrlc_id = get_bibid_from_summonid(bibid)
         if wrlc_id:
-            results['wrlc'] = wrlc_id
-            results['summon'] = bibid
+            results[bibid]['wrlc'] = wrlc_id
+            results[bibid]['summon'] = bibid
 
     return results
 
@@ -152,7 +207,7 @@ def get_bibid_from_gtid(id):
         AND bib_index.bib_id = bib_master.bib_id
         AND bib_master.library_id IN ('14', '15')
         """
-    cursor = connection.cursor()
+    cursor = connection.cursor('single')
     cursor.execute(query, [id.upper()])
     results = cursor.fetchone()
     return str(results[0]) if results else None
@@ -170,7 +225,7 @@ def get_bibid_from_gmid(id):
         AND bib_master.library_id = '6'
         AND bib_index.normal_heading = %s
         """
-    cursor = connection.cursor()
+    cursor = connection.cursor('single')
     cursor.execute(query, [id.upper()])
     results = cursor.fetchone()
     return str(results[0]) if results else None
@@ -219,7 +274,8 @@ def get_related_bibids_by_lccn(item):
     ORDER BY bib_index.bib_id
     '''
 
-    rows = _fetch_all(q, [item['lccn']])
+    rows = _related_rows(q, [item['lccn']], item['wrlc'], ('010A',),
+                         [item['lccn']])
     rows = _filter_by_title(rows, item['name'])
 
     return rows
@@ -229,7 +285,7 @@ def get_related_bibids_by_oclc(item):
     if 'oclc' not in item or len(item['oclc']) == 0:
         return []
 
-    binds = ','.join(['%s'] * len(item['oclc']))
+    binds, params = in_binds(item['oclc'])
 
     q = u'''
     SELECT DISTINCT bib_index.bib_id, bib_text.title
@@ -262,7 +318,8 @@ def get_related_bibids_by_oclc(item):
     ORDER BY bib_index.bib_id
     ''' % binds
 
-    rows = _fetch_all(q, item['oclc'])
+    rows = _related_rows(q, params, item['wrlc'], ('035A',), item['oclc'],
+                         oclc=True)
     rows = _filter_by_title(rows, item['name'])
 
     return rows
@@ -272,7 +329,7 @@ def get_related_bibids_by_isbn(item):
     if 'isbn' not in item or len(item['isbn']) == 0:
         return []
 
-    binds = ','.join(['%s'] * len(item['isbn']))
+    binds, params = in_binds(item['isbn'])
 
     q = '''
     SELECT DISTINCT bib_index.bib_id, bib_text.title
@@ -303,7 +360,8 @@ def get_related_bibids_by_isbn(item):
     ORDER BY bib_index.bib_id
     ''' % binds
 
-    rows = _fetch_all(q, item['isbn'])
+    rows = _related_rows(q, params, item['wrlc'],
+                         ('020N', '020A', 'ISB3', '020Z'), item['isbn'])
     rows = _filter_by_title(rows, item['name'])
 
     return rows
@@ -313,7 +371,9 @@ def get_related_bibids_by_issn(item):
     if 'issn' not in item or len(item['issn']) == 0:
         return []
 
-    binds = ','.join(['%s'] * len(item['issn']))
+    # voyager wants "1059-1028" to look like "1059 1028"
+    issns = [i.replace('-', ' ') for i in item['issn']]
+    binds, params = in_binds(issns)
 
     q = '''
     SELECT DISTINCT bib_index.bib_id, bib_text.title
@@ -344,17 +404,19 @@ def get_related_bibids_by_issn(item):
     ORDER BY bib_index.bib_id
     ''' % binds
 
-    # voyager wants "1059-1028" to look like "1059 1028"
-    issns = [i.replace('-', ' ') for i in item['issn']]
-
-    rows = _fetch_all(q, issns)
+    rows = _related_rows(q, params, item['wrlc'], ('022A', '022Z', '022L'),
+                         issns)
     rows = _filter_by_title(rows, item['name'])
 
     return rows
 
 
-def _get_offers(bibid):
-    offers = []
+def _get_offers(bibids):
+    """
+    Returns a dictionary mapping each bibid to an (offers, library) pair.
+    library is set, and offers should be fetched from that library's z39.50
+    catalog, for George Mason and Georgetown records.
+    """
     query = \
         """
         SELECT DISTINCT
@@ -369,7 +431,8 @@ def _get_offers(bibid):
           item_status_date,
           to_char(CIRC_TRANSACTIONS.CHARGE_DUE_DATE, 'yyyy-mm-dd') AS DUE,
           library.library_display_name,
-          holding_location.location_display_name as HoldingLocation
+          holding_location.location_display_name as HoldingLocation,
+          bib_master.bib_id
         FROM bib_master
         JOIN library ON library.library_id = bib_master.library_id
         JOIN bib_mfhd ON bib_master.bib_id = bib_mfhd.bib_id
@@ -391,16 +454,30 @@ def _get_offers(bibid):
           ON temp_location.location_id = item.temp_location
         LEFT OUTER JOIN circ_transactions
           ON item.item_id = circ_transactions.item_id
-        WHERE bib_master.bib_id = %s
+        WHERE bib_master.bib_id IN (%s)
         AND mfhd_master.suppress_in_opac != 'Y'
         ORDER BY PermLocation, TempLocation, item_status_date desc
         """
 
-    cursor = connection.cursor()
-    cursor.execute(query, [bibid])
+    rows = dict([(bibid, []) for bibid in bibids])
+    # bib_id comes back as a number, map it back to the bibid asked for
+    keys = dict([(str(int(bibid)), bibid) for bibid in bibids])
+    bibids = list(set(bibids))
+    for i in range(0, len(bibids), IN_LIST_BUCKETS[-1]):
+        binds, params = in_binds(bibids[i:i + IN_LIST_BUCKETS[-1]])
+        cursor = connection.cursor()
+        cursor.execute(query % binds, params)
+        for row in cursor.fetchall():
+            rows[keys[str(row[12])]].append(row)
+    return dict([(bibid, _make_offers(bibid_rows))
+                 for bibid, bibid_rows in rows.items()])
+
+
+def _make_offers(rows):
+    offers = []
     # this will get set to true for libraries that require a z39.50 lookup
     need_z3950_lookup = False
-    for row in cursor.fetchall():
+    for row in rows:
         seller = settings.LIB_LOOKUP.get(row[10], '?')
         desc = row[1] or 'Available'
         if row[9] == '2382-12-31' or row[9] == '2022-02-20' or \
@@ -445,30 +522,62 @@ def _get_offers(bibid):
         offers.append(o)
 
     if need_z3950_lookup:
-        library = offers[0]['seller']
-        return _get_offers_z3950(bibid, library)
+        return offers, offers[0]['seller']
+
+    return offers, None
+
+
+# z39.50 libraries by their names in LIB_LOOKUP, with their Z3950_SERVERS key
+Z3950_LIBRARIES = {
+    'George Mason': 'GM',
+    'Georgetown': 'GT',
+}
 
-    return offers
+
+def _get_offers_z3950_grouped(lookups):
+    """
+    Takes (id, library) pairs and returns a dictionary of offers keyed by
+    id. All the ids are looked up at once, each catalog's on its own
+    threads so it runs as many searches as it allows connections. An id
+    whose lookup fails or runs past its catalog's TIMEOUT gets no offers,
+    and the others keep theirs.
+    """
+    calls = []
+    for id, library in lookups:
+        server = settings.Z3950_SERVERS.get(Z3950_LIBRARIES.get(library), {})
+        timeout = server.get('TIMEOUT', getattr(settings, 'Z3950_TIMEOUT', 10))
+        calls.append(((id, library), timeout))
+
+    def pool_for(id, library):
+        code = Z3950_LIBRARIES.get(library)
+        if code in settings.Z3950_SERVERS:
+            return z3950.get_server_threads(settings.Z3950_SERVERS[code])
+
+    results = parallel.fan_out(_get_offers_z3950, calls,
+                               lambda id, library: [], pool_for)
+    return dict([(id, offers)
+                 for ((id, library), timeout), offers in zip(calls, results)])
 
 
 def _get_offers_z3950(id, library):
+    # offers carry circulation status, so they get the short timeout
+    return z3950.cache.get_or_set(
+        ('offers', library, id), lambda: _fetch_offers_z3950(id, library),
+        z3950.cache_settings()['STATUS_TIMEOUT'])
+
+
+def _fetch_offers_z3950(id, library):
     offers = []
 
     # determine which server to talk to
-    if library == 'Georgetown':
-        conf = settings.Z3950_SERVERS['GT']
-    elif library == 'George Mason':
-        id = id.strip('m')
-        conf = settings.Z3950_SERVERS['GM']
-    else:
+    if library not in Z3950_LIBRARIES:
         raise Exception("unrecognized library %s" % library)
+    if library == 'George Mason':
+        id = id.strip('m')
+    conf = settings.Z3950_SERVERS[Z3950_LIBRARIES[library]]
 
     # search for the id, and get the first record
-    z = zoom.Connection(conf['IP'], conf['PORT'])
-    z.databaseName = conf['DB']
-    z.preferredRecordSyntax = conf['SYNTAX']
-    q = zoom.Query('PQF', '@attr 1=12 %s' % id.encode('utf-8'))
-    results = z.search(q)
+    results = z3950.get_server_pool(conf).search(z3950.bib_query(id))
     if len(results) == 0:
         return []
     rec = results[0]
@@ -578,8 +687,31 @@ def _normalize_status(status_id):
         return 'http://schema.org/InStock'
 
 
+# IN lists are padded with NULLs out to one of these sizes so the statement
+# text depends on the bucket rather than the number of values, which lets
+# Oracle (and the driver's statement cache) reuse the parsed statement
+IN_LIST_BUCKETS = (1, 4, 16, 64)
+
+
+def in_binds(values):
+    """
+    Returns a (placeholders, params) pair for use in an IN (...) clause.
+    The params are padded with NULLs up to the next size in IN_LIST_BUCKETS,
+    or to the next multiple of the largest bucket for longer lists.
+    """
+    values = list(values)
+    largest = IN_LIST_BUCKETS[-1]
+    for size in IN_LIST_BUCKETS:
+        if len(values) <= size:
+            break
+    else:
+        size = -(-len(values) // largest) * largest
+    params = values + [None] * (size - len(values))
+    return ','.join(['%s'] * size), params
+
+
 def _fetch_one(query, params=[]):
-    cursor = connection.cursor()
+    cursor = connection.cursor('single')
     cursor.execute(query, params)
     return cursor.fetchone()
 
@@ -593,6 +725,22 @@ def _fetch_all(query, params=None):
     return cursor.fetchall()
 
 
+def _related_rows(query, params, bibid, codes, numbers, oclc=False):
+    """
+    (bib_id, title) rows for the bibs related through `codes` headings to
+    `numbers` of bibid, from the cluster index when it has bibid and
+    otherwise from running query.
+    """
+    related = clusters.related(bibid, codes, numbers, oclc)
+    if related is None:
+        return _fetch_all(query, params)
+    rows = []
+    for row in related:
+        if not rows or rows[-1][0] != row['BIB_ID']:
+            rows.append((row['BIB_ID'], row['TITLE']))
+    return rows
+
+
 def _normalize_location(location):
     if not location:
         return None
@@ -0,0 +1,744 @@
+"""
+Stand-ins for Voyager, the George Mason and Georgetown Z39.50 catalogs and
+the web services launchpad calls, so pages can be exercised and timed
+without any of them.
+
+FakeVoyager keeps a SQLite copy of the Voyager tables launchpad reads,
+filled with generated clusters of bib records that share ISBNs, OCLC
+numbers and titles the way copies of one work held by several libraries
+do. The wrlcdb.* functions are registered as Python functions and its
+cursors take the Oracle SQL in ui.voyager and ui.db as written. install()
+points ui.pool.connection, the Z39.50 pools and ui.apis' HTTP session at
+the fakes; uninstall() puts everything back. serial_holdings and
+summon_facets generate the large holdings and search responses the sort and
+facet code is timed on.
+"""
+
+import copy
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from urlparse import urlparse
+
+import pymarc
+import requests
+
+from ui import apis
+from ui import z3950
+from ui.pool import connection
+
+
+SCHEMA = """
+CREATE TABLE library (
+    library_id INTEGER PRIMARY KEY,
+    library_name TEXT,
+    library_display_name TEXT);
+CREATE TABLE location (
+    location_id INTEGER PRIMARY KEY,
+    location_name TEXT,
+    location_display_name TEXT);
+CREATE TABLE bib_master (
+    bib_id INTEGER PRIMARY KEY,
+    library_id INTEGER,
+    suppress_in_opac TEXT,
+    create_date TEXT,
+    update_date TEXT);
+CREATE TABLE bib_text (
+    bib_id INTEGER PRIMARY KEY,
+    title TEXT, author TEXT, publisher TEXT, lccn TEXT, edition TEXT,
+    isbn TEXT, issn TEXT, network_number TEXT, pub_place TEXT,
+    imprint TEXT, bib_format TEXT, language TEXT, publisher_date TEXT);
+CREATE TABLE bib_index (
+    bib_id INTEGER,
+    index_code TEXT,
+    normal_heading TEXT,
+    display_heading TEXT);
+CREATE INDEX bib_index_heading ON bib_index (normal_heading);
+CREATE INDEX bib_index_bib ON bib_index (bib_id);
+CREATE TABLE bib_mfhd (
+    bib_id INTEGER,
+    mfhd_id INTEGER);
+CREATE INDEX bib_mfhd_bib ON bib_mfhd (bib_id);
+CREATE INDEX bib_mfhd_mfhd ON bib_mfhd (mfhd_id);
+CREATE TABLE mfhd_master (
+    mfhd_id INTEGER PRIMARY KEY,
+    location_id INTEGER,
+    display_call_no TEXT,
+    suppress_in_opac TEXT);
+CREATE TABLE mfhd_item (
+    mfhd_id INTEGER,
+    item_id INTEGER,
+    item_enum TEXT,
+    chron TEXT);
+CREATE INDEX mfhd_item_mfhd ON mfhd_item (mfhd_id);
+CREATE TABLE item (
+    item_id INTEGER PRIMARY KEY,
+    perm_location INTEGER,
+    temp_location INTEGER);
+CREATE TABLE item_status (
+    item_id INTEGER,
+    item_status INTEGER,
+    item_status_date TEXT);
+CREATE INDEX item_status_item ON item_status (item_id);
+CREATE TABLE item_status_type (
+    item_status_type INTEGER PRIMARY KEY,
+    item_status_desc TEXT);
+CREATE TABLE circ_transactions (
+    item_id INTEGER,
+    charge_due_date TEXT,
+    current_due_date TEXT);
+CREATE INDEX circ_transactions_item ON circ_transactions (item_id);
+CREATE TABLE hold_recall_items (
+    item_id INTEGER);
+CREATE INDEX hold_recall_items_item ON hold_recall_items (item_id);
+"""
+
+# (library_id, code); George Mason and Georgetown keep the ids the
+# queries in ui.voyager and ui.db look for
+LIBRARIES = [(7, 'GW'), (2, 'AU'), (3, 'CU'), (4, 'GA'), (5, 'MU'),
+             (6, 'GM'), (14, 'GT'), (10, 'WR')]
+Z3950_CODES = ('GM', 'GT')
+
+ITEM_STATUSES = [(1, 'Not Charged'), (2, 'Charged'), (11, 'Discharged'),
+                 (12, 'Missing'), (19, 'Cataloging Review')]
+
+WORDS = ['history', 'politics', 'river', 'economy', 'letters', 'science',
+         'empire', 'music', 'city', 'law', 'health', 'language', 'war',
+         'memory', 'trade', 'faith', 'design', 'nature', 'power', 'women']
+
+# catalogs the fake Z39.50 pools stand in for, keyed like Z3950_SERVERS
+Z3950_SERVERS = {
+    'GM': {'IP': 'gm.z3950.invalid', 'PORT': 210, 'DB': 'fake',
+           'SYNTAX': 'OPAC', 'TIMEOUT': 10},
+    'GT': {'IP': 'gt.z3950.invalid', 'PORT': 210, 'DB': 'fake',
+           'SYNTAX': 'OPAC', 'TIMEOUT': 10},
+}
+
+# canned bodies for the web services in ui.apis, by host; each answers
+# that it has nothing for the number asked about
+HTTP_RESPONSES = [
+    ('googleapis.com', '{"totalItems": 0}'),
+    ('worldcat.org', '<collection xmlns="http://www.loc.gov/MARC21/slim"/>'),
+    ('openlibrary.org', '{}'),
+    ('hathitrust.org', '{"items": []}'),
+    ('serialssolutions.com',
+     '<?xml version="1.0" encoding="UTF-8"?>'
+     '<ssopenurl:openURLResponse xmlns:ssopenurl='
+     '"http://xml.serialssolutions.com/ns/openurl/v1.0">'
+     '<ssopenurl:results/></ssopenurl:openURLResponse>'),
+]
+
+
+def _subfields(field):
+    return zip(field.subfields[0::2], field.subfields[1::2])
+
+
+def _substr(value, start, length=None):
+    # Oracle counts a start of 0 as 1, SQLite does not
+    if value is None:
+        return None
+    start = max(start, 1) - 1 if start >= 0 else len(value) + start
+    if length is None:
+        return value[start:]
+    return value[start:start + length]
+
+
+def _to_char(value, fmt):
+    if value is None:
+        return None
+    year, month, day = value[:10].split('-')
+    return fmt.lower().replace('yyyy', year).replace('mm', month) \
+        .replace('dd', day)
+
+
+def translate(sql, params):
+    """
+    Rewrite Oracle SQL as launchpad writes it into SQLite: '%s'
+    placeholders become '?', wrlcdb.X calls the registered wrlcdb_X
+    functions and ROWNUM limits are dropped.
+    """
+    sql = sql.replace('wrlcdb.', 'wrlcdb_')
+    sql = re.sub(r'ROWNUM\s*<\s*\d+', '1=1', sql)
+    # ui.db._get_offers joins library twice, which Oracle tolerates
+    sql = re.sub(r'JOIN library ON bib_master\.library_id = '
+                 r'library\.library_id\s*', '', sql)
+    if params is not None:
+        sql = sql % tuple(['?'] * len(params))
+    return sql
+
+
+class FakeCursor(object):
+    """
+    A sqlite3 cursor taking Oracle SQL and %s placeholders, which reports
+    column names in upper case as cx_Oracle does.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.arraysize = cursor.arraysize
+
+    @property
+    def description(self):
+        if self.cursor.description is None:
+            return None
+        return [(col[0].upper(),) + tuple(col[1:])
+                for col in self.cursor.description]
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def execute(self, sql, params=None):
+        self.cursor.execute(translate(sql, params), params or [])
+        return self
+
+    def executemany(self, sql, param_list):
+        param_list = list(param_list)
+        params = param_list[0] if param_list else []
+        self.cursor.executemany(translate(sql, params), param_list)
+        return self
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self.cursor.fetchmany(size or self.arraysize)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def close(self):
+        self.cursor.close()
+
+
+def serial_holdings(holdings=12, items=1000, seed=0):
+    """
+    Holdings as ui.voyager.get_holdings returns them, for a serial with long
+    runs of items, with just the fields the ui.sort functions look at.
+    """
+    rnd = random.Random(seed)
+    statuses = dict(ITEM_STATUSES)
+    results = []
+    for i in range(holdings):
+        library = rnd.choice(LIBRARIES)[1]
+        location = rnd.choice([None, 'stacks', 'periodicals', 'storage'])
+        holding = {
+            'MFHD_ID': i,
+            'LIBRARY_NAME': library,
+            'LOCATION_NAME': '%s %s' % (library.lower(), location)
+                             if location else None,
+            'AVAILABILITY': {'ITEM_STATUS': rnd.choice(statuses.keys())},
+            'ELECTRONIC_DATA': {'LINK856U': rnd.choice(
+                [None, None, 'http://example.com/%s' % i])},
+            'ITEMS': [],
+        }
+        call_no = 'AP%s .%s' % (rnd.randint(1, 99), rnd.choice(WORDS))
+        for n in range(rnd.randint(0, items)):
+            status = rnd.choice(statuses.keys())
+            holding['ITEMS'].append({
+                'ITEM_ID': n,
+                'ITEM_ENUM': rnd.choice(
+                    [None, 'v.%s' % rnd.randint(1, 200),
+                     'v.%s no.%s' % (rnd.randint(1, 200), rnd.randint(1, 12)),
+                     'Suppl.']),
+                'DISPLAY_CALL_NO': rnd.choice([call_no, None, 'Periodical']),
+                'TEMPLOCATION': rnd.choice([None, None, None, 'Reserve']),
+                'ITEM_STATUS': status,
+                'ITEM_STATUS_DESC': statuses[status],
+            })
+        results.append(holding)
+    return results
+
+
+# facet fields a search page asks Summon for, with the values they take;
+# None marks fields whose values are made up from WORDS
+SUMMON_FACETS = [
+    ('Institution', ['George Washington University (GW)',
+                     'Marymount University (MU)', 'Howard University (HU)',
+                     'Catholic University of America (CU)',
+                     'Gallaudet University (GA)', 'George Mason University',
+                     'Georgetown University', 'American University (AU)']),
+    ('Library', ['Bender Library', 'WRLC Shared Collections Facility',
+                 'Gelman Library', 'Fenwick Library', 'Lauinger Library',
+                 'Mullen Library']),
+    ('ContentType', ['Government Document', 'Book', 'Video Recording',
+                     'Journal Article', 'Archival Material', 'Dissertation',
+                     'eBook', 'Journal / eJournal', 'Music Score',
+                     'Book Chapter', 'Audio Recording', 'Map', 'Newspaper',
+                     'Book Review']),
+    ('Language', ['Spanish', 'Latin', 'Japanese', 'Russian',
+                  u'Portugu\xeas', 'French', 'Arabic', 'Italian', 'Korean',
+                  'Chinese', 'English', 'German']),
+    ('Author', None),
+    ('Discipline', None),
+    ('SubjectTerms', None),
+    ('TemporalSubjectTerms', None),
+    ('GeographicLocations', None),
+    ('Genre', None),
+]
+
+
+def _facet_value(rnd, field):
+    if field == 'Author':
+        return '%s, %s %s.' % (rnd.choice(WORDS).title(),
+                               rnd.choice(WORDS).title(),
+                               rnd.choice('ABCDEFGH'))
+    if field == 'TemporalSubjectTerms':
+        start = rnd.randint(1500, 1980)
+        return '%s-%s' % (start, start + rnd.randint(10, 50))
+    words = ' '.join(rnd.sample(WORDS, rnd.randint(1, 3)))
+    return words + rnd.choice(['', ': a study', ' & society', ', 1900-1950',
+                               u' \u2014 caf\xe9'])
+
+
+def summon_facets(values=120, seed=0):
+    """
+    A raw Summon search response for 'history' with no documents and every
+    facet field a search page asks for filled out, the generated ones with
+    `values` values each, in no particular field order.
+    """
+    rnd = random.Random(seed)
+    fields = []
+    for field, choices in SUMMON_FACETS:
+        if choices is None:
+            choices = set()
+            while len(choices) < values:
+                choices.add(_facet_value(rnd, field))
+            choices = list(choices)
+        counts = sorted([rnd.randint(1, 5000) for c in choices],
+                        reverse=True)
+        fields.append({
+            'fieldName': field, 'displayName': field, 'combineMode': 'or',
+            'page': 1, 'pageSize': len(choices),
+            'removeCommand': 'removeFacetField(%s)' % field,
+            'counts': [{'value': value, 'count': count, 'isApplied': False,
+                        'isNegated': False, 'isFurtherLimiting': True}
+                       for value, count in zip(choices, counts)],
+        })
+    rnd.shuffle(fields)
+    return {'recordCount': 48213, 'pageCount': 2411, 'totalRequestTime': 212,
+            'query': {'textQuery': 'history', 'pageNumber': 1,
+                      'pageSize': 20},
+            'documents': [], 'facetFields': fields}
+
+
+class FakeSummoner(object):
+    """
+    Stands in for the summoner client behind ui.summon.Summon, answering
+    every search with a copy of `response`.
+    """
+
+    def __init__(self, response):
+        self.response = response
+
+    def search(self, q, **kwargs):
+        return copy.deepcopy(self.response)
+
+
+class FakeVoyager(object):
+    """
+    A generated Voyager database in a temporary SQLite file. Each thread
+    gets its own SQLite connection, so it can serve the worker threads in
+    ui.parallel too.
+    """
+
+    def __init__(self, clusters=100, cluster_size=4, seed=0,
+                 z3950_share=0.2):
+        self.clusters = clusters
+        self.cluster_size = cluster_size
+        self.z3950_share = z3950_share
+        self.random = random.Random(seed)
+        fd, self.path = tempfile.mkstemp(prefix='fakevoyager-',
+                                         suffix='.sqlite')
+        os.close(fd)
+        self.local = threading.local()
+        # MARC records by bib_id and mfhd_id, for the wrlcdb functions
+        self.bibs = {}
+        self.mfhds = {}
+        # records for the fake z39.50 catalogs, by code then catalog id
+        self.z3950_records = {'GM': {}, 'GT': {}}
+        # generated bibids by library code, for picking benchmark samples
+        self.bibids = {}
+        # the same for George Mason and Georgetown ids as Summon has them
+        self.catalog_ids = []
+        self.saved = None
+        self._populate()
+
+    def _connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            # Voyager's US7ASCII session hands back byte strings
+            conn.text_factory = str
+            conn.create_function('SUBSTR', 2, _substr)
+            conn.create_function('SUBSTR', 3, _substr)
+            conn.create_function('to_char', 2, _to_char)
+            conn.create_function('NVL', 2,
+                                 lambda a, b: b if a is None else a)
+            conn.create_function('wrlcdb_getBibBlob', 1, self.get_bib_blob)
+            conn.create_function('wrlcdb_GetMarcField', 7,
+                                 self.get_marc_field)
+            conn.create_function('wrlcdb_GetBibTag', 2, self.get_bib_tag)
+            conn.create_function('wrlcdb_GetAllBibTag', 3,
+                                 self.get_all_bib_tag)
+            conn.create_function('wrlcdb_GetMfHDsubfield', 3,
+                                 self.get_mfhd_subfield)
+            conn.create_function('wrlcdb_GetAllTags', 4, self.get_all_tags)
+            self.local.conn = conn
+        return conn
+
+    def cursor(self, profile='default'):
+        return FakeCursor(self._connect().cursor())
+
+    # wrlcdb functions
+
+    def get_bib_blob(self, bibid):
+        record = self.bibs.get(int(bibid))
+        return buffer(record.as_marc()) if record else None
+
+    def get_marc_field(self, bibid, _a, _b, tag, _indicators, code,
+                       occurrence):
+        record = self.bibs.get(int(bibid))
+        fields = record.get_fields(tag) if record else []
+        # ui.views slices LINK without checking it, so Voyager's function
+        # must hand back a string even when there is no such field
+        if len(fields) < occurrence:
+            return ''
+        field = fields[occurrence - 1]
+        prefix = '%s:%s:' % (tag, ''.join(field.indicators))
+        if code:
+            value = field[code]
+            return '' if value is None else '%s$%s%s' % (prefix, code, value)
+        return prefix + ''.join(['$%s%s' % sf for sf in _subfields(field)])
+
+    def get_bib_tag(self, bibid, tag):
+        record = self.bibs.get(int(bibid))
+        field = record[tag] if record else None
+        return field.value() if field else None
+
+    def get_all_bib_tag(self, bibid, tag, _mode):
+        record = self.bibs.get(int(bibid))
+        fields = record.get_fields(tag) if record else []
+        if not fields:
+            return None
+        # the linked field in $6 comes first, as cjk_info expects
+        return ' // '.join(['%s %s' % (field['6'], ' '.join(
+            [v for c, v in _subfields(field) if c != '6']))
+            for field in fields])
+
+    def get_mfhd_subfield(self, mfhd_id, tag, code):
+        record = self.mfhds.get(int(mfhd_id))
+        field = record[tag] if record else None
+        return field[code] if field else None
+
+    def get_all_tags(self, mfhd_id, _type, tag, _mode):
+        record = self.mfhds.get(int(mfhd_id))
+        fields = record.get_fields(tag) if record else []
+        if not fields:
+            return None
+        return ' // '.join(['%s %s %s' % (tag, ''.join(field.indicators),
+                                          ''.join(['$%s%s' % sf for sf in
+                                                   _subfields(field)]))
+                            for field in fields])
+
+    # generated data
+
+    def _populate(self):
+        rnd = self.random
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.executemany('INSERT INTO library VALUES (?, ?, ?)',
+                         [(id, code, code) for id, code in LIBRARIES])
+        locations = {}
+        for library_id, code in LIBRARIES:
+            for n, name in enumerate(['Stacks', 'Reference']):
+                location_id = library_id * 10 + n
+                locations.setdefault(code, []).append(location_id)
+                conn.execute('INSERT INTO location VALUES (?, ?, ?)',
+                             (location_id, '%s %s' % (code, name.lower()),
+                              '%s: %s' % (code, name)))
+        conn.executemany('INSERT INTO item_status_type VALUES (?, ?)',
+                         ITEM_STATUSES)
+        wrlc = [l for l in LIBRARIES if l[1] not in Z3950_CODES]
+        z3950_libraries = [l for l in LIBRARIES if l[1] in Z3950_CODES]
+        ids = {'bib': 1000, 'mfhd': 5000, 'item': 9000}
+        for cluster in range(self.clusters):
+            title = '%s and %s, volume %d' % (rnd.choice(WORDS).title(),
+                                              rnd.choice(WORDS), cluster + 1)
+            work = {
+                'title': title,
+                'author': 'Author%d, %s.' % (cluster, rnd.choice(WORDS)),
+                'isbn': '978%010d' % (cluster * 97 + 1000000),
+                'oclc': '%08d' % (10000000 + cluster),
+                'lccn': '%d%06d' % (1990 + cluster % 30, cluster)
+                if cluster % 2 else None,
+            }
+            for n in range(self.cluster_size):
+                # every work has a GW copy, like the ones item pages
+                # send PREF_LIB readers to
+                if n == 0:
+                    library_id, code = LIBRARIES[0]
+                elif rnd.random() < self.z3950_share:
+                    library_id, code = rnd.choice(z3950_libraries)
+                else:
+                    library_id, code = rnd.choice(wrlc)
+                ids['bib'] += 1
+                self._add_bib(conn, ids, library_id, code, work,
+                              locations[code])
+        conn.commit()
+
+    def _add_bib(self, conn, ids, library_id, code, work, locations):
+        rnd = self.random
+        bib_id = ids['bib']
+        self.bibids.setdefault(code, []).append(str(bib_id))
+        record = pymarc.Record()
+        record.add_field(pymarc.Field(
+            tag='008', data='990101s1999    dcu           000 0 eng d'))
+        record.add_field(pymarc.Field(
+            tag='020', indicators=[' ', ' '],
+            subfields=['a', work['isbn'] + ' (pbk.)']))
+        record.add_field(pymarc.Field(
+            tag='035', indicators=[' ', ' '],
+            subfields=['a', '(OCoLC)' + work['oclc']]))
+        if work['lccn']:
+            record.add_field(pymarc.Field(
+                tag='010', indicators=[' ', ' '],
+                subfields=['a', '  %s ' % work['lccn']]))
+        record.add_field(pymarc.Field(
+            tag='100', indicators=['1', ' '],
+            subfields=['a', work['author']]))
+        record.add_field(pymarc.Field(
+            tag='245', indicators=['1', '0'],
+            subfields=['a', work['title'] + ' /', 'c', work['author']]))
+        record.add_field(pymarc.Field(
+            tag='260', indicators=[' ', ' '],
+            subfields=['a', 'Washington :', 'b', 'Fake Press,',
+                       'c', '1999.']))
+        if rnd.random() < 0.5:
+            record.add_field(pymarc.Field(
+                tag='700', indicators=['1', ' '],
+                subfields=['a', 'Editor%d, %s,' % (bib_id % 50,
+                                                   rnd.choice(WORDS)),
+                           'e', 'editor.']))
+        record.add_field(pymarc.Field(
+            tag='650', indicators=[' ', '0'],
+            subfields=['a', rnd.choice(WORDS).title()]))
+        if rnd.random() < 0.1:
+            record.add_field(pymarc.Field(
+                tag='856', indicators=['4', '0'],
+                subfields=['u', 'http://example.com/%s' % bib_id,
+                           'z', 'Connect to resource']))
+        self.bibs[bib_id] = record
+        conn.execute('INSERT INTO bib_master VALUES (?, ?, ?, ?, ?)',
+                     (bib_id, library_id, 'N', '2014-01-01 00:00:00', None))
+        conn.execute('INSERT INTO bib_text VALUES '
+                     '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     (bib_id, work['title'], work['author'], 'Fake Press',
+                      work['lccn'], None, work['isbn'] + ' (pbk.)', None,
+                      '(OCoLC)' + work['oclc'], 'Washington',
+                      'Washington : Fake Press, 1999.', 'am', 'eng',
+                      '1999'))
+        index = [('020N', work['isbn'], work['isbn'] + ' (pbk.)'),
+                 ('020A', work['isbn'], work['isbn'] + ' (pbk.)'),
+                 ('035A', 'OCOLC' + work['oclc'], '(OCoLC)' + work['oclc'])]
+        if work['lccn']:
+            index.append(('010A', work['lccn'], work['lccn']))
+        if code == 'GM':
+            # George Mason's own record number
+            catalog_id = str(bib_id + 700000)
+            index.append(('035A', catalog_id, catalog_id))
+            self.catalog_ids.append('m' + catalog_id)
+            self.z3950_records['GM'][catalog_id] = \
+                self._zoom_record(record, code)
+        elif code == 'GT':
+            # Georgetown's record number, with its check digit
+            catalog_id = 'b%07d' % (bib_id + 700000)
+            check = catalog_id + str(bib_id % 10)
+            index.append(('907A', check.upper(), '.' + check))
+            self.catalog_ids.append(check)
+            self.z3950_records['GT'][catalog_id] = \
+                self._zoom_record(record, code)
+        conn.executemany('INSERT INTO bib_index VALUES (?, ?, ?, ?)',
+                         [(bib_id,) + row for row in index])
+        for n in range(rnd.randint(1, 2)):
+            ids['mfhd'] += 1
+            self._add_mfhd(conn, ids, bib_id, rnd.choice(locations),
+                           code not in Z3950_CODES)
+
+    def _add_mfhd(self, conn, ids, bib_id, location_id, with_items):
+        rnd = self.random
+        mfhd_id = ids['mfhd']
+        call_no = 'PS%d .F%d 1999' % (rnd.randint(1, 9999), bib_id % 100)
+        record = pymarc.Record()
+        record.add_field(pymarc.Field(
+            tag='852', indicators=['0', '1'],
+            subfields=['b', 'stacks', 'h', call_no]))
+        if rnd.random() < 0.2:
+            record.add_field(pymarc.Field(
+                tag='866', indicators=['4', '1'],
+                subfields=['8', '0', 'a', 'v.1-%d' % rnd.randint(2, 40)]))
+        self.mfhds[mfhd_id] = record
+        conn.execute('INSERT INTO mfhd_master VALUES (?, ?, ?, ?)',
+                     (mfhd_id, location_id, call_no, 'N'))
+        conn.execute('INSERT INTO bib_mfhd VALUES (?, ?)', (bib_id, mfhd_id))
+        if not with_items:
+            return
+        for n in range(rnd.randint(1, 3)):
+            ids['item'] += 1
+            item_id = ids['item']
+            status = rnd.choice(ITEM_STATUSES)[0] if rnd.random() < 0.3 \
+                else 1
+            conn.execute('INSERT INTO mfhd_item VALUES (?, ?, ?, ?)',
+                         (mfhd_id, item_id, 'v.%d' % (n + 1) if n else None,
+                          None))
+            conn.execute('INSERT INTO item VALUES (?, ?, ?)',
+                         (item_id, location_id, None))
+            conn.execute('INSERT INTO item_status VALUES (?, ?, ?)',
+                         (item_id, status, '2014-0%d-01 00:00:00' %
+                          rnd.randint(1, 9)))
+            if status == 2:
+                due = '2026-%02d-15 00:00:00' % rnd.randint(1, 12)
+                conn.execute('INSERT INTO circ_transactions VALUES (?, ?, ?)',
+                             (item_id, due, due))
+                if rnd.random() < 0.3:
+                    conn.execute('INSERT INTO hold_recall_items VALUES (?)',
+                                 (item_id,))
+
+    def _zoom_record(self, record, code):
+        rnd = self.random
+        holdings = []
+        for n in range(rnd.randint(1, 2)):
+            if code == 'GM':
+                available = rnd.random() < 0.7
+                circulation = _Bag(availableNow=available)
+                if not available:
+                    circulation.availablityDate = '2026-05-15 00:00:00'
+                holding = _Bag(callNumber='PS%d .G%d\x00' % (n, n),
+                               localLocation='Fenwick Stacks\x00',
+                               circulationData=[circulation])
+            else:
+                holding = _Bag(callNumber='PS%d .T%d\x00' % (n, n),
+                               localLocation='Lauinger Stacks\x00',
+                               publicNote=rnd.choice(['AVAILABLE',
+                                                      'DUE 09-15-26']))
+            holdings.append(('marcHoldingsRecord', holding))
+        return _Bag(data=_Bag(
+            bibliographicRecord=_Bag(encoding=('octet-aligned',
+                                               record.as_marc())),
+            holdingsData=holdings))
+
+    # wiring
+
+    def install(self, z3950_latency=0.05, http_latency=0.05):
+        """
+        Send Voyager queries, Z39.50 searches for the catalogs in
+        Z3950_SERVERS and ui.apis' HTTP requests to the fakes. Settings
+        still need Z3950_SERVERS from this module for the z39.50 fakes to
+        be used.
+        """
+        connection.override(self.cursor)
+        pools = {}
+        for code, server in Z3950_SERVERS.items():
+            key = (server['IP'], str(server['PORT']), server['DB'],
+                   server['SYNTAX'])
+            pools[key] = FakeZ3950Pool(self.z3950_records[code],
+                                       z3950_latency, *key)
+        adapter = FakeHTTPAdapter(http_latency)
+        with z3950._pools_lock:
+            self.saved = (dict(z3950._pools), dict(apis.session.adapters))
+            z3950._pools.update(pools)
+        apis.session.mount('http://', adapter)
+        apis.session.mount('https://', adapter)
+
+    def uninstall(self):
+        connection.override(None)
+        if self.saved is None:
+            return
+        pools, adapters = self.saved
+        with z3950._pools_lock:
+            z3950._pools.clear()
+            z3950._pools.update(pools)
+        for prefix, adapter in adapters.items():
+            apis.session.mount(prefix, adapter)
+        self.saved = None
+
+    def close(self):
+        self.uninstall()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class _Bag(object):
+    """
+    Attributes only, like the records PyZ3950 hands back.
+    """
+
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+class FakeZoomConnection(object):
+
+    def __init__(self, records, latency):
+        self.records = records
+        self.latency = latency
+
+    def search(self, query):
+        time.sleep(self.latency)
+        text = getattr(query, 'query', None)
+        if not isinstance(text, basestring):
+            text = str(query)
+        id = text.split()[-1].lower().lstrip('.')
+        # Georgetown ids may come with or without their check digit
+        record = self.records.get(id) or self.records.get(id[:8])
+        return [record] if record else []
+
+    def close(self):
+        pass
+
+
+class FakeZ3950Pool(z3950.ConnectionPool):
+    """
+    A ConnectionPool whose connections answer from generated records after
+    `latency` seconds.
+    """
+
+    def __init__(self, records, latency, *args, **kwargs):
+        z3950.ConnectionPool.__init__(self, *args, **kwargs)
+        self.records = records
+        self.latency = latency
+
+    def _connect(self):
+        return FakeZoomConnection(self.records, self.latency)
+
+
+class FakeHTTPAdapter(requests.adapters.BaseAdapter):
+    """
+    Answers every request after `latency` seconds with the canned body in
+    HTTP_RESPONSES for its host, or a 404.
+    """
+
+    def __init__(self, latency=0.05):
+        super(FakeHTTPAdapter, self).__init__()
+        self.latency = latency
+
+    def send(self, request, **kwargs):
+        time.sleep(self.latency)
+        host = urlparse(request.url).netloc
+        body = None
+        for suffix, content in HTTP_RESPONSES:
+            if host.endswith(suffix):
+                body = content
+        response = requests.models.Response()
+        response.status_code = 404 if body is None else 200
+        response._content = body or ''
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
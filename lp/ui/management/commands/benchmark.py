@@ -0,0 +1,177 @@
+"""
+Times catalog lookups and pages against ui.fakevoyager's generated
+catalog, with fake Z39.50 catalogs and web services answering after a set
+latency, so slowdowns show up before a deploy instead of after it. Reports
+latency percentiles and the database queries, Z39.50 searches and HTTP
+requests each call made.
+"""
+
+import copy
+import json
+import math
+import random
+from optparse import make_option
+
+from django.core.cache import get_cache
+from django.core.management.base import BaseCommand
+from django.test.client import Client
+from django.test.utils import override_settings, setup_test_environment, \
+    teardown_test_environment
+
+from ui import cache, fakevoyager, profiling, voyager
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    index = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[max(index, 0)]
+
+
+def _parse_server_timing(header):
+    """
+    Turn a Server-Timing header from ProfilingMiddleware back into the
+    Profile.summary() it came from.
+    """
+    summary = {}
+    for metric in header.split(', '):
+        parts = metric.split(';')
+        timing = {}
+        for part in parts[1:]:
+            key, value = part.split('=', 1)
+            if key == 'dur':
+                timing['ms'] = float(value)
+            elif key == 'desc':
+                timing['count'] = int(value.strip('"').split()[0])
+        summary[parts[0]] = timing
+    return summary
+
+
+class Command(BaseCommand):
+    help = 'time item lookups and pages against a generated catalog'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--clusters', type='int', default=200,
+                    help='number of works in the generated catalog'),
+        make_option('--cluster-size', dest='cluster_size', type='int',
+                    default=4, help='bib records per work'),
+        make_option('--iterations', type='int', default=50,
+                    help='calls to time for each target'),
+        make_option('--z3950-latency', dest='z3950_latency', type='float',
+                    default=0.05, help='seconds per fake z39.50 search'),
+        make_option('--http-latency', dest='http_latency', type='float',
+                    default=0.05, help='seconds per fake http request'),
+        make_option('--warm', action='store_true', default=False,
+                    help='keep cached results between calls'),
+        make_option('--seed', type='int', default=0),
+        make_option('--json', action='store_true', default=False,
+                    help='print the report as json'),
+    )
+
+    def handle(self, *args, **options):
+        fake = fakevoyager.FakeVoyager(clusters=options['clusters'],
+                                       cluster_size=options['cluster_size'],
+                                       seed=options['seed'])
+        bibids = sorted([b for ids in fake.bibids.values() for b in ids])
+        random.Random(options['seed']).shuffle(bibids)
+        saved_cache = cache.shared_cache
+        cache.shared_cache = get_cache(
+            'django.core.cache.backends.locmem.LocMemCache',
+            LOCATION='benchmark')
+        profiling.logger.disabled = True
+        setup_test_environment()
+        fake.install(options['z3950_latency'], options['http_latency'])
+        try:
+            with override_settings(
+                    Z3950_SERVERS=fakevoyager.Z3950_SERVERS,
+                    PROFILE_SAMPLE_RATE=1):
+                report = self.run(fake, bibids, options)
+        finally:
+            fake.close()
+            teardown_test_environment()
+            profiling.logger.disabled = False
+            cache.shared_cache = saved_cache
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+            return
+        self.stdout.write('%-14s %8s %8s %8s %8s %8s %8s %8s' % (
+            'target', 'p50 ms', 'p90 ms', 'p99 ms', 'db', 'z3950', 'http',
+            'errors'))
+        for target in report:
+            self.stdout.write(
+                '%-14s %8.1f %8.1f %8.1f %8.1f %8.1f %8.1f %8d' % (
+                    target['name'], target['p50'], target['p90'],
+                    target['p99'], target['db'], target['z3950'],
+                    target['http'], target['errors']))
+
+    def run(self, fake, bibids, options):
+        client = Client()
+        bib_data = {}
+        catalog_ids = fake.catalog_ids or bibids
+
+        def get_bib_data(i):
+            voyager.get_bib_data(bibids[i % len(bibids)])
+
+        def get_holdings(i):
+            bibid = bibids[i % len(bibids)]
+            if bibid not in bib_data:
+                bib_data[bibid] = voyager.get_bib_data(bibid)
+            # get_holdings fills in the bib it is given
+            bib = copy.deepcopy(bib_data[bibid])
+            profile = profiling.Profile()
+            profiling.activate(profile)
+            voyager.get_holdings(bib)
+            return profile.summary()
+
+        def item(i):
+            # a distinct url each time so cache_page never answers
+            return client.get('/item/%s?benchmark=%s' % (
+                bibids[i % len(bibids)], i))
+
+        def item_json(i):
+            return client.get('/item/%s.json?benchmark=%s' % (
+                bibids[i % len(bibids)], i))
+
+        def availability(i):
+            ids = [bibids[(i * 8 + n) % len(bibids)] for n in range(8)] + \
+                [catalog_ids[(i * 2 + n) % len(catalog_ids)]
+                 for n in range(2)]
+            return client.get('/availability?bibids=%s&benchmark=%s' % (
+                ','.join(ids), i))
+
+        report = []
+        for name, func in [('get_bib_data', get_bib_data),
+                           ('get_holdings', get_holdings),
+                           ('item', item), ('item_json', item_json),
+                           ('availability', availability)]:
+            summaries = []
+            errors = 0
+            for i in range(options['iterations']):
+                if not options['warm']:
+                    cache.shared_cache.clear()
+                    cache.clear_local()
+                profile = profiling.Profile()
+                profiling.activate(profile)
+                try:
+                    result = func(i)
+                finally:
+                    profiling.activate(None)
+                if isinstance(result, dict):
+                    summary = result
+                elif result is not None:
+                    if result.status_code != 200:
+                        errors += 1
+                    summary = _parse_server_timing(result['Server-Timing'])
+                else:
+                    summary = profile.summary()
+                summaries.append(summary)
+            elapsed = [s['total']['ms'] for s in summaries]
+            target = {'name': name, 'calls': len(summaries),
+                      'errors': errors}
+            for pct in (50, 90, 99):
+                target['p%s' % pct] = _percentile(elapsed, pct)
+            for category in ('db', 'z3950', 'http'):
+                target[category] = sum(
+                    [s.get(category, {}).get('count', 0)
+                     for s in summaries]) / float(len(summaries))
+            report.append(target)
+        return report
@@ -0,0 +1,44 @@
+"""
+Times the facet post-processing in ui.views.search on a generated Summon
+response with every facet field filled out.
+"""
+
+import copy
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.test.client import RequestFactory
+
+from ui import fakevoyager, summon, views
+
+
+class Command(BaseCommand):
+    help = 'time facet post-processing on a generated search'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--iterations', type='int', default=50),
+        make_option('--values', type='int', default=120,
+                    help='values per generated facet'),
+        make_option('--seed', type='int', default=0),
+    )
+
+    def handle(self, *args, **options):
+        api = summon.Summon('', '')
+        api._summon = fakevoyager.FakeSummoner(
+            fakevoyager.summon_facets(options['values'], options['seed']))
+        results = api.search('history', pn=1, ps=20, for_template=True)
+        request = RequestFactory().get(
+            '/search', {'q': 'history', 'facet': 'Language:French'})
+        values = sum([len(f['counts']) for f in results['facets']])
+        self.stdout.write('%s facets, %s values' % (
+            len(results['facets']), values))
+        elapsed = []
+        for i in range(options['iterations']):
+            data = copy.deepcopy(results)
+            start = time.time()
+            views._process_facets(request, data)
+            elapsed.append((time.time() - start) * 1000)
+        elapsed.sort()
+        self.stdout.write('%8.1f ms (median) %8.1f ms (min)' % (
+            elapsed[len(elapsed) // 2], elapsed[0]))
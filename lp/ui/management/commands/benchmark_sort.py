@@ -0,0 +1,53 @@
+"""
+Times ui.sort.holdingsort against the chain of single sorts it replaced,
+on generated serial holdings with long runs of items.
+"""
+
+import copy
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from ui import fakevoyager
+from ui.sort import availsort, callnumsort, elecsort, enumsort, \
+    holdingsort, holdsort, libsort, splitsort, templocsort
+
+
+def chain_sort(holdings):
+    ours, theirs, shared = splitsort(callnumsort(enumsort(holdings)))
+    return elecsort(holdsort(templocsort(availsort(ours)))) \
+        + elecsort(holdsort(templocsort(availsort(shared)))) \
+        + libsort(elecsort(holdsort(templocsort(availsort(theirs))),
+                           rev=True))
+
+
+class Command(BaseCommand):
+    help = 'time holdings sorting on large serial runs'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--holdings', type='int', default=12,
+                    help='holdings per bib'),
+        make_option('--items', type='int', default=5000,
+                    help='most items per holding'),
+        make_option('--iterations', type='int', default=20),
+        make_option('--seed', type='int', default=0),
+    )
+
+    def handle(self, *args, **options):
+        holdings = fakevoyager.serial_holdings(options['holdings'],
+                                               options['items'],
+                                               options['seed'])
+        items = sum([len(h['ITEMS']) for h in holdings])
+        self.stdout.write('%s holdings, %s items' % (len(holdings), items))
+        for name, func in [('chain', chain_sort),
+                           ('holdingsort', holdingsort)]:
+            elapsed = []
+            for i in range(options['iterations']):
+                data = copy.deepcopy(holdings)
+                start = time.time()
+                func(data)
+                elapsed.append((time.time() - start) * 1000)
+            elapsed.sort()
+            self.stdout.write('%-12s %8.1f ms (median) %8.1f ms (min)' % (
+                name, elapsed[len(elapsed) // 2], elapsed[0]))
@@ -0,0 +1,43 @@
+"""
+Builds or updates the related-bib cluster index named by CLUSTER_INDEX.
+"""
+
+import os
+from datetime import datetime
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ui import clusters
+
+
+class Command(BaseCommand):
+    help = 'build or update the local index of related bib headings'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--full', action='store_true', default=False,
+                    help='rebuild the whole index from voyager'),
+        make_option('--since', default=None,
+                    help='update bibs changed since YYYY-MM-DD HH:MM:SS '
+                         'rather than since the last run'),
+    )
+
+    def handle(self, *args, **options):
+        path = getattr(settings, 'CLUSTER_INDEX', '')
+        if not path:
+            raise CommandError('CLUSTER_INDEX is not set')
+        if options['full'] or not os.path.exists(path):
+            count = clusters.build(path)
+            self.stdout.write('indexed %s bibs' % count)
+            return
+        since = None
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'],
+                                          clusters.DATE_FORMAT)
+            except ValueError:
+                raise CommandError('--since must look like %s' %
+                                   clusters.DATE_FORMAT)
+        count = clusters.update(path, since)
+        self.stdout.write('updated %s bibs' % count)
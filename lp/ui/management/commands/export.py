@@ -0,0 +1,169 @@
+"""
+Exports every unsuppressed bib to a file, as newline-delimited JSON or
+binary MARC.
+
+Bib ids are streamed from Voyager in chunks, the MARC records for a chunk
+are fetched together, and the records are converted by a pool of worker
+processes. Chunks are written in bib_id order, and after each one the last
+bib_id written and the size of the file are saved to a checkpoint file, so
+an interrupted export can be picked up again with --resume.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from optparse import make_option
+
+import pymarc
+from django.core.management.base import BaseCommand, CommandError
+
+from ui import db, marc, voyager
+from ui.pool import connection
+
+
+CHUNK_SIZE = 1000
+
+FORMATS = ('json', 'jsonld', 'marc')
+
+
+def _convert(output_format, rows):
+    """
+    Returns the output for a chunk of (bibid, raw marc) rows, and the
+    number of records in it.
+    """
+    lines = []
+    for bibid, raw in rows:
+        if output_format == 'marc':
+            lines.append(raw)
+            continue
+        try:
+            record = pymarc.record.Record(data=raw)
+            if output_format == 'json':
+                data = marc.extract(record, {'BIB_ID': bibid})
+            else:
+                data = db.item_from_marc(str(bibid), record)
+            lines.append(json.dumps(data) + '\n')
+        except Exception as e:
+            logging.warn("unable to export %s: %s", bibid, e)
+    return ''.join(lines), len(lines)
+
+
+def _chunks(cursor, chunk_size):
+    """
+    Yields lists of (bibid, raw marc) for the bib ids of cursor.
+    """
+    while True:
+        bibids = [row[0] for row in cursor.fetchmany(chunk_size)]
+        if not bibids:
+            break
+        blobs = voyager.get_marc_blobs(bibids)
+        yield [(bibid, blobs[bibid]) for bibid in bibids if bibid in blobs]
+
+
+def _read_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    return json.load(open(path))
+
+
+def _write_checkpoint(path, data):
+    tmp = path + '.tmp'
+    fp = open(tmp, 'wb')
+    json.dump(data, fp)
+    fp.close()
+    os.rename(tmp, path)
+
+
+class Command(BaseCommand):
+    args = '<path>'
+    help = 'export all bibs as newline-delimited JSON or binary MARC'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--format', default='json',
+                    help='output format: %s' % ', '.join(FORMATS)),
+        make_option('--chunk-size', dest='chunk_size', type='int',
+                    default=CHUNK_SIZE, help='bibs to fetch at once'),
+        make_option('--processes', type='int',
+                    default=multiprocessing.cpu_count(),
+                    help='chunks to convert at once'),
+        make_option('--resume', action='store_true', default=False,
+                    help='carry on from the last checkpoint'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('usage: export %s' % self.args)
+        path = args[0]
+        output_format = options['format']
+        if output_format not in FORMATS:
+            raise CommandError('unknown format: %s' % output_format)
+        checkpoint_file = path + '.checkpoint'
+        checkpoint = {'format': output_format, 'last_bibid': 0, 'offset': 0,
+                      'count': 0}
+        if options['resume']:
+            saved = _read_checkpoint(checkpoint_file)
+            if saved is None:
+                raise CommandError('no checkpoint at %s' % checkpoint_file)
+            if saved['format'] != output_format:
+                raise CommandError('checkpoint is for %s' % saved['format'])
+            checkpoint = saved
+            # drop anything written after the checkpoint was saved
+            fp = open(path, 'r+b')
+            fp.truncate(checkpoint['offset'])
+            fp.seek(checkpoint['offset'])
+        else:
+            fp = open(path, 'wb')
+        # start the workers before opening a database session to fork
+        pool = None
+        if options['processes'] > 1:
+            pool = multiprocessing.Pool(options['processes'])
+        cursor = connection.cursor('bulk')
+        cursor.execute("""
+SELECT bib_id
+FROM bib_master
+WHERE suppress_in_opac = 'N'
+AND bib_id > %s
+ORDER BY bib_id""", [checkpoint['last_bibid']])
+        start, count = time.time(), 0
+        pending = deque()
+
+        def write(last_bibid, result):
+            data, n = result
+            fp.write(data)
+            fp.flush()
+            checkpoint.update({'last_bibid': last_bibid,
+                               'offset': fp.tell(),
+                               'count': checkpoint['count'] + n})
+            _write_checkpoint(checkpoint_file, checkpoint)
+            elapsed = time.time() - start
+            self.stdout.write('%s records (%.1f records/sec)' % (
+                checkpoint['count'], (count + n) / elapsed if elapsed else 0))
+            return n
+
+        for rows in _chunks(cursor, options['chunk_size']):
+            if not rows:
+                continue
+            if pool is None:
+                count += write(rows[-1][0], _convert(output_format, rows))
+                continue
+            result = pool.apply_async(_convert, (output_format, rows))
+            pending.append((rows[-1][0], result))
+            # keep a few chunks in flight without holding the whole export
+            # in memory
+            while len(pending) > options['processes'] * 2:
+                last_bibid, result = pending.popleft()
+                count += write(last_bibid, result.get())
+        while pending:
+            last_bibid, result = pending.popleft()
+            count += write(last_bibid, result.get())
+        if pool is not None:
+            pool.close()
+            pool.join()
+        fp.close()
+        elapsed = time.time() - start
+        self.stdout.write(
+            'Exported %s records in %.1fs (%.1f records/sec)' % (
+                count, elapsed, count / elapsed if elapsed else 0))
@@ -7,11 +7,12 @@ the testdata directory.
 import os
 import logging
 
+import pymarc
 from django.db import connection
 from django.core.management.base import BaseCommand
 
 from ui import marc
-from ui.voyager import get_marc_blob
+from ui.voyager import get_marc_blobs
 
 
 # where to write the records
@@ -100,12 +101,14 @@ def records():
             """
     cursor.execute(query)
     while True:
-        try:
-            row = cursor.fetchone()
-            if not row:
-                break
-            bib_id = row[0]
-            record = get_marc_blob(bib_id)
-            yield bib_id, record
-        except Exception as e:
-            logging.warn("exception when getting marc for %s: %s", bib_id, e)
+        bib_ids = [row[0] for row in cursor.fetchmany(1000)]
+        if not bib_ids:
+            break
+        blobs = get_marc_blobs(bib_ids)
+        for bib_id in bib_ids:
+            try:
+                record = pymarc.record.Record(data=blobs[bib_id])
+                yield bib_id, record
+            except Exception as e:
+                logging.warn("exception when getting marc for %s: %s",
+                             bib_id, e)
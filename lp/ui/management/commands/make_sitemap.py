@@ -1,67 +1,183 @@
+"""
+Writes sitemap files for every unsuppressed bib, plus an index of them.
+
+Bibs are split into shards by bib_id range, SHARD_SIZE ids to a file, so a
+bib always lands in the same file. Each run streams the bib ids and their
+update dates from Voyager in one query, and only rewrites the shards whose
+bibs changed since the last run unless --full is given. Shards are
+compressed in parallel into temp files that replace the old ones, so the
+sitemap stays whole while it is regenerated.
+"""
+
 import gzip
+import hashlib
+import json
+import multiprocessing
 import os
+from collections import deque
+from optparse import make_option
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.db import connection
+
+from ui.pool import connection
+
+
+# the sitemap protocol allows up to 50,000 urls in a file
+SHARD_SIZE = 50000
+
+MANIFEST = 'sitemap-manifest.json'
+
+
+def _shard_name(shard):
+    return 'sitemap-%s.xml.gz' % shard
+
+
+def _replace(path, write):
+    """Call write(tmp_path), then move the result over path."""
+    tmp = path + '.tmp'
+    write(tmp)
+    os.rename(tmp, path)
 
 
-def _newfile(counter):
-    """Generate a new sitemap filename based on count."""
-    name = '%s/sitemap-%s.xml.gz' % (settings.SITEMAPS_DIR,
-        counter)
-    fp = gzip.open(name, 'wb')
-    fp.write("""<?xml version="1.0" encoding="UTF-8"?>
+def _write_shard(path, base_url, rows):
+    def write(tmp):
+        fp = gzip.open(tmp, 'wb')
+        fp.write("""<?xml version="1.0" encoding="UTF-8"?>
 <urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n""")
-    return fp
+        for bibid, lastmod in rows:
+            if lastmod:
+                fp.write('<url><loc>%s/item/%s</loc><lastmod>%s</lastmod>'
+                         '</url>\n' % (base_url, bibid, lastmod))
+            else:
+                fp.write('<url><loc>%s/item/%s</loc></url>\n' %
+                         (base_url, bibid))
+        fp.write('</urlset>\n')
+        fp.close()
+    _replace(path, write)
+
+
+def _write_index(path, base_url, shards):
+    def write(tmp):
+        fp = open(tmp, 'wb')
+        fp.write("""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n""")
+        for shard, info in sorted(shards.items()):
+            fp.write('<sitemap><loc>%s/%s</loc>' % (
+                base_url, _shard_name(shard)))
+            if info['lastmod']:
+                fp.write('<lastmod>%s</lastmod>' % info['lastmod'])
+            fp.write('</sitemap>\n')
+        fp.write("""</sitemapindex>\n""")
+        fp.close()
+    _replace(path, write)
+
 
+def _write_json(path, data):
+    fp = open(path, 'wb')
+    json.dump(data, fp, indent=1, sort_keys=True)
+    fp.close()
 
-def _newurl(counter):
-    """Generate the <loc> URL for a sitemap file based on count."""
-    return "%s/sitemap-%s.xml.gz" % (settings.SITEMAPS_BASE_URL, counter)
+
+def _lastmod(value):
+    if value is None:
+        return None
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    return str(value)[:10]
+
+
+def _shards(cursor, shard_size):
+    """
+    Yields (shard, rows) for the (bib_id, lastmod) rows of cursor, which
+    must come ordered by bib_id.
+    """
+    shard, rows = None, []
+    while True:
+        batch = cursor.fetchmany(1000)
+        if not batch:
+            break
+        for bibid, changed in batch:
+            if bibid // shard_size != shard:
+                if rows:
+                    yield shard, rows
+                shard, rows = bibid // shard_size, []
+            rows.append((bibid, _lastmod(changed)))
+    if rows:
+        yield shard, rows
 
 
 class Command(BaseCommand):
     help = 'Generate sitemap files'
 
+    option_list = BaseCommand.option_list + (
+        make_option('--full', action='store_true', default=False,
+                    help='rewrite every shard, not just changed ones'),
+        make_option('--processes', type='int',
+                    default=multiprocessing.cpu_count(),
+                    help='shards to compress at once'),
+        make_option('--shard-size', dest='shard_size', type='int',
+                    default=SHARD_SIZE, help='bib ids per sitemap file'),
+    )
+
     def handle(self, *args, **options):
-        # first, clear out the existing files
-        print 'Removing old files'
-        for old_file in os.listdir(settings.SITEMAPS_DIR):
-            os.remove('%s/%s' % (settings.SITEMAPS_DIR, old_file))
-        print 'Generating maps'
-        cursor = connection.cursor()
-        query = """SELECT BIB_ID FROM bib_master
-            WHERE SUPPRESS_IN_OPAC = 'N'
-            """
-        cursor.execute(query)
-        index_file = '%s/sitemap-index.xml' % settings.SITEMAPS_DIR
-        fp_index = open(index_file, 'wb')
-        fp_index.write("""<?xml version="1.0" encoding="UTF-8"?>
-<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n""")
-        i = j = 0
-        fp = _newfile(j)
-        line = "<sitemap><loc>%s</loc></sitemap>\n" % _newurl(j)
-        fp_index.write(line)
-        row = cursor.fetchone()
-        while row:
-            line = '<url><loc>%s/item/%s</loc></url>\n' % \
-                (settings.SITEMAPS_BASE_URL, row[0])
-            fp.write(line)
-            if i == 49990:
-                i = 0
-                j += 1
-                fp.write('</urlset>')
-                fp.close()
-                fp = _newfile(j)
-                line = "<sitemap><loc>%s</loc></sitemap>\n" % _newurl(j)
-                fp_index.write(line)
-                print '%s - %s' % (j, row[0])
+        sitemaps_dir = settings.SITEMAPS_DIR
+        base_url = settings.SITEMAPS_BASE_URL
+        shard_size = options['shard_size']
+        manifest_file = os.path.join(sitemaps_dir, MANIFEST)
+        old = {'shard_size': shard_size, 'shards': {}}
+        if os.path.exists(manifest_file) and not options['full']:
+            old = json.load(open(manifest_file))
+        if old['shard_size'] != shard_size:
+            old = {'shard_size': shard_size, 'shards': {}}
+        old_shards = dict([(int(k), v) for k, v in old['shards'].items()])
+        # start the workers before opening a database session to fork
+        pool = None
+        if options['processes'] > 1:
+            pool = multiprocessing.Pool(options['processes'])
+        self.stdout.write('Generating maps')
+        cursor = connection.cursor('bulk')
+        cursor.execute("""
+SELECT bib_id, NVL(update_date, create_date)
+FROM bib_master
+WHERE suppress_in_opac = 'N'
+ORDER BY bib_id""")
+        shards, written, pending = {}, [], deque()
+        for shard, rows in _shards(cursor, shard_size):
+            digest = hashlib.sha1(repr(rows)).hexdigest()
+            shards[shard] = {'digest': digest,
+                             'lastmod': max([r[1] for r in rows]),
+                             'count': len(rows)}
+            path = os.path.join(sitemaps_dir, _shard_name(shard))
+            if old_shards.get(shard, {}).get('digest') == digest \
+                    and os.path.exists(path):
+                continue
+            self.stdout.write('%s - %s' % (shard, rows[0][0]))
+            written.append(shard)
+            if pool is None:
+                _write_shard(path, base_url, rows)
             else:
-                i += 1
-            row = cursor.fetchone()
-        if fp:
-            fp.write('</urlset>\n')
-            fp.close()
-        fp_index.write("""</sitemapindex>\n""")
-        fp_index.close()
+                pending.append(pool.apply_async(_write_shard,
+                                                (path, base_url, rows)))
+                # keep a few shards in flight without holding every
+                # changed shard's rows in memory
+                while len(pending) > options['processes'] * 2:
+                    # re-raises any error from the worker
+                    pending.popleft().get()
+        while pending:
+            pending.popleft().get()
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _write_index(os.path.join(sitemaps_dir, 'sitemap-index.xml'),
+                     base_url, shards)
+        # drop files for ranges that no longer have any bibs
+        names = set([_shard_name(shard) for shard in shards])
+        for name in os.listdir(sitemaps_dir):
+            if name.startswith('sitemap-') and name.endswith('.xml.gz') \
+                    and name not in names:
+                os.remove(os.path.join(sitemaps_dir, name))
+        _replace(manifest_file, lambda tmp: _write_json(
+            tmp, {'shard_size': shard_size, 'shards': shards}))
+        self.stdout.write('Wrote %s of %s files' % (len(written),
+                                                    len(shards)))
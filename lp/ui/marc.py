@@ -81,52 +81,82 @@ mapping = (
 )
 
 
-def extract(record, d={}):
+def _formatted(field, values):
+    values.append(field.format_field())
+
+
+def _subject(field, values):
+    values.append(subject(field))
+
+
+def _subfield_rule(ind1, ind2, subfields):
+    # TODO: we purposefully ignore $6 for now since it is used for linking
+    # alternate script representations. Ideally some day we could have a
+    # way to layer them into our data representation, or simply using the
+    # original character set as the default since our web browsers can
+    # easily display them now.
+    codes = frozenset(subfields) - frozenset(['6', ','])
+
+    def rule(field, values):
+        if ind(ind1, field.indicator1) and ind(ind2, field.indicator2):
+            parts = [value for code, value in field if code in codes]
+            if len(parts) > 0:
+                values.append(' '.join(parts))
+    return rule
+
+
+def _function_rule(func):
+    def rule(field, values):
+        values.extend(func(field))
+    return rule
+
+
+def compile_mapping(mapping):
     """
-    Takes a pymarc.Record object and returns extracted information as a
-    dictionary. If you pass in a dictionary the extracted information will
-    be folded into it.
+    Turns a mapping into a plan for extract(): a dictionary from tag to the
+    (name, position, rule) entries that a field with that tag feeds, where
+    position is the spec's place among its name's specs.
     """
+    plan = {}
     for name, display_name, specs in mapping:
-        d[name] = []
-        for spec in specs:
+        for position, spec in enumerate(specs):
             # simple field specification
             if type(spec) == str:
-                for field in record.get_fields(spec):
-                    if field.is_subject_field():
-                        d[name].append(subject(field))
-                    else:
-                        d[name].append(field.format_field())
-
+                tag = spec
+                rule = _subject if tag.startswith('6') else _formatted
             # complex field specification
             elif len(spec) == 4:
                 tag, ind1, ind2, subfields = spec
-                for field in record.get_fields(tag):
-                    if ind(ind1, field.indicator1) and ind(ind2,
-                       field.indicator2):
-                        parts = []
-                        for code, value in field:
-                            # TODO: we purposefully ignore $6 for now since
-                            # it is used for linking alternate script
-                            # representations. Ideally some day we could
-                            # have a way to layer them into our data
-                            # representation, or simply using the original
-                            # character set as the default since our
-                            # web browsers can easily display them now.
-                            if code != '6' and code in subfields:
-                                parts.append(value)
-                        if len(parts) > 0:
-                            d[name].append(' '.join(parts))
-
+                rule = _subfield_rule(ind1, ind2, subfields)
             # function based specification
             elif len(spec) == 2:
                 tag, func = spec
-                for field in record.get_fields(tag):
-                    d[name].extend(func(field))
-
+                rule = _function_rule(func)
             # uhoh, the field specification looks bad
             else:
                 raise Exception("invalid mapping for %s" % name)
+            plan.setdefault(tag, []).append((name, position, rule))
+    return plan
+
+
+plan = compile_mapping(mapping)
+
+
+def extract(record, d={}):
+    """
+    Takes a pymarc.Record object and returns extracted information as a
+    dictionary. If you pass in a dictionary the extracted information will
+    be folded into it.
+    """
+    # one list per spec, so values come out in mapping order rather than
+    # record order after a single pass over the fields
+    values = dict([(name, [[] for spec in specs])
+                   for name, display_name, specs in mapping])
+    for field in record.fields:
+        for name, position, rule in plan.get(field.tag, ()):
+            rule(field, values[name][position])
+    for name, display_name, specs in mapping:
+        d[name] = [v for spec_values in values[name] for v in spec_values]
 
     # Deduplicate, then sort the subjects list
     d['SUBJECTS'] = sorted(set(d['SUBJECTS']))
@@ -200,10 +230,13 @@ def ind(expected, found):
         return False
 
 
+SUBJECT_SKIP_CODES = frozenset('012345678')
+
+
 def subject(f):
     s = ''
     for code, value in f:
-        if code in map(lambda x: str(x), list(range(0, 9, 1))):
+        if code in SUBJECT_SKIP_CODES:
             continue
         elif code not in ('v', 'x', 'y', 'z'):
             s += ' %s' % value
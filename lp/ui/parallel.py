@@ -0,0 +1,118 @@
+"""
+A per-process thread pool for fanning out slow remote lookups, so a page
+waits on the slowest Z39.50 catalog or web service rather than the sum of
+all of them, and a second, smaller one for work no request waits on.
+Lookups against one server can be given a small pool of their own with
+get_named_pool, so a server that hangs only ties up its own threads.
+"""
+
+import logging
+import threading
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+
+from ui import profiling
+from ui.pool import connection
+
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_background_pool = None
+_named_pools = {}
+_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPool(getattr(settings, 'PARALLEL_WORKERS', 10))
+        return _pool
+
+
+def get_background_pool():
+    global _background_pool
+    with _lock:
+        if _background_pool is None:
+            _background_pool = ThreadPool(
+                getattr(settings, 'BACKGROUND_WORKERS', 2))
+        return _background_pool
+
+
+def get_named_pool(name, size):
+    """
+    The pool of `size` threads kept for calls to one server, made the first
+    time it is asked for.
+    """
+    with _lock:
+        if name not in _named_pools:
+            _named_pools[name] = ThreadPool(size)
+        return _named_pools[name]
+
+
+def _run(func, args, profile):
+    # time the lookup against the request that asked for it
+    profiling.activate(profile)
+    try:
+        return func(*args)
+    finally:
+        profiling.activate(None)
+        # worker threads outlive requests, so hand back any pooled session
+        # the lookup used; a plain django connection is kept for the next
+        connection.close_if_unusable()
+
+
+def fan_out(func, calls, fallback, pool_for=None):
+    """
+    Runs func(*args) for each (args, timeout) pair in calls and returns the
+    results in the same order. A call that raises, or is still running
+    `timeout` seconds after fan_out was called, gets fallback(*args) in its
+    place. Calls run on the shared pool, or on pool_for(*args) when that
+    gives one. Timed out calls are left to finish in the background and
+    hold their thread until they do, which is why calls to servers that
+    may hang belong on a pool of their own.
+    """
+    start = time.time()
+    profile = profiling.current()
+    pending = []
+    for args, timeout in calls:
+        pool = pool_for(*args) if pool_for is not None else None
+        pending.append((args, timeout, (pool or get_pool()).apply_async(
+            _run, (func, args, profile))))
+    results = []
+    for args, timeout, async_result in pending:
+        try:
+            if timeout is None:
+                results.append(async_result.get())
+            else:
+                remaining = max(start + timeout - time.time(), 0)
+                results.append(async_result.get(remaining))
+        except TimeoutError:
+            logger.warning('%s%r timed out after %ss' %
+                           (func.__name__, args, timeout))
+            results.append(fallback(*args))
+        except Exception:
+            logger.exception('%s%r failed' % (func.__name__, args))
+            results.append(fallback(*args))
+    return results
+
+
+def _run_logged(func, args):
+    try:
+        _run(func, args, None)
+    except Exception:
+        logger.exception('%s%r failed' % (func.__name__, args))
+
+
+def submit(func, *args):
+    """
+    Runs func(*args) on the background pool without waiting for it,
+    logging any exception. The background pool is kept apart from the
+    fan_out one, so background work that fans out lookups of its own
+    can't leave them without threads.
+    """
+    get_background_pool().apply_async(_run_logged, (func, args))
@@ -0,0 +1,246 @@
+"""
+Pooled connections to the Voyager database.
+
+Each wsgi thread borrows a session from a cx_Oracle SessionPool the first
+time it asks for a cursor and hands it back when the request finishes, so
+connection setup is paid once per process rather than once per thread and
+the per-session statement cache survives from one request to the next.
+
+Cursors are Django's own FormatStylePlaceholderCursor, so '%s' placeholders,
+unicode handling and errors behave exactly as they do with
+django.db.connection; code just imports `connection` from here instead.
+When VOYAGER_POOL is disabled, or the default database is not Oracle,
+`connection` hands back Django's own cursors. Either way cursors are
+timed for ui.profiling.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connection as django_connection
+from django.db.utils import DatabaseErrorWrapper
+
+from ui.profiling import TimedCursor
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'MIN': 1,
+    'MAX': 15,
+    'INCREMENT': 1,
+    'STMT_CACHE_SIZE': 50,
+    # seconds a borrowed session may sit unused before it is pinged
+    'PING_INTERVAL': 60,
+    'PROFILES': {
+        'default': {'arraysize': 100, 'prefetchrows': 100},
+        'single': {'arraysize': 1, 'prefetchrows': 2},
+        'bulk': {'arraysize': 1000, 'prefetchrows': 1000},
+    },
+}
+
+
+def pool_settings():
+    conf = dict(DEFAULTS)
+    conf.update(getattr(settings, 'VOYAGER_POOL', {}))
+    profiles = dict(DEFAULTS['PROFILES'])
+    profiles.update(conf['PROFILES'])
+    conf['PROFILES'] = profiles
+    return conf
+
+
+def _enabled():
+    engine = settings.DATABASES['default']['ENGINE']
+    return pool_settings()['ENABLED'] and engine.endswith('oracle')
+
+
+class PooledCursor(object):
+    """
+    Wraps a FormatStylePlaceholderCursor on a pooled session, turning
+    cx_Oracle exceptions into django.db.utils ones like Django's
+    CursorWrapper does.
+    """
+
+    def __init__(self, cursor, session):
+        self.cursor = cursor
+        self.session = session
+
+    def __getattr__(self, attr):
+        cursor_attr = getattr(self.cursor, attr)
+        if attr in ('fetchone', 'fetchmany', 'fetchall'):
+            return self.session.wrap_database_errors(cursor_attr)
+        return cursor_attr
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def execute(self, sql, params=None):
+        with self.session.wrap_database_errors:
+            return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        with self.session.wrap_database_errors:
+            return self.cursor.executemany(sql, param_list)
+
+
+class Session(object):
+    """
+    A session borrowed from the pool by one thread. `errors_occurred` is
+    set by DatabaseErrorWrapper; such sessions are dropped, not reused.
+    """
+
+    def __init__(self, pool, conn):
+        from django.db.backends.oracle import base
+        self.Database = base.Database
+        self.pool = pool
+        self.conn = conn
+        self.errors_occurred = False
+        self.wrap_database_errors = DatabaseErrorWrapper(self)
+        self.last_used = time.time()
+
+    def cursor(self, profile='default'):
+        from django.db.backends.oracle.base import \
+            FormatStylePlaceholderCursor
+        cursor = FormatStylePlaceholderCursor(self.conn)
+        tuning = pool_settings()['PROFILES'].get(profile, {})
+        for attr, value in tuning.items():
+            # prefetchrows only exists in cx_Oracle 8 and later
+            if hasattr(cursor.cursor, attr):
+                setattr(cursor.cursor, attr, value)
+        self.last_used = time.time()
+        return PooledCursor(cursor, self)
+
+    def is_usable(self):
+        try:
+            self.conn.ping()
+        except self.Database.Error:
+            return False
+        return True
+
+
+class PooledConnection(object):
+    """
+    Stands in for django.db.connection in the voyager and db modules.
+    cursor() takes an optional profile name from VOYAGER_POOL['PROFILES']
+    to tune arraysize/prefetchrows for the query at hand.
+    """
+
+    def __init__(self):
+        self._pool = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._override = None
+
+    def override(self, cursor_factory):
+        """
+        Hand out cursor_factory(profile) in place of Voyager cursors on
+        every thread, until called again with None. The benchmark command
+        uses this to run against ui.fakevoyager.
+        """
+        self._override = cursor_factory
+
+    def cursor(self, profile='default'):
+        if self._override is not None:
+            return TimedCursor(self._override(profile))
+        if not _enabled():
+            return TimedCursor(django_connection.cursor())
+        return TimedCursor(self._session().cursor(profile))
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = self._create_pool()
+            return self._pool
+
+    def _create_pool(self):
+        from django.db.backends.oracle import base
+        conf = pool_settings()
+        db = settings.DATABASES['default']
+        if db['PORT'].strip():
+            dsn = base.Database.makedsn(db['HOST'] or 'localhost',
+                                        int(db['PORT']), db['NAME'])
+        else:
+            dsn = db['NAME']
+        pool = base.Database.SessionPool(
+            db['USER'], db['PASSWORD'], dsn,
+            min=conf['MIN'], max=conf['MAX'], increment=conf['INCREMENT'],
+            threaded=True, getmode=base.Database.SPOOL_ATTRVAL_WAIT,
+            sessionCallback=_init_session)
+        pool.stmtcachesize = conf['STMT_CACHE_SIZE']
+        return pool
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        interval = pool_settings()['PING_INTERVAL']
+        if session is not None and interval is not None and \
+                time.time() - session.last_used > interval and \
+                not session.is_usable():
+            logger.warning('dropping unusable voyager session')
+            session.errors_occurred = True
+            self.release()
+            session = None
+        if session is None:
+            pool = self._get_pool()
+            session = Session(pool, pool.acquire())
+            self._local.session = session
+        return session
+
+    def release(self, **kwargs):
+        """
+        Hand the current thread's session back to the pool; sessions that
+        raised errors are dropped so the pool opens a fresh one.
+        """
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            return
+        self._local.session = None
+        try:
+            if session.errors_occurred:
+                session.pool.drop(session.conn)
+            else:
+                session.pool.release(session.conn)
+        except session.Database.Error:
+            logger.exception('unable to return voyager session to pool')
+
+    def close(self):
+        if self._override is not None:
+            return
+        if not _enabled():
+            return django_connection.close()
+        self.release()
+
+    def close_if_unusable(self):
+        """
+        For threads that outlive requests: hand back the pooled session, but
+        keep Django's own connection for the next task unless it has
+        stopped working.
+        """
+        if self._override is not None:
+            return
+        if _enabled():
+            return self.release()
+        if django_connection.connection is not None and \
+                django_connection.errors_occurred:
+            if django_connection.is_usable():
+                django_connection.errors_occurred = False
+            else:
+                django_connection.close()
+
+
+def _init_session(conn, requested_tag):
+    # same session state Django's oracle backend sets on connect
+    cursor = conn.cursor()
+    cursor.execute("ALTER SESSION SET NLS_TERRITORY = 'AMERICA'")
+    cursor.execute(
+        "ALTER SESSION SET NLS_DATE_FORMAT = 'YYYY-MM-DD HH24:MI:SS'"
+        " NLS_TIMESTAMP_FORMAT = 'YYYY-MM-DD HH24:MI:SS.FF'"
+        + (" TIME_ZONE = 'UTC'" if settings.USE_TZ else ''))
+    cursor.close()
+
+
+connection = PooledConnection()
+request_finished.connect(connection.release)
@@ -0,0 +1,145 @@
+"""
+Request-scoped timing of the slow things a page waits on: Voyager
+queries, Z39.50 searches and outbound HTTP. ProfilingMiddleware starts a
+Profile for a sample of requests (PROFILE_SAMPLE_RATE), code wraps the
+calls it makes in timed(), and the totals go out as a Server-Timing
+header and one log line per request.
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class Profile(object):
+    """
+    Count and cumulative seconds for each category. Lookups run on worker
+    threads add to the same profile, so it has its own lock.
+    """
+
+    def __init__(self):
+        self.start = time.time()
+        self.lock = threading.Lock()
+        self.timings = {}
+
+    def add(self, category, elapsed, count=1):
+        with self.lock:
+            timing = self.timings.setdefault(category, [0, 0.0])
+            timing[0] += count
+            timing[1] += elapsed
+
+    def summary(self):
+        with self.lock:
+            timings = dict([(category, {'count': count,
+                                        'ms': round(seconds * 1000, 1)})
+                            for category, (count, seconds)
+                            in self.timings.items()])
+        timings['total'] = {
+            'ms': round((time.time() - self.start) * 1000, 1)}
+        return timings
+
+
+def current():
+    return getattr(_local, 'profile', None)
+
+
+def activate(profile):
+    """
+    Make profile the current one for this thread; None turns it off.
+    """
+    _local.profile = profile
+
+
+@contextmanager
+def timed(category, count=1):
+    profile = current()
+    if profile is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        profile.add(category, time.time() - start, count)
+
+
+class TimedCursor(object):
+    """
+    Wraps a database cursor so statements and fetches are timed under
+    'db', counting each statement once.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def execute(self, sql, params=None):
+        with timed('db'):
+            return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        with timed('db'):
+            return self.cursor.executemany(sql, param_list)
+
+    def fetchone(self):
+        with timed('db', count=0):
+            return self.cursor.fetchone()
+
+    def fetchmany(self, *args):
+        with timed('db', count=0):
+            return self.cursor.fetchmany(*args)
+
+    def fetchall(self):
+        with timed('db', count=0):
+            return self.cursor.fetchall()
+
+
+def server_timing(summary):
+    metrics = []
+    for category in sorted(summary):
+        timing = summary[category]
+        metric = '%s;dur=%s' % (category, timing['ms'])
+        if 'count' in timing:
+            metric += ';desc="%s calls"' % timing['count']
+        metrics.append(metric)
+    return ', '.join(metrics)
+
+
+class ProfilingMiddleware(object):
+    """
+    Profiles a PROFILE_SAMPLE_RATE fraction of requests (0 for none, 1
+    for all of them).
+    """
+
+    def process_request(self, request):
+        rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+        activate(Profile() if rate and random.random() < rate else None)
+
+    def process_response(self, request, response):
+        profile = current()
+        if profile is None:
+            return response
+        activate(None)
+        summary = profile.summary()
+        response['Server-Timing'] = server_timing(summary)
+        logger.info(json.dumps({
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'timings': summary,
+        }, sort_keys=True))
+        return response
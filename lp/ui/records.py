@@ -0,0 +1,217 @@
+"""
+Slotted record types for the holdings and items get_holdings builds.
+
+A cluster can carry thousands of items, and as dicts each one costs a hash
+table plus a copy every time it's passed along. These keep their known
+fields in __slots__ and behave like dicts where the rest of the code,
+the sorts and the templates expect them to: record['KEY'], get, 'KEY' in
+record, iteration and so on. A field that hasn't been set is missing, the
+same as a key that was never added to a dict. Keys outside FIELDS are
+still accepted and kept in a small overflow dict, so an unexpected column
+doesn't break anything.
+"""
+
+
+class _RecordType(type):
+    """
+    Gives each record class a frozenset of its FIELDS for quick lookups.
+    """
+
+    def __init__(cls, name, bases, attrs):
+        super(_RecordType, cls).__init__(name, bases, attrs)
+        cls._fieldset = frozenset(cls.FIELDS)
+
+
+class Record(object):
+    """
+    Base for the slotted records. Subclasses list their keys in FIELDS and
+    set __slots__ = FIELDS.
+    """
+    __metaclass__ = _RecordType
+    __slots__ = ('_extra',)
+    FIELDS = ()
+
+    def __init__(self, data=None, **kwargs):
+        self._extra = None
+        if data:
+            self.update(data)
+        if kwargs:
+            self.update(kwargs)
+
+    def __getitem__(self, key):
+        if key in self._fieldset:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key in self._fieldset:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._fieldset:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        elif self._extra is None:
+            raise KeyError(key)
+        else:
+            del self._extra[key]
+
+    def __contains__(self, key):
+        if key in self._fieldset:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    has_key = __contains__
+
+    def __iter__(self):
+        for field in self.FIELDS:
+            if hasattr(self, field):
+                yield field
+        if self._extra:
+            for key in self._extra:
+                yield key
+
+    iterkeys = __iter__
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return dict(self.iteritems()) == dict(other.iteritems())
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, dict(self.iteritems()))
+
+    def __getstate__(self):
+        return dict(self.iteritems())
+
+    def __setstate__(self, state):
+        self._extra = None
+        self.update(state)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            self[key] = default
+            return default
+
+    def pop(self, key, *default):
+        try:
+            value = self[key]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        del self[key]
+        return value
+
+    def update(self, data=None, **kwargs):
+        if data:
+            if hasattr(data, 'iteritems'):
+                data = data.iteritems()
+            for key, value in data:
+                self[key] = value
+        for key, value in kwargs.iteritems():
+            self[key] = value
+
+    def keys(self):
+        return list(iter(self))
+
+    def iteritems(self):
+        for key in self:
+            yield key, self[key]
+
+    def items(self):
+        return list(self.iteritems())
+
+    def itervalues(self):
+        for key in self:
+            yield self[key]
+
+    def values(self):
+        return list(self.itervalues())
+
+    def copy(self):
+        """
+        A shallow copy: nested lists and records are shared.
+        """
+        other = self.__class__.__new__(self.__class__)
+        other._extra = None if self._extra is None else dict(self._extra)
+        for field in self.FIELDS:
+            try:
+                setattr(other, field, getattr(self, field))
+            except AttributeError:
+                pass
+        return other
+
+    def todict(self):
+        return dict(self.iteritems())
+
+
+class Item(Record):
+    """
+    An item on a holding, from a voyager item row or a z39.50 lookup.
+    """
+    FIELDS = ('DISPLAY_CALL_NO', 'ITEM_STATUS_DESC', 'ITEM_STATUS',
+              'PERMLOCATION', 'TEMPLOCATION', 'ITEM_ENUM', 'CHRON', 'ITEM_ID',
+              'ITEM_STATUS_DATE', 'BIB_ID', 'MFHD_ID', 'DUE', 'ELIGIBLE',
+              'LIBRARY_FULL_NAME', 'TRIMMED_LOCATION_DISPLAY_NAME', 'RECALLS',
+              'REMOVE')
+    __slots__ = FIELDS
+
+
+class Availability(Item):
+    """
+    The AVAILABILITY of a holding, which is the first of its items.
+    """
+    __slots__ = ()
+
+
+class ElectronicData(Record):
+    """
+    The ELECTRONIC_DATA of a holding, from its 856, 852 and 866 tags.
+    """
+    FIELDS = ('MFHD_ID', 'LINK856U', 'LINK856Z', 'LINK852Z', 'LINK852A',
+              'LINK852H', 'LINK866', 'LINK8563')
+    __slots__ = FIELDS
+
+
+class Holding(Record):
+    """
+    A holding, with its items, availability and electronic data.
+    """
+    FIELDS = ('BIB_ID', 'MFHD_ID', 'LOCATION_ID', 'DISPLAY_CALL_NO',
+              'LOCATION_DISPLAY_NAME', 'LIBRARY_NAME', 'LOCATION_NAME',
+              'MFHD_DATA', 'ITEMS', 'ELECTRONIC_DATA', 'AVAILABILITY',
+              'ELIGIBLE', 'LIBRARY_HAS', 'LIBRARY_FULL_NAME',
+              'TRIMMED_LOCATION_DISPLAY_NAME', 'REMOVE', 'LinkResolverData',
+              'ONLINE')
+    __slots__ = FIELDS
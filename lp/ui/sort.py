@@ -24,14 +24,18 @@ def holdsort(holdings_list):
         key=lambda holding: holding.get('LOCATION_NAME', ''))
 
 
+def _item_available(item):
+    return (item.get('ITEM_STATUS', '') == 1 or
+            item.get('ITEM_STATUS_DESC', '') == 'Not Charged')
+
+
 def availsort(holdings_list):
     top, remainder, bottom = [], [], []
     for holding in holdings_list:
         if holding.get('ITEMS', []):
             topitems, remainderitems = [], []
             for item in holding['ITEMS']:
-                if (item.get('ITEM_STATUS', '') == 1 or
-                    item.get('ITEM_STATUS_DESC', '') == 'Not Charged'):
+                if _item_available(item):
                     topitems.append(item)
                 else:
                     remainderitems.append(item)
@@ -105,6 +109,69 @@ def elecsort(holdings_list, rev=False):
     return rest + elec
 
 
+def _holding_rank(holding):
+    try:
+        if holding.get('LIBRARY_NAME', '') in settings.INELIGIBLE_LIBRARIES:
+            return 2
+        elif (holding.get('AVAILABILITY', {}).get('ITEM_STATUS') == 1):
+            return 0
+        return 1
+    except KeyError:
+        return 1
+
+
+def holdingsort(holdings_list, locations=True):
+    """
+    Orders holdings and their items with one sort each, using composite
+    keys that give the same order as the chain of single sorts:
+
+        ours, theirs, shared = splitsort(callnumsort(enumsort(holdings)))
+        elecsort(holdsort(templocsort(availsort(ours))))
+            + elecsort(holdsort(templocsort(availsort(shared))))
+            + libsort(elecsort(holdsort(templocsort(availsort(theirs))),
+                      rev=True))
+
+    Without locations the holdsort and templocsort steps are left out.
+    Each later sort in the chain is stable, so its key goes in front of
+    the keys of the sorts before it.
+    """
+    # serials repeat the same call numbers and enumerations a great deal
+    nums = {}
+
+    def num(value):
+        if value not in nums:
+            nums[value] = numstrip(value)
+        return nums[value]
+
+    for holding in holdings_list:
+        if holding.get('ITEMS', None):
+            if locations:
+                key = lambda item: (item.get('TEMPLOCATION', ''),
+                                    not _item_available(item),
+                                    num(item.get('DISPLAY_CALL_NO')),
+                                    num(item.get('ITEM_ENUM')))
+            else:
+                key = lambda item: (not _item_available(item),
+                                    num(item.get('DISPLAY_CALL_NO')),
+                                    num(item.get('ITEM_ENUM')))
+            holding['ITEMS'] = sorted(holding['ITEMS'], key=key)
+    keys = []
+    for position, holding in enumerate(holdings_list):
+        library = holding['LIBRARY_NAME']
+        electronic = _is_electronic(holding)
+        location = holding.get('LOCATION_NAME', '') if locations else ''
+        rank = _holding_rank(holding)
+        if library == settings.PREF_LIB:
+            key = (0, '', not electronic, location, rank, position)
+        elif library in settings.SHARED_LIBRARY_NAMES:
+            key = (1, '', not electronic, location, rank, position)
+        else:
+            key = (2, library, electronic, location, rank, position)
+        keys.append((key, holding))
+    keys.sort()
+    return [holding for key, holding in keys]
+
+
 def strip_bad_holdings(holdings_list):
     goodstuff = []
     for holding in holdings_list:
@@ -40,15 +40,32 @@ function cittogtxt(elemid) {
     }
 }
 
+// the most bibids /availability answers for at once, see ui.views
+var MAX_AVAILABILITY_BIBIDS = 100;
+
 function check_availability() {
+  // ask for the offers on the page a few requests at a time
+  var bibids = [];
+  var seen = {};
   $(".offer").each(function(i, e) {
     var offer = $(e);
     var bibid = offer.attr('id');
     // the id looks like offer-{bibid}
     bibid = bibid.split('-')[1];
-    var url = '/availability?bibid=' + bibid;
-    $.ajax(url).done(add_availability);
+    if (! seen[bibid]) {
+      seen[bibid] = true;
+      bibids.push(bibid);
+    }
   });
+  for (var i = 0; i < bibids.length; i += MAX_AVAILABILITY_BIBIDS) {
+    var chunk = bibids.slice(i, i + MAX_AVAILABILITY_BIBIDS);
+    var url = '/availability?bibids=' + chunk.join(',');
+    $.ajax(url).done(function(availabilities) {
+      for (var bibid in availabilities) {
+        add_availability(availabilities[bibid]);
+      }
+    });
+  }
 }
 
 function add_availability(availability) {
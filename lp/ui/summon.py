@@ -1,11 +1,52 @@
 import re
+import time
 import logging
+import requests
 import summoner
 
-from urllib import urlencode
+from urllib import quote_plus
 from datetime import datetime
+from django.conf import settings
 from django.core.urlresolvers import reverse
 
+from ui import cache as tiered
+from ui import db
+from ui import parallel
+from ui.profiling import timed
+
+
+def cache_settings():
+    conf = {
+        'TIMEOUT': 60 * 10,
+        'STALE_TIMEOUT': 60 * 60 * 24,
+        'LOCAL_SIZE': 200,
+        'RETRY_DELAY': 0.5,
+        'RETRY_MAX_DELAY': 4,
+        'PREFETCH': False,
+        'PREFETCH_PER_CLIENT': 20,
+    }
+    conf.update(getattr(settings, 'SUMMON_CACHE', {}))
+    return conf
+
+
+# search results by normalized query and parameters; they are served for
+# STALE_TIMEOUT past TIMEOUT while a background thread asks Summon again,
+# so a Summon outage leaves recent searches working
+cache = tiered.TieredCache('summon', size=cache_settings()['LOCAL_SIZE'])
+
+
+def search_key(q, kwargs):
+    """
+    The cache key for a search. Whitespace in the query and the order of
+    the facet value filters don't change the results.
+    """
+    params = dict(kwargs)
+    if 'fvf' in params:
+        params['fvf'] = sorted(params['fvf'])
+    return (' '.join(q.split()), sorted(
+        [(k, tuple(v) if isinstance(v, list) else v)
+         for k, v in params.items()]))
+
 
 class Summon():
     """
@@ -17,13 +58,86 @@ class Summon():
     def __init__(self, summon_id, summon_key):
         self._summon = summoner.Summon(summon_id, summon_key)
 
+    def cached_search(self, q, **kwargs):
+        """
+        search() through the search cache. Concurrent misses for the same
+        search in a process share one call to Summon. A miss asks Summon
+        once, so a request never waits out retries; when that fails the
+        search is retried in the background for the next request.
+        """
+        conf = cache_settings()
+        return cache.get_or_refresh(
+            search_key(q, kwargs),
+            lambda: self.search(q, **kwargs),
+            conf['TIMEOUT'], conf['STALE_TIMEOUT'],
+            retry=lambda: self._search_with_retries(q, kwargs))
+
+    def prefetch(self, client, q, **kwargs):
+        """
+        With PREFETCH on, runs cached_search(q, **kwargs) and looks up the
+        availability of its results on the background pool, so they are
+        cached when the client asks for them. Each search is prefetched at
+        most once per TIMEOUT across processes, and each client gets
+        PREFETCH_PER_CLIENT prefetches a minute. Returns True if the
+        prefetch was started.
+        """
+        conf = cache_settings()
+        if not conf['PREFETCH']:
+            return False
+        key = search_key(q, kwargs)
+        found, entry = cache.get(key)
+        if found and entry[0] > time.time():
+            return False
+        shared_cache = tiered.shared_cache
+        counter = cache.make_key(('prefetches', client,
+                                  int(time.time() // 60)))
+        shared_cache.add(counter, 0, 60)
+        try:
+            if shared_cache.incr(counter) > conf['PREFETCH_PER_CLIENT']:
+                return False
+        except ValueError:
+            # the counter expired in between; skip this one
+            return False
+        if not shared_cache.add(cache.make_key(('prefetch', key)), 1,
+                                conf['TIMEOUT']):
+            return False
+        parallel.submit(self._prefetch, q, kwargs)
+        return True
+
+    def _prefetch(self, q, kwargs):
+        results = self.cached_search(q, **kwargs)
+        bibids = [offer['serialNumber']
+                  for item in results.get('results', [])
+                  for offer in item.get('offers', [])
+                  if offer.get('serialNumber')]
+        if bibids:
+            db.get_availabilities(bibids)
+
+    def _search_with_retries(self, q, kwargs):
+        """
+        search(), retrying up to SER_SOL_API_MAX_ATTEMPTS times on HTTP
+        errors with exponentially longer waits, up to RETRY_MAX_DELAY.
+        """
+        conf = cache_settings()
+        attempts = 0
+        while True:
+            try:
+                return self.search(q, **kwargs)
+            except requests.HTTPError:
+                if attempts >= settings.SER_SOL_API_MAX_ATTEMPTS:
+                    raise
+                time.sleep(min(conf['RETRY_DELAY'] * 2 ** attempts,
+                               conf['RETRY_MAX_DELAY']))
+                attempts += 1
+
     def search(self, q, *args, **kwargs):
         """
         Performs the search and massages data into schema.org JSON-LD. If
         you pass in raw=True you will get the raw summon response instead.
         """
         t = datetime.now()
-        summon_response = self._summon.search(q, *args, **kwargs)
+        with timed('summon'):
+            summon_response = self._summon.search(q, *args, **kwargs)
         elapsed = datetime.now() - t
         logging.debug("summon %s: %s: %s - %s", q, args, kwargs, elapsed)
 
@@ -40,6 +154,7 @@ class Summon():
 
         # django templates don't use @ prefixed parameters from json-ld
         for_template = kwargs.get('for_template', False)
+        brief = kwargs.get('brief', False)
 
         response = {
             "query": q,
@@ -61,36 +176,66 @@ class Summon():
                     })
                 response['facets'].append(facet)
 
+        # every author and subject link is a search
+        search_url = reverse('search') + '?q='
         seen = {}
         for doc in summon_response['documents']:
-            item = self._convert(doc)
-            if item:
-                # only include items that are held by a library
-                if len(item['offers']) == 0:
-                    continue
-                # sometimes (rarely) the same item appears more than once?
-                # e.g. search for "statistics"
-                if item['@id'] in seen:
-                    continue
-                seen[item['@id']] = True
-                if for_template:
-                    item['id'] = item.pop('@id')
-                    item['type'] = item.pop('@type')
-                response['results'].append(item)
+            item = self._convert(doc, search_url, brief)
+            # only include items that are held by a library
+            if item is None:
+                continue
+            # sometimes (rarely) the same item appears more than once?
+            # e.g. search for "statistics"
+            if item['@id'] in seen:
+                continue
+            seen[item['@id']] = True
+            if for_template:
+                item['id'] = item.pop('@id')
+                item['type'] = item.pop('@type')
+            response['results'].append(item)
 
         return response
 
-    def _convert(self, doc):
-        i = {}
-
+    def _convert(self, doc, search_url, brief=False):
+        """
+        JSON-LD for a Summon document, or None when it can't be linked to
+        or no library holds it. With brief only the ids, type and offers
+        are filled in.
+        """
         # must have an id and a type
         id = self._id(doc)
         if id is None or 'ContentType' not in doc:
             return None
 
-        i['wrlc'] = id
-        i['@id'] = '/item/' + id
+        offers = []
+        for offer_doc in [doc] + doc.get('peerDocuments', []):
+            offer = self._get_offer(offer_doc)
+            if offer:
+                offers.append(offer)
+        if not offers:
+            return None
+
+        # launchpad urls need to be massaged when the primary holding
+        # (the first) for the item is from George Mason and Georgetown
+        #
+        # Both institutions loaded into Summon using their own ILS
+        # record identifiers, which we can look up, but are not
+        # Voygager bibids that we can look up directly. The 'm' and 'b'
+        # prefixes to the ids are an indicator to launchpad to look them
+        # up indirectly.
+        i = {'wrlc': id, '@id': '/item/' + id, 'offers': offers}
+        seller = offers[0]['seller']
+        if seller == 'George Mason University':
+            # sometimes they have the 'm' prefix sometimes they don't
+            if not id.startswith('m'):
+                i['wrlc'] = 'm' + id
+            i['@id'] = '/item/' + i['wrlc']
+        elif seller == 'Georgetown University':
+            if not id.startswith('b'):
+                i['@id'] = '/item/b' + id
         i['@type'] = self._get_type(doc)
+        if brief:
+            return i
 
         if doc.get('Title'):
             i['name'] = doc['Title'][0]
@@ -104,7 +249,7 @@ class Summon():
                     q = ('Author:"%s"' % name['fullname']).encode('utf8')
                     i['author'].append({
                         'name': name['fullname'],
-                        'url': reverse('search') + '?' + urlencode({'q': q})
+                        'url': search_url + quote_plus(q)
                     })
             for alt_name in doc.get('Author_FL_xml', []):
                 if 'fullname' in alt_name:
@@ -119,9 +264,8 @@ class Summon():
                 q = ('SubjectTerms:"%s"' % subject).encode('utf8')
                 i['about'].append({
                     'name': subject,
-                    'url': reverse('search') + '?' + urlencode({'q': q})
+                    'url': search_url + quote_plus(q)
                 })
-                # i['about'] = sorted(i['about'])
 
         if doc.get('PublicationYear'):
             i['datePublished'] = doc['PublicationYear'][0]
@@ -146,16 +290,6 @@ class Summon():
         if doc.get('DocumentTitle_FL'):
             i['alternateName'] = doc.get('DocumentTitle_FL')[0]
 
-        i['offers'] = []
-        offer = self._get_offer(doc)
-        if offer:
-            i['offers'].append(offer)
-        for peer_doc in doc.get('peerDocuments', []):
-            offer = self._get_offer(peer_doc)
-            if offer:
-                i['offers'].append(offer)
-        i = self._rewrite_ids(i)
-
         return i
 
     def _get_offer(self, doc):
@@ -164,6 +298,13 @@ class Summon():
         if doc.get('Institution'):
             inst = doc.get('Institution')[0]
             inst = re.sub(' \(.+\)', '', inst)
+            # George Mason and Georgetown serialNumbers are used to look
+            # up holdings in their catalogs
+            if inst == 'George Mason University' and \
+                    not id.startswith('m'):
+                id = 'm' + id
+            elif inst == 'Georgetown University' and not id.startswith('b'):
+                id = 'b' + id
             offer = {
                 'seller': inst,
                 'serialNumber': id
@@ -176,41 +317,6 @@ class Summon():
 
         return offer
 
-    def _rewrite_ids(self, item):
-        # launchpad urls need to be massaged when the primary holding
-        # (the first) for the item is from George Mason and Georgetown
-        #
-        # Both institutions loaded into Summon using their own ILS
-        # record identifiers, which we can look up, but are not
-        # Voygager bibids that we can look up directly. The 'm' and 'b'
-        # prefixes to the ids are an indicator to launchpad to look them
-        # up indirectly.
-
-        if len(item['offers']) == 0:
-            return item
-
-        # rewrite @id based on the first offer's institution
-        offer = item['offers'][0]
-        if offer['seller'] == 'George Mason University':
-            # sometimes they have the 'm' prefix sometimes they don't
-            if not item['wrlc'].startswith('m'):
-                item['wrlc'] = 'm' + item['wrlc']
-            item['@id'] = '/item/' + item['wrlc']
-        elif offer['seller'] == 'Georgetown University':
-            if not item['wrlc'].startswith('b'):
-                item['@id'] = '/item/b' + item['wrlc']
-
-        # rewrite offer serialNumbers which are used to look up holdings
-        for offer in item['offers']:
-            seller = offer.get('seller')
-            sn = offer.get('serialNumber')
-
-            if seller == 'George Mason University' and not sn.startswith('m'):
-                offer['serialNumber'] = 'm' + sn
-            elif seller == 'Georgetown University' and not sn.startswith('b'):
-                offer['serialNumber'] = 'b' + sn
-
-        return item
     # Only list rewritten values; some are used for class names and icons, in search.html e.g., AudioObject
     # Default to original value. Issues: 637 web resource; 692 archival material; 818 video; 839 audio;
     # 881 newspaper
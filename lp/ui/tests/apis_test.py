@@ -0,0 +1,25 @@
+import time
+
+from django.test import TestCase
+
+from ui import apis
+
+
+def _fail():
+    raise IOError('unreachable')
+
+
+class ApisTest(TestCase):
+
+    def test_call_all(self):
+        """results keep call order and failures come back as None"""
+        results = apis.call_all([(lambda n: n, (1,)), (_fail, ()),
+                                 (time.sleep, (0,))])
+        self.assertEqual(results, [1, None, None])
+
+    def test_failures_not_cached(self):
+        """a failed fetch is retried rather than cached as not found"""
+        key = time.time()
+        self.assertRaises(IOError, apis._cached, 'test', key, _fail)
+        self.assertEqual(apis._cached('test', key, lambda: [1]), [1])
+        self.assertEqual(apis._cached('test', key, lambda: [2]), [1])
@@ -0,0 +1,48 @@
+import time
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from ui import db
+
+
+class GroupedZ3950OffersTest(TestCase):
+
+    def setUp(self):
+        self.lookups = []
+        self._get_offers_z3950 = db._get_offers_z3950
+        db._get_offers_z3950 = self.fake_offers
+
+    def tearDown(self):
+        db._get_offers_z3950 = self._get_offers_z3950
+
+    def fake_offers(self, id, library):
+        self.lookups.append((id, library))
+        if id == 'b2':
+            raise IOError('catalog went away')
+        if id == 'm3':
+            time.sleep(0.5)
+        return [{'@type': 'Offer', 'seller': library, 'sku': id}]
+
+    def test_grouped(self):
+        """every id gets offers, and one failure doesn't spoil the rest"""
+        offers = db._get_offers_z3950_grouped([
+            ('m1', 'George Mason'), ('b1', 'Georgetown'),
+            ('b2', 'Georgetown'), ('m2', 'George Mason')])
+        self.assertEqual(sorted(offers.keys()), ['b1', 'b2', 'm1', 'm2'])
+        self.assertEqual(offers['m2'][0]['sku'], 'm2')
+        self.assertEqual(offers['b1'][0]['seller'], 'Georgetown')
+        self.assertEqual(offers['b2'], [])
+        self.assertEqual(len(self.lookups), 4)
+
+    @override_settings(Z3950_SERVERS={}, Z3950_TIMEOUT=0.2)
+    def test_slow(self):
+        """a slow lookup doesn't cost the ids that already finished"""
+        start = time.time()
+        offers = db._get_offers_z3950_grouped([
+            ('m1', 'George Mason'), ('m3', 'George Mason'),
+            ('m2', 'George Mason')])
+        self.assertTrue(time.time() - start < 0.45)
+        self.assertEqual(offers['m3'], [])
+        self.assertEqual(offers['m1'][0]['sku'], 'm1')
+        self.assertEqual(offers['m2'][0]['sku'], 'm2')
@@ -0,0 +1,46 @@
+import pymarc
+
+from django.test import TestCase
+
+from ui import voyager
+
+
+class BibFieldsTest(TestCase):
+
+    def setUp(self):
+        self.record = pymarc.Record()
+        self.record.add_field(pymarc.Field(
+            tag='245', indicators=['1', '0'],
+            subfields=['a', 'Finding aids :', 'b', 'a guide /']))
+        self.record.add_field(pymarc.Field(
+            tag='856', indicators=['4', '2'],
+            subfields=['u', 'http://example.com/aid',
+                       'z', 'CONNECT TO FINDING AID']))
+        self.record.add_field(pymarc.Field(
+            tag='700', indicators=['1', ' '],
+            subfields=['a', 'Smith, Jane,', 'd', '1950-', 'e', 'editor.']))
+        self.record.add_field(pymarc.Field(
+            tag='880', indicators=['1', '0'],
+            subfields=['6', '245-01/$1', 'a', 'Title', 'b', 'sub']))
+
+    def test_marc_field(self):
+        """fields come out the way wrlcdb.GetMarcField formats them"""
+        self.assertEqual(voyager._marc_field(self.record, '856', 'u'),
+                         '856:42:$uhttp://example.com/aid')
+        self.assertEqual(voyager._marc_field(self.record, '856', 'z'),
+                         '856:42:$zCONNECT TO FINDING AID')
+        self.assertEqual(voyager._marc_field(self.record, '245'),
+                         '245:10:$aFinding aids :$ba guide /')
+        self.assertEqual(voyager._marc_field(self.record, '856', 'x'), '')
+        self.assertEqual(voyager._marc_field(self.record, '500'), '')
+
+    def test_880(self):
+        """linked fields lead with the field they link to"""
+        self.assertEqual(voyager._marc_880(self.record), '245-01/$1 Title sub')
+        self.assertEqual(voyager._marc_880(pymarc.Record()), None)
+
+    def test_added_authors(self):
+        """added entries follow the main entry, without relator terms"""
+        authors = voyager.get_added_authors({'AUTHOR': 'Doe, John.'},
+                                            self.record)
+        self.assertEqual(authors, ['Doe, John', 'Smith, Jane, 1950-'])
@@ -0,0 +1,118 @@
+import threading
+import time
+
+from django.core.cache import get_cache
+from django.test import TestCase
+
+from ui import cache as tiered
+from ui.cache import TieredCache
+
+
+class TieredCacheTest(TestCase):
+
+    def setUp(self):
+        self.calls = 0
+
+    def fetch(self, value):
+        def f():
+            self.calls += 1
+            return value
+        return f
+
+    def test_get_or_set(self):
+        """values are fetched once and then come from the cache"""
+        cache = TieredCache('test-%s' % time.time())
+        self.assertEqual(cache.get_or_set('k', self.fetch([1]), 60), [1])
+        self.assertEqual(cache.get_or_set('k', self.fetch([2]), 60), [1])
+        self.assertEqual(self.calls, 1)
+
+    def test_copies(self):
+        """callers get their own copy of cached values"""
+        cache = TieredCache('test-%s' % time.time())
+        cache.set('k', {'items': [1]}, 60)
+        cache.get('k')[1]['items'].append(2)
+        self.assertEqual(cache.get('k'), (True, {'items': [1]}))
+
+    def test_negative(self):
+        """empty results are cached, but for the negative timeout"""
+        cache = TieredCache('test-%s' % time.time(), negative_timeout=-1)
+        cache.get_or_set('k', self.fetch(None), 60)
+        cache.get_or_set('k', self.fetch(None), 60)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(cache.get('missing'), (False, None))
+
+    def test_lru(self):
+        """the local tier only keeps the most recently used entries"""
+        cache = TieredCache('test-%s' % time.time(), size=2)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key, 60)
+        self.assertEqual(len(cache.local), 2)
+        self.assertFalse(cache.make_key('a') in cache.local)
+
+
+class StaleCacheTest(TestCase):
+
+    def setUp(self):
+        self.calls = 0
+        self.saved = tiered.shared_cache
+        tiered.shared_cache = get_cache(
+            'django.core.cache.backends.locmem.LocMemCache',
+            LOCATION='stale-%s' % time.time())
+
+    def tearDown(self):
+        tiered.shared_cache = self.saved
+
+    def fetch(self, value, delay=0):
+        def f():
+            time.sleep(delay)
+            self.calls += 1
+            return value
+        return f
+
+    def test_stale(self):
+        """stale values are served while a background thread refreshes"""
+        cache = TieredCache('test-%s' % time.time())
+        self.assertEqual(cache.get_or_refresh('k', self.fetch([1]), -1, 60),
+                         [1])
+        self.assertEqual(cache.get_or_refresh('k', self.fetch([2]), 60, 60),
+                         [1])
+        for i in range(100):
+            if cache.get('k')[1][1] == [2]:
+                break
+            time.sleep(0.01)
+        self.assertEqual(cache.get_or_refresh('k', self.fetch([3]), 60, 60),
+                         [2])
+        self.assertEqual(self.calls, 2)
+
+    def test_single_flight(self):
+        """concurrent misses share one call"""
+        cache = TieredCache('test-%s' % time.time())
+        results = []
+
+        def get():
+            results.append(cache.get_or_refresh(
+                'k', self.fetch({'a': 1}, delay=0.1), 60, 60))
+        threads = [threading.Thread(target=get) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [{'a': 1}] * 5)
+        # each caller got its own copy
+        self.assertEqual(len(set([id(r) for r in results])), 5)
+
+    def test_retry(self):
+        """a failed miss is filled in the background by retry"""
+        cache = TieredCache('retry-%s' % time.time())
+
+        def fail():
+            raise IOError('down')
+        self.assertRaises(IOError, cache.get_or_refresh, 'k', fail, 60, 60,
+                          retry=self.fetch([1]))
+        for i in range(100):
+            if cache.get('k')[0]:
+                break
+            time.sleep(0.01)
+        self.assertEqual(cache.get_or_refresh('k', fail, 60, 60), [1])
+        self.assertEqual(self.calls, 1)
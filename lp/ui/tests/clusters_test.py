@@ -0,0 +1,81 @@
+import os
+import tempfile
+from datetime import datetime
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from ui import cache, clusters, db, fakevoyager, voyager
+
+
+class ClusterIndexTest(TestCase):
+
+    def setUp(self):
+        self.fake = fakevoyager.FakeVoyager(clusters=6, cluster_size=3)
+        self.fake.install(z3950_latency=0, http_latency=0)
+        cache.clear_local()
+        self.dir = tempfile.mkdtemp(prefix='clusters-')
+        self.path = os.path.join(self.dir, 'clusters.sqlite')
+        clusters.build(self.path)
+
+    def tearDown(self):
+        self.fake.close()
+        cache.clear_local()
+        for name in os.listdir(self.dir):
+            os.remove(os.path.join(self.dir, name))
+        os.rmdir(self.dir)
+
+    def lookups(self):
+        results = []
+        for bibid in sorted(sum(self.fake.bibids.values(), [])):
+            bib = voyager.get_bib_data(bibid, expand_ids=False)
+            for num_type in ('isbn', 'issn', 'oclc', 'lccn'):
+                nums = voyager.get_related_std_nums(bibid, num_type)
+                results.append((bibid, num_type, nums))
+                if nums:
+                    results.append(voyager.get_related_bibids(
+                        [n[0] for n in nums], num_type, bib['TITLE']))
+            item = {'wrlc': bibid, 'name': bib['TITLE'],
+                    'isbn': [n[0] for n in voyager.get_related_std_nums(
+                        bibid, 'isbn')]}
+            results.append(db.get_related_bibids_by_isbn(item))
+        return results
+
+    def test_same_as_voyager(self):
+        """lookups from the index match the queries against voyager"""
+        expected = self.lookups()
+        with override_settings(CLUSTER_INDEX=self.path):
+            self.assertTrue(clusters.get_index())
+            self.assertEqual(self.lookups(), expected)
+
+    def test_update(self):
+        """an update picks up bibs changed since the last build"""
+        bibid = int(self.fake.bibids['GW'][0])
+        conn = self.fake._connect()
+        conn.execute("UPDATE bib_master SET suppress_in_opac = 'Y', "
+                     "update_date = ? WHERE bib_id = ?",
+                     (datetime.now().strftime(clusters.DATE_FORMAT), bibid))
+        conn.commit()
+        with override_settings(CLUSTER_INDEX=self.path):
+            self.assertTrue(clusters.std_nums(bibid, ['035A'], oclc=True))
+            self.assertEqual(clusters.update(self.path,
+                                             datetime(2015, 1, 1)), 1)
+            self.assertEqual(clusters.std_nums(bibid, ['035A'], oclc=True),
+                             [])
+
+    def test_fallback(self):
+        """bibs missing from the index and stale indexes go to voyager"""
+        bibid = int(self.fake.bibids['GW'][0])
+        nums = [n[0] for n in voyager.get_related_std_nums(bibid, 'oclc')]
+        with override_settings(CLUSTER_INDEX=self.path):
+            self.assertTrue(clusters.related(bibid, ['035A'], nums, True))
+            self.assertEqual(clusters.related(None, ['035A'], nums, True),
+                             None)
+            self.assertEqual(clusters.related(-1, ['035A'], nums, True),
+                             None)
+            self.assertEqual(clusters.std_nums(-1, ['035A'], True), None)
+        with override_settings(CLUSTER_INDEX=self.path,
+                               CLUSTER_INDEX_MAX_AGE=-1):
+            self.assertEqual(clusters.related(bibid, ['035A'], nums, True),
+                             None)
+            self.assertEqual(clusters.std_nums(bibid, ['035A'], True), None)
@@ -0,0 +1,69 @@
+import json
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+import pymarc
+from django.core.management import call_command
+from django.test import TestCase
+
+from ui import fakevoyager, marc
+
+
+class ExportTest(TestCase):
+
+    def setUp(self):
+        self.fake = fakevoyager.FakeVoyager(clusters=4, cluster_size=3)
+        self.fake.install(z3950_latency=0, http_latency=0)
+        self.dir = tempfile.mkdtemp(prefix='export-')
+        self.path = os.path.join(self.dir, 'bibs.json')
+
+    def tearDown(self):
+        self.fake.close()
+        shutil.rmtree(self.dir)
+
+    def export(self, **options):
+        call_command('export', self.path, chunk_size=5, stdout=StringIO(),
+                     **options)
+
+    def lines(self):
+        return [json.loads(line) for line in open(self.path)]
+
+    def test_json(self):
+        """every bib is written in bib id order"""
+        self.export(processes=2)
+        bibs = self.lines()
+        self.assertEqual([b['BIB_ID'] for b in bibs], range(1001, 1013))
+        expected = marc.extract(self.fake.bibs[1001], {'BIB_ID': 1001})
+        self.assertEqual(bibs[0], json.loads(json.dumps(expected)))
+
+    def test_jsonld(self):
+        self.export(processes=1, format='jsonld')
+        items = self.lines()
+        self.assertEqual(items[0]['@type'], 'Book')
+        self.assertEqual(items[-1]['wrlc'], '1012')
+
+    def test_marc(self):
+        self.export(processes=1, format='marc')
+        reader = pymarc.MARCReader(open(self.path, 'rb'))
+        self.assertEqual(len(list(reader)), 12)
+
+    def test_resume(self):
+        """a resumed export picks up after the last checkpoint"""
+        self.export(processes=1)
+        checkpoint = json.load(open(self.path + '.checkpoint'))
+        self.assertEqual(checkpoint['last_bibid'], 1012)
+        self.assertEqual(checkpoint['count'], 12)
+        # pretend the export stopped after the first chunk, partway through
+        # writing the second
+        first = open(self.path).readlines()[:5]
+        checkpoint.update({'last_bibid': 1005, 'count': 5,
+                           'offset': len(''.join(first))})
+        json.dump(checkpoint, open(self.path + '.checkpoint', 'w'))
+        fp = open(self.path, 'w')
+        fp.write(''.join(first) + '{"BIB_ID": 10')
+        fp.close()
+        self.export(processes=1, resume=True)
+        self.assertEqual([b['BIB_ID'] for b in self.lines()],
+                         range(1001, 1013))
@@ -0,0 +1,40 @@
+import urlparse
+
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from ui import fakevoyager, summon, views
+
+
+class FacetsTest(TestCase):
+
+    def setUp(self):
+        api = summon.Summon('', '')
+        api._summon = fakevoyager.FakeSummoner(
+            fakevoyager.summon_facets())
+        self.results = api.search('history', pn=1, ps=20, for_template=True)
+
+    def process(self, params):
+        request = RequestFactory().get('/search', params)
+        return views._process_facets(request, self.results)['facets']
+
+    def test_order(self):
+        """facets come out in display order with friendly names"""
+        facets = self.process({'q': 'history'})
+        self.assertEqual([f['name'] for f in facets], [
+            'Institution', 'Library', 'Content Type', 'Author', 'Discipline',
+            'Subjects', 'Time Period', 'Region', 'Genre', 'Language'])
+
+    def test_values(self):
+        """unwanted and active values are dropped, the rest get urls"""
+        facets = self.process({'q': 'history', 'page': 3,
+                               'facet': 'Language:French'})
+        content_types = [c['name'] for c in facets[2]['counts']]
+        self.assertFalse('Journal Article' in content_types)
+        self.assertTrue('Audio' in content_types)
+        languages = facets[-1]['counts']
+        self.assertFalse('French' in [c['name'] for c in languages])
+        german = [c for c in languages if c['name'] == 'German'][0]
+        self.assertEqual(urlparse.parse_qs(german['url']), {
+            'q': ['history'], 'page': ['1'],
+            'facet': ['Language:French', 'Language:German']})
@@ -0,0 +1,147 @@
+import sqlite3
+
+from django.core.cache import get_cache
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from ui import cache, db, fakevoyager, profiling, voyager
+
+
+@override_settings(Z3950_SERVERS=fakevoyager.Z3950_SERVERS)
+class FakeVoyagerTest(TestCase):
+
+    def setUp(self):
+        self.fake = fakevoyager.FakeVoyager(clusters=4, cluster_size=3,
+                                            z3950_share=1)
+        self.fake.install(z3950_latency=0, http_latency=0)
+        cache.clear_local()
+
+    def tearDown(self):
+        self.fake.close()
+        cache.clear_local()
+
+    def test_translate(self):
+        """oracle sql is rewritten for sqlite"""
+        sql = fakevoyager.translate(
+            "SELECT wrlcdb.GetBibTag(%s, '008') FROM bib_text "
+            "WHERE title LIKE '%%SET%%' AND ROWNUM < 12", [1])
+        self.assertEqual(sql, "SELECT wrlcdb_GetBibTag(?, '008') FROM "
+                              "bib_text WHERE title LIKE '%SET%' AND 1=1")
+
+    def test_bib_data(self):
+        """a generated bib is found along with the rest of its cluster"""
+        bibid = self.fake.bibids['GW'][0]
+        bib = voyager.get_bib_data(bibid)
+        self.assertEqual(str(bib['BIB_ID']), bibid)
+        self.assertTrue(bib['TITLE_ALL'].startswith(bib['TITLE']))
+        self.assertEqual(bib['LIBRARY_NAME'], 'GW')
+        self.assertTrue(bib['OCLC'])
+        self.assertEqual(len(bib['BIB_ID_LIST']), 3)
+
+    def test_bib_data_queries(self):
+        """the record and its bib_text row come back in one query"""
+        bibid = self.fake.bibids['GW'][0]
+        profile = profiling.Profile()
+        profiling.activate(profile)
+        try:
+            bib = voyager.get_bib_data(bibid, expand_ids=False)
+        finally:
+            profiling.activate(None)
+        self.assertEqual(profile.summary()['db']['count'], 1)
+        record = self.fake.bibs[int(bibid)]
+        self.assertEqual(bib['MARC008'], record['008'].value())
+        self.assertEqual(bib['AUTHORS'][0], bib['AUTHOR'].rstrip('.'))
+        self.assertEqual(len(bib['AUTHORS']),
+                         1 + len(record.get_fields('700')))
+
+    def test_related_bibids_queries(self):
+        """related bibs and their titles come back in one query"""
+        bibid = self.fake.bibids['GW'][0]
+        bib = voyager.get_bib_data(bibid, expand_ids=False)
+        isbns = [n[0] for n in voyager.get_related_std_nums(bibid, 'isbn')]
+        profile = profiling.Profile()
+        profiling.activate(profile)
+        try:
+            related = voyager.get_related_bibids(isbns, 'isbn', bib['TITLE'])
+            unrelated = voyager.get_related_bibids(isbns, 'isbn', 'Other')
+        finally:
+            profiling.activate(None)
+        self.assertEqual(profile.summary()['db']['count'], 2)
+        self.assertEqual(len(related), 3)
+        self.assertEqual(unrelated, [])
+
+    def test_holdings(self):
+        """every bib in the cluster contributes holdings"""
+        bib = voyager.get_bib_data(self.fake.bibids['GW'][0])
+        libraries = set([b['LIBRARY_NAME'] for b in bib['BIB_ID_LIST']])
+        holdings = voyager.get_holdings(bib)
+        self.assertEqual(set([h['LIBRARY_NAME'] for h in holdings]),
+                         libraries)
+
+    @override_settings(VOYAGER_CACHE={'STATUS_TIMEOUT': -1})
+    def test_holdings_status_only(self):
+        """refreshed holdings only read circulation data again"""
+        bib = voyager.get_bib_data(self.fake.bibids['GW'][0])
+        voyager.get_holdings(voyager.get_bib_data(bib['BIB_ID']))
+        profile = profiling.Profile()
+        profiling.activate(profile)
+        try:
+            holdings = voyager.get_holdings(
+                voyager.get_bib_data(bib['BIB_ID']))
+        finally:
+            profiling.activate(None)
+        self.assertTrue(holdings)
+        # items and recalls
+        self.assertEqual(profile.summary()['db']['count'], 2)
+
+    def test_availability(self):
+        """voyager and z39.50 ids both get offers"""
+        bibids = [self.fake.bibids['GW'][0]] + self.fake.catalog_ids[:2]
+        results = db.get_availabilities(bibids)
+        for bibid in bibids:
+            self.assertTrue(results[bibid]['offers'])
+
+    def test_availability_limit(self):
+        """repeated bibids don't count against the request limit"""
+        bibids = [str(b) for b in self.fake.bibids['GW'][:2]]
+        url = '/availability?bibids=' + ','.join(bibids * 60)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        url = '/availability?bibids=' + ','.join(map(str, range(1, 102)))
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_item_page_cache(self):
+        """openurl query strings share the cached item page data"""
+        saved = cache.shared_cache
+        cache.shared_cache = get_cache(
+            'django.core.cache.backends.locmem.LocMemCache',
+            LOCATION='fakevoyager')
+        profiling.logger.disabled = True
+        try:
+            bibid = self.fake.bibids['GW'][0]
+            first = self.client.get('/item/%s?sid=one' % bibid)
+            second = self.client.get('/item/%s?sid=two&title=x' % bibid)
+        finally:
+            cache.shared_cache = saved
+            profiling.logger.disabled = False
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertTrue('db;' in first['Server-Timing'])
+        self.assertFalse('db;' in second['Server-Timing'])
+        self.assertEqual(second.context['bib']['openurl']['params'],
+                         {'sid': 'two', 'title': 'x'})
+
+    def test_serial_item_page(self):
+        """serials get an item page and json before any openurl is added"""
+        bibid = self.fake.bibids['GW'][0]
+        conn = sqlite3.connect(self.fake.path)
+        conn.execute("UPDATE bib_text SET bib_format = 'as' "
+                     "WHERE bib_id = ?", (bibid,))
+        conn.commit()
+        conn.close()
+        page = self.client.get('/item/%s?sid=one' % bibid)
+        self.assertEqual(page.status_code, 200)
+        self.assertEqual(page.context['bib']['BIB_FORMAT'], 'as')
+        self.assertTrue(page.context['bib']['ILLIAD_LINK'])
+        data = self.client.get('/item/%s.json' % bibid)
+        self.assertEqual(data.status_code, 200)
@@ -0,0 +1,22 @@
+from django.test import TestCase
+
+from ui.db import in_binds
+
+
+class InBindsTest(TestCase):
+
+    def test_buckets(self):
+        """statement text only depends on the bucket size"""
+        self.assertEqual(in_binds([1]), ('%s', [1]))
+        binds, params = in_binds([1, 2])
+        self.assertEqual(binds, '%s,%s,%s,%s')
+        self.assertEqual(params, [1, 2, None, None])
+        self.assertEqual(in_binds(range(5))[0], in_binds(range(16))[0])
+        self.assertEqual(len(in_binds(range(17))[1]), 64)
+
+    def test_long_lists(self):
+        """long lists are padded to a multiple of the largest bucket"""
+        binds, params = in_binds(range(65))
+        self.assertEqual(len(params), 128)
+        self.assertEqual(binds.count('%s'), 128)
+        self.assertEqual(params[64:66], [64, None])
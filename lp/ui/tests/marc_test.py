@@ -344,3 +344,17 @@ class MarcExtractTests(unittest.TestCase):
         r = self.get_record("655.mrc")
         bib_data = extract(r)
         self.assertEqual(bib_data["GENRE"], ["War stories."])
+
+    def test_mapping_order(self):
+        r = pymarc.Record()
+        r.add_field(pymarc.Field(tag='351', indicators=[' ', ' '],
+                                 subfields=['a', 'Arranged by date.']))
+        r.add_field(pymarc.Field(tag='300', indicators=[' ', ' '],
+                                 subfields=['a', '3 boxes.']))
+        r.add_field(pymarc.Field(tag='700', indicators=['1', ' '],
+                                 subfields=['a', 'Smith, J.', '6', '880-01',
+                                            'd', '1950-']))
+        bib_data = extract(r, {})
+        self.assertEqual(bib_data["DESCRIPTION"],
+                         ['3 boxes.', 'Arranged by date.'])
+        self.assertEqual(bib_data["OTHER_AUTHORS"], ['Smith, J. 1950-'])
@@ -1,4 +1,6 @@
+import copy
 import datetime
+import random
 
 from django.test import TestCase
 
@@ -49,3 +51,19 @@ class MissingItemTest(TestCase):
             if item.get('REMOVE'):
                 self.items.remove(item)
         self.assertEqual(len(self.items), 1)
+
+    def test_mark_duplicate_items(self):
+        """grouping by ITEM_ID removes the same items as comparing them all"""
+        rnd = random.Random(0)
+        dates = [None, datetime.datetime(2013, 1, 1),
+                 datetime.datetime(2014, 1, 1)]
+        for n in range(50):
+            items = [{'ITEM_ID': rnd.randint(1, 10),
+                      'ITEM_STATUS': rnd.choice([1, 2, 11, 12, 19]),
+                      'ITEM_STATUS_DATE': rnd.choice(dates)}
+                     for i in range(30)]
+            expected = copy.deepcopy(items)
+            for i in range(len(expected)):
+                v.remove_duplicate_items(i, expected)
+            v.mark_duplicate_items(items)
+            self.assertEqual(items, expected)
@@ -0,0 +1,62 @@
+import time
+
+from django.db import connection as django_connection
+from django.test import TestCase
+
+from ui import parallel, pool
+
+
+def _double(n):
+    if n < 0:
+        raise ValueError(n)
+    time.sleep(n)
+    return n * 2
+
+
+def _query():
+    cursor = pool.connection.cursor()
+    cursor.execute('SELECT %s', [1])
+    return cursor.fetchone()[0]
+
+
+class FanOutTest(TestCase):
+
+    def test_order(self):
+        """results come back in call order, not completion order"""
+        calls = [((0.2,), 5), ((0,), 5), ((0.1,), 5)]
+        results = parallel.fan_out(_double, calls, lambda n: None)
+        self.assertEqual(results, [0.4, 0, 0.2])
+
+    def test_concurrent(self):
+        """the calls overlap rather than running one after another"""
+        start = time.time()
+        parallel.fan_out(_double, [((0.3,), 5)] * 3, lambda n: None)
+        self.assertTrue(time.time() - start < 0.8)
+
+    def test_fallback(self):
+        """errors and missed deadlines get the fallback"""
+        calls = [((-1,), 5), ((1,), 0.1), ((0,), 0.1)]
+        results = parallel.fan_out(_double, calls, lambda n: 'failed')
+        self.assertEqual(results, ['failed', 'failed', 0])
+
+    def test_keeps_connection(self):
+        """a finished task leaves django's connection open for the next"""
+        closed = []
+        django_connection.close = lambda: closed.append(True)
+        try:
+            self.assertEqual(parallel._run(_query, (), None), 1)
+        finally:
+            del django_connection.close
+        self.assertEqual(closed, [])
+
+    def test_named_pool(self):
+        """calls stuck on a server's own pool leave the shared one free"""
+        slow = parallel.get_named_pool('parallel-test', 2)
+        results = parallel.fan_out(_double, [((0.1,), 0.01)] * 12,
+                                   lambda n: 'late', lambda n: slow)
+        self.assertEqual(results, ['late'] * 12)
+        start = time.time()
+        results = parallel.fan_out(_double, [((0,), 1)] * 10,
+                                   lambda n: 'late')
+        self.assertEqual(results, [0] * 10)
+        self.assertTrue(time.time() - start < 0.1)
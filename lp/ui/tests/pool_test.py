@@ -0,0 +1,25 @@
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from ui import pool
+
+
+class PoolTest(TestCase):
+
+    def test_disabled(self):
+        """without the pool cursors come from django's connection"""
+        cursor = pool.connection.cursor('single')
+        cursor.execute('SELECT %s', [1])
+        self.assertEqual(cursor.fetchone()[0], 1)
+        pool.connection.release()
+
+    @override_settings(VOYAGER_POOL={'ENABLED': True,
+                                     'PROFILES': {'bulk': {'arraysize': 5}}})
+    def test_settings(self):
+        """partial settings are merged over the defaults"""
+        conf = pool.pool_settings()
+        self.assertEqual(conf['MAX'], pool.DEFAULTS['MAX'])
+        self.assertEqual(conf['PROFILES']['bulk'], {'arraysize': 5})
+        self.assertTrue('single' in conf['PROFILES'])
+        # the test database is sqlite, so the pool stays out of the way
+        self.assertFalse(pool._enabled())
@@ -0,0 +1,60 @@
+from django.http import HttpResponse
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from ui import parallel
+from ui import profiling
+from ui.pool import connection
+
+
+def _query():
+    cursor = connection.cursor()
+    cursor.execute('SELECT 1')
+    return cursor.fetchall()
+
+
+class ProfilingTest(TestCase):
+
+    def tearDown(self):
+        profiling.activate(None)
+
+    def test_timed(self):
+        """nothing is recorded unless a profile is active"""
+        with profiling.timed('http'):
+            pass
+        profile = profiling.Profile()
+        profiling.activate(profile)
+        with profiling.timed('http'):
+            pass
+        with profiling.timed('http'):
+            pass
+        self.assertEqual(profile.summary()['http']['count'], 2)
+
+    def test_queries_and_workers(self):
+        """queries count once each, including those run on worker threads"""
+        profile = profiling.Profile()
+        profiling.activate(profile)
+        _query()
+        parallel.fan_out(_query, [((), 5), ((), 5)], lambda: None)
+        self.assertEqual(profile.summary()['db']['count'], 3)
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_middleware(self):
+        """sampled requests get a Server-Timing header"""
+        middleware = profiling.ProfilingMiddleware()
+        request = RequestFactory().get('/item/1')
+        middleware.process_request(request)
+        _query()
+        response = middleware.process_response(request, HttpResponse())
+        self.assertTrue('db;dur=' in response['Server-Timing'])
+        self.assertTrue('total;dur=' in response['Server-Timing'])
+        self.assertEqual(profiling.current(), None)
+
+    @override_settings(PROFILE_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        middleware = profiling.ProfilingMiddleware()
+        request = RequestFactory().get('/item/1')
+        middleware.process_request(request)
+        response = middleware.process_response(request, HttpResponse())
+        self.assertFalse(response.has_header('Server-Timing'))
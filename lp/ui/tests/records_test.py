@@ -0,0 +1,91 @@
+import copy
+import cPickle as pickle
+import json
+
+from django.template import Context, Template
+from django.test import TestCase
+
+from ui import fakevoyager, voyager
+from ui.records import Availability, ElectronicData, Holding, Item
+from ui.views import unicode_data
+
+
+class RecordTest(TestCase):
+
+    def test_mapping(self):
+        """records answer like the dicts they replace"""
+        item = Item({'ITEM_ID': 1, 'DUE': None})
+        self.assertEqual(item['ITEM_ID'], 1)
+        self.assertTrue('DUE' in item)
+        self.assertFalse('REMOVE' in item)
+        self.assertRaises(KeyError, lambda: item['REMOVE'])
+        self.assertEqual(item.get('REMOVE', 'no'), 'no')
+        item['REMOVE'] = True
+        self.assertEqual(item, {'ITEM_ID': 1, 'DUE': None, 'REMOVE': True})
+        del item['REMOVE']
+        self.assertEqual(sorted(item.keys()), ['DUE', 'ITEM_ID'])
+        self.assertFalse(Availability())
+        self.assertFalse(ElectronicData())
+
+    def test_extra_keys(self):
+        """keys outside FIELDS are kept too"""
+        item = Item(linktext='Full text')
+        self.assertEqual(item['linktext'], 'Full text')
+        self.assertEqual(item.items(), [('linktext', 'Full text')])
+        self.assertEqual(item.pop('linktext'), 'Full text')
+        self.assertEqual(len(item), 0)
+
+    def test_copy(self):
+        """copy is shallow and leaves the original alone"""
+        holding = Holding({'BIB_ID': 1, 'ITEMS': [Item(ITEM_ID=2)]})
+        other = holding.copy()
+        other['BIB_ID'] = 3
+        self.assertEqual(holding['BIB_ID'], 1)
+        self.assertTrue(other['ITEMS'] is holding['ITEMS'])
+        deep = copy.deepcopy(holding)
+        self.assertEqual(deep, holding)
+        self.assertFalse(deep['ITEMS'][0] is holding['ITEMS'][0])
+
+    def test_pickle(self):
+        holding = Holding({'BIB_ID': 1, 'ITEMS': [Item(ITEM_ID=2)],
+                           'AVAILABILITY': Availability(ITEM_ID=2),
+                           'extra': 'x'})
+        for protocol in (0, pickle.HIGHEST_PROTOCOL):
+            restored = pickle.loads(pickle.dumps(holding, protocol))
+            self.assertEqual(restored, holding)
+            self.assertTrue(isinstance(restored['AVAILABILITY'],
+                                       Availability))
+
+    def test_template(self):
+        holding = Holding({'LIBRARY_NAME': 'GW',
+                           'ITEMS': [Item(ITEM_STATUS_DESC='Not Charged')]})
+        template = Template('{{ holding.LIBRARY_NAME }} '
+                            '{% for item in holding.ITEMS %}'
+                            '{{ item.ITEM_STATUS_DESC }}{{ item.DUE }}'
+                            '{% endfor %}')
+        self.assertEqual(template.render(Context({'holding': holding})),
+                         'GW Not Charged')
+
+
+class HoldingRecordsTest(TestCase):
+
+    def setUp(self):
+        self.fake = fakevoyager.FakeVoyager(clusters=2, cluster_size=3)
+        self.fake.install(z3950_latency=0, http_latency=0)
+
+    def tearDown(self):
+        self.fake.close()
+
+    def test_holdings(self):
+        """get_holdings hands back records that still encode as json"""
+        bib = voyager.get_bib_data(self.fake.bibids['GW'][0])
+        holdings = voyager.get_holdings(bib)
+        self.assertTrue(holdings)
+        for holding in holdings:
+            self.assertTrue(isinstance(holding, Holding))
+            for item in holding.get('ITEMS', []):
+                self.assertTrue(isinstance(item, Item))
+        data = json.loads(json.dumps(unicode_data({'holdings': holdings}),
+                                     default=str))
+        self.assertEqual(data['holdings'][0]['BIB_ID'],
+                         holdings[0]['BIB_ID'])
@@ -0,0 +1,65 @@
+import gzip
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from ui import fakevoyager
+
+
+class MakeSitemapTest(TestCase):
+
+    def setUp(self):
+        self.fake = fakevoyager.FakeVoyager(clusters=4, cluster_size=3)
+        self.fake.install(z3950_latency=0, http_latency=0)
+        self.dir = tempfile.mkdtemp(prefix='sitemaps-')
+
+    def tearDown(self):
+        self.fake.close()
+        shutil.rmtree(self.dir)
+
+    def make_sitemap(self, processes=1):
+        with override_settings(SITEMAPS_DIR=self.dir,
+                               SITEMAPS_BASE_URL='http://example.com'):
+            call_command('make_sitemap', shard_size=5, processes=processes,
+                         stdout=StringIO())
+        return dict([(name, os.stat(os.path.join(self.dir, name)).st_ino)
+                     for name in os.listdir(self.dir)])
+
+    def test_shards(self):
+        """bibs are split into files by bib id range"""
+        files = self.make_sitemap(processes=2)
+        # bib ids 1001 to 1012
+        self.assertEqual(sorted(files), [
+            'sitemap-200.xml.gz', 'sitemap-201.xml.gz',
+            'sitemap-202.xml.gz', 'sitemap-index.xml',
+            'sitemap-manifest.json'])
+        xml = gzip.open(os.path.join(self.dir, 'sitemap-201.xml.gz')).read()
+        self.assertEqual(xml.count('<url>'), 5)
+        self.assertTrue('<loc>http://example.com/item/1005</loc>'
+                        '<lastmod>2014-01-01</lastmod>' in xml)
+        index = open(os.path.join(self.dir, 'sitemap-index.xml')).read()
+        self.assertTrue('<loc>http://example.com/sitemap-202.xml.gz</loc>'
+                        in index)
+
+    def test_incremental(self):
+        """only the shard holding a changed bib is rewritten"""
+        before = self.make_sitemap()
+        conn = self.fake._connect()
+        conn.execute("UPDATE bib_master SET update_date = "
+                     "'2015-02-03 00:00:00' WHERE bib_id = 1007")
+        conn.commit()
+        after = self.make_sitemap()
+        self.assertNotEqual(before['sitemap-201.xml.gz'],
+                            after['sitemap-201.xml.gz'])
+        self.assertEqual(before['sitemap-200.xml.gz'],
+                         after['sitemap-200.xml.gz'])
+        self.assertEqual(before['sitemap-202.xml.gz'],
+                         after['sitemap-202.xml.gz'])
+        index = open(os.path.join(self.dir, 'sitemap-index.xml')).read()
+        self.assertTrue('sitemap-201.xml.gz</loc>'
+                        '<lastmod>2015-02-03</lastmod>' in index)
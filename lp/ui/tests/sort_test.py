@@ -0,0 +1,51 @@
+import copy
+
+from django.test import TestCase
+
+from lp import settings
+from ui import fakevoyager
+from ui.sort import availsort, callnumsort, elecsort, enumsort, \
+    holdingsort, holdsort, libsort, splitsort, templocsort
+
+
+def chain_sort(holdings):
+    ours, theirs, shared = splitsort(callnumsort(enumsort(holdings)))
+    return elecsort(holdsort(templocsort(availsort(ours)))) \
+        + elecsort(holdsort(templocsort(availsort(shared)))) \
+        + libsort(elecsort(holdsort(templocsort(availsort(theirs))),
+                           rev=True))
+
+
+def chain_sort_without_locations(holdings):
+    ours, theirs, shared = splitsort(callnumsort(enumsort(holdings)))
+    return elecsort(availsort(ours)) \
+        + elecsort(availsort(shared)) \
+        + libsort(elecsort(availsort(theirs), rev=True))
+
+
+class HoldingSortTest(TestCase):
+
+    def setUp(self):
+        self.saved = settings.PREF_LIB, settings.INELIGIBLE_LIBRARIES
+        settings.PREF_LIB = 'GW'
+        settings.INELIGIBLE_LIBRARIES = ['AU']
+
+    def tearDown(self):
+        settings.PREF_LIB, settings.INELIGIBLE_LIBRARIES = self.saved
+
+    def order(self, holdings):
+        return [(h['MFHD_ID'], [i['ITEM_ID'] for i in h['ITEMS']])
+                for h in holdings]
+
+    def test_same_as_chain(self):
+        """one composite-key sort orders things like the chain of sorts"""
+        for seed in range(20):
+            holdings = fakevoyager.serial_holdings(items=50, seed=seed)
+            self.assertEqual(
+                self.order(holdingsort(copy.deepcopy(holdings))),
+                self.order(chain_sort(copy.deepcopy(holdings))))
+            self.assertEqual(
+                self.order(holdingsort(copy.deepcopy(holdings),
+                                       locations=False)),
+                self.order(chain_sort_without_locations(
+                    copy.deepcopy(holdings))))
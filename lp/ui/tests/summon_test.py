@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
 
 import os
+import requests
+import time
 import summoner
+import threading
 import unittest
 
-from ui.summon import Summon
+from ui import cache as tiered
+from ui.summon import Summon, cache, search_key
 from django.conf import settings
+from django.core.cache import get_cache
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
 
 
 class SummonTests(unittest.TestCase):
@@ -130,3 +137,133 @@ class SummonTests(unittest.TestCase):
         i = search['results'][0]
         self.assertEqual(len(i['offers']), 2)
         self.assertEqual(i['offers'][1]['serialNumber'], 'b27682912')
+
+
+class FakeSummoner(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+
+    def search(self, q, **kwargs):
+        self.calls += 1
+        if self.errors:
+            self.errors -= 1
+            raise requests.HTTPError('503 Server Error')
+        return {'recordCount': self.calls, 'documents': []}
+
+
+@override_settings(SUMMON_CACHE={'RETRY_DELAY': 0},
+                   SER_SOL_API_MAX_ATTEMPTS=3)
+class SummonCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.saved = tiered.shared_cache
+        tiered.shared_cache = get_cache(
+            'django.core.cache.backends.locmem.LocMemCache',
+            LOCATION='summon')
+        tiered.clear_local()
+        self.summon = Summon('id', 'key')
+        self.summon._summon = FakeSummoner()
+
+    def tearDown(self):
+        tiered.shared_cache.clear()
+        tiered.shared_cache = self.saved
+        tiered.clear_local()
+
+    def test_same_search(self):
+        """whitespace and facet order don't make a new search"""
+        first = self.summon.cached_search(
+            'statistics', pn=1, fvf=['Language,English,false',
+                                     'ContentType,Book,false'])
+        second = self.summon.cached_search(
+            ' statistics ', pn=1, fvf=['ContentType,Book,false',
+                                       'Language,English,false'])
+        self.assertEqual(first, second)
+        self.assertEqual(self.summon._summon.calls, 1)
+        self.summon.cached_search('statistics', pn=2)
+        self.assertEqual(self.summon._summon.calls, 2)
+
+    def test_retries(self):
+        """a failed miss is retried in the background, not by the request"""
+        self.summon._summon.errors = 2
+        request_thread, search = threading.current_thread(), []
+
+        def fake_search(q, **kwargs):
+            search.append(threading.current_thread() is request_thread)
+            return Summon.search(self.summon, q, **kwargs)
+        self.summon.search = fake_search
+        self.assertRaises(requests.HTTPError, self.summon.cached_search,
+                          'law')
+        for i in range(100):
+            if cache.get(search_key('law', {}))[0]:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.summon.cached_search('law')['totalResults'], 3)
+        self.assertEqual(search, [True, False, False])
+
+    @override_settings(SUMMON_CACHE={'RETRY_DELAY': 0, 'TIMEOUT': 0})
+    def test_stale(self):
+        """a stale result is served while summon is failing"""
+        first = self.summon.cached_search('music')
+        self.summon._summon.errors = 100
+        self.assertEqual(self.summon.cached_search('music'), first)
+
+    def wait_for_calls(self, calls):
+        for i in range(100):
+            if self.summon._summon.calls >= calls:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.summon._summon.calls, calls)
+
+    @override_settings(SUMMON_CACHE={'PREFETCH': True,
+                                     'PREFETCH_PER_CLIENT': 2})
+    def test_prefetch(self):
+        """the next page is fetched once, within the client's limit"""
+        self.assertTrue(self.summon.prefetch('10.0.0.1', 'law', pn=2))
+        self.wait_for_calls(1)
+        self.assertFalse(self.summon.prefetch('10.0.0.2', 'law', pn=2))
+        self.summon.cached_search('law', pn=2)
+        self.assertEqual(self.summon._summon.calls, 1)
+        self.assertTrue(self.summon.prefetch('10.0.0.1', 'war', pn=2))
+        self.assertFalse(self.summon.prefetch('10.0.0.1', 'art', pn=2))
+        self.assertTrue(self.summon.prefetch('10.0.0.2', 'art', pn=2))
+        self.wait_for_calls(3)
+
+
+class SummonConvertTests(SimpleTestCase):
+
+    doc = {
+        'availabilityId': 'Z6W 123',
+        'ContentType': ['Book'],
+        'Institution': ['Georgetown University'],
+        'Title': ['Politics'],
+        'Author_xml': [{'fullname': u'Caf\xe9, Ann', 'sequence': '1'}],
+        'SubjectTermsDisplay': ['Law & order.'],
+        'peerDocuments': [{'availabilityId': 'Z6W 456',
+                           'Institution': ['American University (AU)']}],
+    }
+
+    def search(self, **kwargs):
+        summon = Summon('id', 'key')
+        summon._summon = FakeSummoner()
+        summon._summon.search = lambda q, **kwargs: {
+            'recordCount': 1, 'documents': [self.doc]}
+        return summon.search('politics', **kwargs)['results']
+
+    def test_convert(self):
+        item = self.search()[0]
+        self.assertEqual(item['@id'], '/item/b123')
+        self.assertEqual(item['offers'], [
+            {'seller': 'Georgetown University', 'serialNumber': 'b123'},
+            {'seller': 'American University', 'serialNumber': '456'}])
+        self.assertEqual(item['author'][0]['url'],
+                         '/search?q=Author%3A%22Caf%C3%A9%2C+Ann%22')
+        self.assertEqual(item['about'][0]['url'],
+                         '/search?q=SubjectTerms%3A%22Law+%26+order%22')
+
+    def test_brief(self):
+        """brief results only have the ids and offers"""
+        item = self.search(brief=True)[0]
+        self.assertEqual(sorted(item.keys()),
+                         ['@id', '@type', 'offers', 'wrlc'])
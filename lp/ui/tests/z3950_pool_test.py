@@ -0,0 +1,92 @@
+import socket
+
+from django.test import TestCase
+
+from ui import z3950
+
+
+class FakeConnection(object):
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.closed = False
+        self.searches = 0
+
+    def search(self, query):
+        if self.fail:
+            raise IOError('connection reset')
+        self.searches += 1
+        return ['record 1', 'record 2']
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool(z3950.ConnectionPool):
+
+    def __init__(self, *args, **kwargs):
+        z3950.ConnectionPool.__init__(self, 'localhost', 210, 'db', 'USMARC',
+                                      *args, **kwargs)
+        self.opened = []
+
+    def _connect(self):
+        self.opened.append(FakeConnection())
+        return self.opened[-1]
+
+
+class ConnectionPoolTest(TestCase):
+
+    def test_reuse(self):
+        """connections go back to the pool and get reused"""
+        pool = FakePool()
+        self.assertEqual(pool.search('q'), ['record 1'])
+        self.assertEqual(pool.search('q', limit=None),
+                         ['record 1', 'record 2'])
+        self.assertEqual(len(pool.opened), 1)
+        self.assertEqual(pool.opened[0].searches, 2)
+
+    def test_idle_timeout(self):
+        """connections idle for too long are closed, not reused"""
+        pool = FakePool(idle_timeout=-1)
+        pool.search('q')
+        pool.search('q')
+        self.assertEqual(len(pool.opened), 2)
+        self.assertTrue(pool.opened[0].closed)
+
+    def test_reconnect(self):
+        """a broken pooled connection is replaced and the search retried"""
+        pool = FakePool()
+        pool.search('q')
+        pool.opened[0].fail = True
+        self.assertEqual(pool.search('q'), ['record 1'])
+        self.assertTrue(pool.opened[0].closed)
+        self.assertEqual(len(pool.opened), 2)
+        self.assertEqual(pool.idle[0][0], pool.opened[1])
+
+    def test_busy(self):
+        """a search gives up when no connection frees up in time"""
+        pool = FakePool(size=1, timeout=0.1)
+        pool.slots.acquire()
+        self.assertRaises(z3950.PoolBusy, pool.search, 'q')
+        pool.slots.release()
+        self.assertEqual(pool.search('q'), ['record 1'])
+
+    def test_socket_timeout(self):
+        """new connections get the pool's timeout on their socket"""
+        class Connection(object):
+            def __init__(self, ip, port):
+                self._cli = Client()
+
+        class Client(object):
+            sock = socket.socket()
+
+        saved = z3950.zoom.Connection
+        z3950.zoom.Connection = Connection
+        try:
+            pool = z3950.ConnectionPool('localhost', 210, 'db', 'USMARC',
+                                        timeout=3)
+            conn = pool._connect()
+        finally:
+            z3950.zoom.Connection = saved
+        self.assertEqual(conn._cli.sock.gettimeout(), 3)
+        conn._cli.sock.close()
@@ -2,7 +2,7 @@ import datetime
 import json
 import logging
 import re
-import time
+import urllib
 import urlparse
 
 import requests
@@ -11,18 +11,22 @@ import bibjsontools
 from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.db.utils import DatabaseError
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, HttpResponseBadRequest, Http404
 from django.shortcuts import render, redirect
+from django.utils.encoding import force_bytes
 from django.views.decorators.cache import cache_page
 
 from forms import PrintRequestForm
 from ui import voyager, apis, marc, summon, db
-from ui.sort import libsort, availsort, elecsort, templocsort, \
-    splitsort, enumsort, callnumsort, strip_bad_holdings, holdsort
+from ui.cache import TieredCache
+from ui.records import Record
+from ui.sort import holdingsort, strip_bad_holdings
 
 
 logger = logging.getLogger(__name__)
 
+item_cache = TieredCache('item', size=100)
+
 
 def home(request):
     return render(request, 'home.html', {
@@ -54,48 +58,80 @@ def citation_json(request):
     return bibjsontools.from_openurl(url) if url else None
 
 
-@cache_page(settings.ITEM_PAGE_CACHE_SECONDS)
+def _cached_item(kind, num, func):
+    """
+    The request-independent data behind an item page, from func(num).
+    Cached by number alone, so OpenURL query strings from link resolvers
+    share one entry, and served stale for ITEM_STALE_SECONDS while one
+    background thread refreshes it.
+    """
+    return item_cache.get_or_refresh(
+        (kind, num), lambda: func(num), settings.ITEM_PAGE_CACHE_SECONDS,
+        getattr(settings, 'ITEM_STALE_SECONDS', 60 * 60 * 24))
+
+
+def _add_request_data(request, bib):
+    """
+    Fill in the parts of a cached bib that depend on the request's
+    OpenURL: the citation, and the RefWorks and ILLiad links.
+    """
+    bib['openurl'] = _openurl_dict(request)
+    bib['citation_json'] = citation_json(request)
+    try:
+        bib['REFWORKS_LINK'] = voyager.get_refworks_link(bib)
+    except:
+        bib['REFWORKS_LINK'] = ''
+    # get_holdings leaves ILLIAD_LINK empty when ILL doesn't apply
+    if bib.get('ILLIAD_LINK'):
+        bib['ILLIAD_LINK'] = voyager.get_illiad_link(bib)
+
+
+def _item_data(bibid):
+    bib = voyager.get_bib_data(bibid)
+    if not bib:
+        return None
+    # Ensure bib data is ours if possible
+    if not bib['LIBRARY_NAME'] == settings.PREF_LIB:
+        for alt_bib in bib['BIB_ID_LIST']:
+            if alt_bib['LIBRARY_NAME'] == settings.PREF_LIB:
+                return {'pref_bibid': alt_bib['BIB_ID']}
+    holdings = voyager.get_holdings(bib)
+    if holdings:
+        holdings = strip_bad_holdings(holdings)
+        show_ill_link = display_ill_link(holdings)
+        holdings = holdingsort(holdings)
+    else:
+        show_ill_link = False
+
+    # extract details for easy display in a separate tab
+    details = []
+    for name, display_name, specs in marc.mapping:
+        if name in bib and len(bib[name]) > 0:
+            details.append((display_name, bib[name]))
+    bibs = voyager.get_all_bibs(bib['BIB_ID_LIST'])
+    bib['RELATED_ISBN_LIST'] = list(set(voyager.get_related_isbns(bibs)))
+    return {'bib': bib, 'holdings': holdings,
+            'show_ill_link': show_ill_link, 'details': details}
+
+
 def item(request, bibid):
-    bib = None
     try:
-        bib = voyager.get_bib_data(bibid)
-        if not bib:
+        data = _cached_item('item', bibid, _item_data)
+        if not data:
             return render(request, '404.html', {'num': bibid,
                           'num_type': 'BIB ID'}, status=404)
-        bib['openurl'] = _openurl_dict(request)
-        bib['citation_json'] = citation_json(request)
-        # Ensure bib data is ours if possible
-        if not bib['LIBRARY_NAME'] == settings.PREF_LIB:
-            for alt_bib in bib['BIB_ID_LIST']:
-                if alt_bib['LIBRARY_NAME'] == settings.PREF_LIB:
-                    return item(request, alt_bib['BIB_ID'])
-        holdings = voyager.get_holdings(bib)
-        if holdings:
-            holdings = strip_bad_holdings(holdings)
-            show_ill_link = display_ill_link(holdings)
-            ours, theirs, shared = splitsort(callnumsort(enumsort(holdings)))
-            holdings = elecsort(holdsort(templocsort(availsort(ours)))) \
-                + elecsort(holdsort(templocsort(availsort(shared)))) \
-                + libsort(elecsort(holdsort(templocsort(availsort(theirs))),
-                                   rev=True))
-        else:
-            show_ill_link = False
-
-        # extract details for easy display in a separate tab
-        details = []
-        for name, display_name, specs in marc.mapping:
-            if name in bib and len(bib[name]) > 0:
-                details.append((display_name, bib[name]))
-        bibs = voyager.get_all_bibs(bib['BIB_ID_LIST'])
-        bib['RELATED_ISBN_LIST'] = list(set(voyager.get_related_isbns(bibs)))
+        if 'pref_bibid' in data:
+            return item(request, data['pref_bibid'])
+        bib = data['bib']
+        _add_request_data(request, bib)
         return render(request, 'item.html', {
             'bibid': bibid,
             'bib': bib,
-            'holdings': holdings,
+            'holdings': data['holdings'],
             'link': bib.get('LINK', [])[9:],
-            'show_ill_link': show_ill_link,
+            'show_ill_link': data['show_ill_link'],
             'non_wrlc_item': False,
-            'details': details,
+            'details': data['details'],
             'max_periodicals': settings.MAX_PERIODICALS,
         })
     except:
@@ -129,20 +165,28 @@ def _date_handler(obj):
     return obj.isoformat() if hasattr(obj, 'isoformat') else obj
 
 
-@cache_page(settings.ITEM_PAGE_CACHE_SECONDS)
+def _item_json_data(bibid):
+    bib_data = voyager.get_bib_data(bibid)
+    if not bib_data:
+        return None
+    bib_data['holdings'] = voyager.get_holdings(bib_data)
+    return bib_data
+
+
+def _json_response(request, bib_data):
+    _add_request_data(request, bib_data)
+    bib_encoded = unicode_data(bib_data)
+    return HttpResponse(json.dumps(bib_encoded, default=_date_handler,
+                        indent=2), content_type='application/json')
+
+
 def item_json(request, bibid, z3950='False', school=None):
     try:
-        bib_data = voyager.get_bib_data(bibid)
+        bib_data = _cached_item('item_json', bibid, _item_json_data)
         if not bib_data:
             return HttpResponse('{}', content_type='application/json',
                                 status=404)
-        bib_data['openurl'] = _openurl_dict(request)
-        bib_data['holdings'] = voyager.get_holdings(bib_data)
-        bib_data['openurl'] = _openurl_dict(request)
-        bib_data['citation_json'] = citation_json(request)
-        bib_encoded = unicode_data(bib_data)
-        return HttpResponse(json.dumps(bib_encoded, default=_date_handler,
-                            indent=2), content_type='application/json')
+        return _json_response(request, bib_data)
     except DatabaseError:
         logger.exception('unable to render bibid json: %s' % bibid)
         return error500(request)
@@ -204,17 +248,20 @@ def non_wrlc_item(request, num, num_type):
         bib['REFWORKS_LINK'] = ''
     bib['MICRODATA_TYPE'] = voyager.get_microdata_type(bib)
     holdings = []
-    # get free electronic book link from open library
+    # get free electronic book link from open library, trying each number
+    # at once but keeping the first one found in LCCN, ISBN, OCLC order
+    calls = []
     for numformat in ('LCCN', 'ISBN', 'OCLC'):
         if bib.get(numformat):
             if numformat == 'OCLC':
                 num = filter(lambda x: x.isdigit(), bib[numformat])
             else:
                 num = bib[numformat]
-            openlibhold = apis.openlibrary(num, numformat)
-            if openlibhold:
-                holdings.append(openlibhold)
-                break
+            calls.append((apis.openlibrary, (num, numformat)))
+    for openlibhold in apis.call_all(calls):
+        if openlibhold:
+            holdings.append(openlibhold)
+            break
     return render(request, 'item.html', {
                   'bibid': '',
                   'bib': bib,
@@ -225,67 +272,90 @@ def non_wrlc_item(request, num, num_type):
                   })
 
 
-@cache_page(settings.ITEM_PAGE_CACHE_SECONDS)
+def _z3950_item_data(bibid, lib):
+    bib = voyager.get_z3950_bib_data(bibid, lib)
+    if not bib:
+        return None
+    # Ensure bib data is ours if possible
+    if not bib['LIBRARY_NAME'] == settings.PREF_LIB:
+        for alt_bib in bib['BIB_ID_LIST']:
+            if alt_bib['LIBRARY_NAME'] == settings.PREF_LIB:
+                return {'pref_bibid': alt_bib['BIB_ID']}
+    holdings = voyager.get_holdings(bib, lib, False)
+    if holdings:
+        holdings = strip_bad_holdings(holdings)
+        holdings = holdingsort(holdings, locations=False)
+    return {'bib': bib, 'holdings': holdings}
+
+
+def _gtitem_data(gtbibid):
+    bibid = db.get_bibid_from_gtid(gtbibid)
+    if bibid:
+        return {'wrlc_bibid': bibid}
+    return _z3950_item_data(gtbibid[1:], 'GT')
+
+
+def _z3950_item_page(request, data, num):
+    if not data:
+        return render(request, '404.html', {'num': num,
+                      'num_type': 'BIB ID'}, status=404)
+    if 'wrlc_bibid' in data:
+        return redirect('item', bibid=data['wrlc_bibid'])
+    if 'pref_bibid' in data:
+        return item(request, data['pref_bibid'])
+    bib = data['bib']
+    _add_request_data(request, bib)
+    try:
+        link = bib.get('LINK', [])[9:]
+    except:
+        link = ''
+    return render(request, 'item.html', {
+        'bibid': None,
+        'bib': bib,
+        'holdings': data['holdings'],
+        'link': link,
+        'show_wrlc_link': False,
+        'non_wrlc_item': True
+    })
+
+
 def gtitem(request, gtbibid):
     try:
-        bibid = db.get_bibid_from_gtid(gtbibid)
-        if bibid:
-            return redirect('item', bibid=bibid)
-        else:
-            bib = voyager.get_z3950_bib_data(gtbibid[1:], 'GT')
-            if bib is None:
-                return render(request, '404.html', {'num': gtbibid,
-                              'num_type': 'BIB ID'}, status=404)
-            bib['openurl'] = _openurl_dict(request)
-            bib['citation_json'] = citation_json(request)
-            # Ensure bib data is ours if possible
-            if not bib['LIBRARY_NAME'] == settings.PREF_LIB:
-                for alt_bib in bib['BIB_ID_LIST']:
-                    if alt_bib['LIBRARY_NAME'] == settings.PREF_LIB:
-                        return item(request, alt_bib['BIB_ID'])
-            holdings = voyager.get_holdings(bib, 'GT', False)
-            if holdings:
-                holdings = strip_bad_holdings(holdings)
-                show_wrlc_link = False
-                ours, theirs, shared = splitsort(callnumsort(enumsort(
-                    holdings)))
-                holdings = elecsort(availsort(ours)) \
-                    + elecsort(availsort(shared)) \
-                    + libsort(elecsort(availsort(theirs), rev=True))
-            return render(request, 'item.html', {
-                'bibid': bibid,
-                'bib': bib,
-                'holdings': holdings,
-                'link': bib.get('LINK', [])[9:],
-                'show_wrlc_link': show_wrlc_link,
-                'non_wrlc_item': True
-            })
-        return render(request, '404.html', {'num': gtbibid,
-                      'num_type': 'Georgetown BIB ID'}, status=404)
+        data = _cached_item('gtitem', gtbibid, _gtitem_data)
+        return _z3950_item_page(request, data, gtbibid)
     except DatabaseError:
         logger.exception('unable to render gtbibid: %s' % gtbibid)
         return error500(request)
 
 
-@cache_page(settings.ITEM_PAGE_CACHE_SECONDS)
+def _z3950_item_json_data(bibid, lib):
+    bib_data = voyager.get_z3950_bib_data(bibid, lib)
+    if not bib_data:
+        return None
+    bib_data['holdings'] = voyager.get_holdings(bib_data, lib, False)
+    return bib_data
+
+
+def _gtitem_json_data(gtbibid):
+    bibid = db.get_bibid_from_gtid(gtbibid)
+    if bibid:
+        return {'wrlc_bibid': bibid}
+    return _z3950_item_json_data('b' + gtbibid[1:], 'GT')
+
+
+def _z3950_item_json(request, bib_data):
+    if not bib_data:
+        return HttpResponse('{}', content_type='application/json',
+                            status=404)
+    if 'wrlc_bibid' in bib_data:
+        return redirect('item_json', bibid=bib_data['wrlc_bibid'])
+    return _json_response(request, bib_data)
+
+
 def gtitem_json(request, gtbibid):
     try:
-        bibid = db.get_bibid_from_gtid(gtbibid)
-        if bibid:
-            return redirect('item_json', bibid=bibid)
-        else:
-            bib_data = voyager.get_z3950_bib_data('b' + gtbibid[1:], 'GT')
-            if not bib_data:
-                return HttpResponse('{}', content_type='application/json',
-                                    status=404)
-            bib_data['holdings'] = voyager.get_holdings(bib_data, 'GT', False)
-            bib_data['openurl'] = _openurl_dict(request)
-            bib_data['citation_json'] = citation_json(request)
-            bib_encoded = unicode_data(bib_data)
-            return HttpResponse(json.dumps(bib_encoded, default=_date_handler,
-                                           indent=2),
-                                content_type='application/json')
-        raise Http404
+        bib_data = _cached_item('gtitem_json', gtbibid, _gtitem_json_data)
+        return _z3950_item_json(request, bib_data)
     except DatabaseError:
         logger.exception('unable to render gtbibid json: %s' % gtbibid)
         return error500(request)
@@ -299,13 +369,13 @@ def unicode_data(bib_data):
                 bib_encoded[k] = unicode(v, 'iso-8859-1')
             else:
                 bib_encoded[k] = v
-        elif isinstance(v, dict):
+        elif isinstance(v, (dict, Record)):
             bib_encoded[k] = unicode_data(v)
         elif isinstance(v, list):
             rows = []
             row = None
             for item in v:
-                if isinstance(item, dict):
+                if isinstance(item, (dict, Record)):
                     row = unicode_data(item)
                 elif isinstance(item, basestring):
                     if not isinstance(item, unicode):
@@ -319,70 +389,33 @@ def unicode_data(bib_data):
     return bib_encoded
 
 
-@cache_page(settings.ITEM_PAGE_CACHE_SECONDS)
+def _gmitem_data(gmbibid):
+    bibid = db.get_bibid_from_gmid(gmbibid)
+    if bibid:
+        return {'wrlc_bibid': bibid}
+    return _z3950_item_data(gmbibid, 'GM')
+
+
 def gmitem(request, gmbibid):
     try:
-        bibid = db.get_bibid_from_gmid(gmbibid)
-        if bibid:
-            return redirect('item', bibid=bibid)
-        else:
-            bib = voyager.get_z3950_bib_data(gmbibid, 'GM')
-            if not bib:
-                return render(request, '404.html', {'num': gmbibid,
-                              'num_type': 'BIB ID'}, status=404)
-            bib['openurl'] = _openurl_dict(request)
-            bib['citation_json'] = citation_json(request)
-            # Ensure bib data is ours if possible
-            if not bib['LIBRARY_NAME'] == settings.PREF_LIB:
-                for alt_bib in bib['BIB_ID_LIST']:
-                    if alt_bib['LIBRARY_NAME'] == settings.PREF_LIB:
-                        return item(request, alt_bib['BIB_ID'])
-            holdings = voyager.get_holdings(bib, 'GM', False)
-            if holdings:
-                holdings = strip_bad_holdings(holdings)
-                show_wrlc_link = False
-                ours, theirs, shared = splitsort(callnumsort(enumsort(
-                    holdings)))
-                holdings = elecsort(availsort(ours)) \
-                    + elecsort(availsort(shared)) \
-                    + libsort(elecsort(availsort(theirs), rev=True))
-                try:
-                    linkval = bib.get('LINK', [])[9:]
-                except:
-                    linkval = ''
-            return render(request, 'item.html', {
-                'bibid': bibid,
-                'bib': bib,
-                'holdings': holdings,
-                'link': linkval,
-                'show_wrlc_link': show_wrlc_link,
-                'non_wrlc_item': True
-            })
-        return render(request, '404.html', {'num': gmbibid,
-                      'num_type': 'George Mason BIB ID'}, status=404)
+        data = _cached_item('gmitem', gmbibid, _gmitem_data)
+        return _z3950_item_page(request, data, gmbibid)
     except DatabaseError:
         logger.exception('unable to render gmbibid: %s' % gmbibid)
         return error500(request)
 
 
-@cache_page(settings.ITEM_PAGE_CACHE_SECONDS)
+def _gmitem_json_data(gmbibid):
+    bibid = db.get_bibid_from_gmid(gmbibid)
+    if bibid:
+        return {'wrlc_bibid': bibid}
+    return _z3950_item_json_data(gmbibid, 'GM')
+
+
 def gmitem_json(request, gmbibid):
     try:
-        bibid = voyager.get_bibid_from_gmid(gmbibid)
-        if bibid:
-            return redirect('item_json', bibid=bibid)
-        else:
-            bib_data = voyager.get_z3950_bib_data(gmbibid, 'GM')
-            if not bib_data:
-                return HttpResponse('{}', content_type='application/json',
-                                    status=404)
-            bib_data['holdings'] = voyager.get_holdings(bib_data, 'GM', False)
-            bib_data['openurl'] = _openurl_dict(request)
-            bib_data['citation_json'] = citation_json(request)
-            bib_encoded = unicode_data(bib_data)
-            return HttpResponse(json.dumps(bib_encoded, default=_date_handler,
-                                indent=2), content_type='application/json')
-        raise Http404
+        bib_data = _cached_item('gmitem_json', gmbibid, _gmitem_json_data)
+        return _z3950_item_json(request, bib_data)
     except DatabaseError:
         logger.exception('unable to render gmbibid json: %s' % gmbibid)
         return error500(request)
@@ -525,29 +558,28 @@ def search(request):
 
     if fmt == "html":
         kwargs['for_template'] = True
+    # just the ids and offers, for clients that only check availability
+    elif fmt == "json" and params.get('brief'):
+        kwargs['brief'] = True
 
-    # catch and retry up to MAX_ATTEMPTS times if we get errors
-    # from the Summon API?
-    retries = 0
-    while True:
-        try:
-            search_results = api.search(q, **kwargs)
-            break
-        except requests.HTTPError as error:
-            retries += 1
-            if retries <= settings.SER_SOL_API_MAX_ATTEMPTS:
-                time.sleep(1)
-                continue
-            else:
-                logger.exception('unable to search Summon (3 tries): %s' %
-                                 error)
-                return error500(request)
+    # cached, and retried with backoff on errors from the Summon API
+    try:
+        search_results = api.cached_search(q, **kwargs)
+    except requests.HTTPError as error:
+        logger.exception('unable to search Summon (%s tries): %s' %
+                         (settings.SER_SOL_API_MAX_ATTEMPTS + 1, error))
+        return error500(request)
+
+    # get the next page ready while this one is read, unless its offers
+    # (judging by this page's) won't fit in one availability request
+    if page < max_pages and page * page_size < \
+            search_results.get('totalResults', 0) and \
+            len(_offer_bibids(search_results)) <= MAX_AVAILABILITY_BIBIDS:
+        api.prefetch(request.META.get('REMOTE_ADDR'), q,
+                     **dict(kwargs, pn=page + 1))
 
     if not raw:
-        search_results = _remove_facets(search_results)
-        search_results = _reorder_facets(search_results)
-        search_results = _remove_active_facets(request, search_results)
-        search_results = _format_facets(request, search_results)
+        search_results = _process_facets(request, search_results)
 
     # json-ld
     if fmt == "json":
@@ -643,10 +675,37 @@ def _filter_by_pubdate(q, q_options):
     return new_q, new_q_options
 
 
+# most bibids a single availability request can ask for
+MAX_AVAILABILITY_BIBIDS = 100
+
+
+def _offer_bibids(search_results):
+    """
+    The distinct bibids of the offers in search results, which is what the
+    search page asks /availability about.
+    """
+    return set([offer['serialNumber']
+                for item in search_results.get('results', [])
+                for offer in item.get('offers', [])
+                if offer.get('serialNumber')])
+
+
 def availability(request):
     """
-    API call for getting the availability for a particular bibid.
+    API call for getting the availability for a particular bibid, or for
+    a comma separated list of bibids, in which case the response maps each
+    bibid to its availability.
     """
+    bibids = request.GET.get('bibids')
+    if bibids:
+        bibids = [b for b in bibids.split(',') if b]
+        if len(set(bibids)) > MAX_AVAILABILITY_BIBIDS:
+            return HttpResponseBadRequest(
+                'at most %s bibids at once' % MAX_AVAILABILITY_BIBIDS)
+        return HttpResponse(
+            json.dumps(db.get_availabilities(bibids), indent=2),
+            content_type='application/json'
+        )
     bibid = request.GET.get('bibid')
     if not bibid:
         raise Http404
@@ -676,74 +735,72 @@ def tips(request):
     return render(request, 'tips.html', {'title': 'search tips'})
 
 
-def _remove_facets(search_results):
-    to_delete = [
-        'ContentType:Journal Article',
-        'Genre:electronic books',
-        'ContentType:Book Chapter',
-        'ContentType:Book Review'
-    ]
-    for facet in search_results['facets']:
-        new_counts = []
-        for count in facet['counts']:
-            s = "%s:%s" % (facet['name'], count['name'])
-            if s not in to_delete:
-                new_counts.append(count)
-        facet['counts'] = new_counts
-    return search_results
+# facet values never offered
+REMOVED_FACETS = set([
+    'ContentType:Journal Article',
+    'Genre:electronic books',
+    'ContentType:Book Chapter',
+    'ContentType:Book Review'
+])
 
+# facets can come back in different order from summon, so they are always
+# displayed in this order
+FACETS_ORDER = ['Institution', 'Library', 'ContentType', 'Author',
+                'Discipline', 'SubjectTerms', 'TemporalSubjectTerms',
+                'GeographicLocations', 'Genre', 'Language']
 
-def _remove_active_facets(request, search_results):
-    facets = request.GET.getlist('facet', [])
-    for facet in search_results['facets']:
-        new_counts = []
-        for count in facet['counts']:
-            if "%s:%s" % (facet['name'], count['name']) not in facets:
-                new_counts.append(count)
-        facet['counts'] = new_counts
-    return search_results
-
+# friendly labels for some API facet names
+FACET_LABELS = {
+    'SubjectTerms': 'Subjects',
+    'TemporalSubjectTerms': 'Time Period',
+    'GeographicLocations': 'Region',
+}
 
-def _reorder_facets(search_results):
-    # facets can come back in different order from summon
-    # this function makes sure we always display them in the same order
-    facets_order = ['Institution', 'Library', 'ContentType', 'Author',
-                    'Discipline', 'SubjectTerms', 'TemporalSubjectTerms',
-                    'GeographicLocations', 'Genre', 'Language']
-    new_facets = []
-    for facet_name in facets_order:
-        for facet in search_results['facets']:
-            # only add facet if there are more than one values for it
-            if facet['name'] == facet_name and len(facet['counts']) > 1:
-                new_facets.append(facet)
-    search_results['facets'] = new_facets
-    return search_results
+# stands in for the facet value while the facet urls' query string is built
+FACET_PLACEHOLDER = '\x00facet\x00'
 
 
-def _format_facets(request, search_results):
-    # massage facets a bit before passing them off to the template
-    # to make them easier to process there
+def _process_facets(request, search_results):
+    """
+    Massage facets a bit before passing them off to the template: drop
+    unwanted and already active values and facets with a single value,
+    put the facets in display order, and give each value a url that
+    activates it. The query string for those urls is built once, and each
+    value is dropped into it.
+    """
+    active = set(request.GET.getlist('facet', []))
+    fq = request.GET.copy()
+    fq.setlist('facet', fq.getlist('facet') + [FACET_PLACEHOLDER])
+    fq['page'] = 1
+    head, tail = fq.urlencode().split(
+        urllib.quote_plus(FACET_PLACEHOLDER), 1)
+    by_name = {}
     for f in search_results['facets']:
-        for fc in f['counts']:
-
-            # add a url property to each facet to activate facet
-            fq = request.GET.copy()
-            fq.update({'facet': "%s:%s" % (f['name'], fc['name'])})
-            fq['page'] = 1
-            fc['url'] = fq.urlencode()
-            fc['name'] = _normalize_facet_name(f['name'], fc['name'])
-
-        # add spaces to the facet name: "ContentType" -> "Content Type"
-        f['name'] = re.sub(r'(.)([A-Z])', r'\1 \2', f['name'])
-
-        # convert certain API facet names -> friendly labels
-        if f['name'] == 'Subject Terms':
-            f['name'] = 'Subjects'
-        if f['name'] == 'Temporal Subject Terms':
-            f['name'] = 'Time Period'
-        if f['name'] == 'Geographic Locations':
-            f['name'] = 'Region'
-
+        by_name.setdefault(f['name'], []).append(f)
+    facets = []
+    for name in FACETS_ORDER:
+        for f in by_name.get(name, []):
+            counts = []
+            for fc in f['counts']:
+                value = "%s:%s" % (name, fc['name'])
+                if value not in REMOVED_FACETS:
+                    counts.append((value, fc))
+            # only show a facet if there is more than one value for it
+            if len(counts) < 2:
+                continue
+            f['counts'] = []
+            for value, fc in counts:
+                if value in active:
+                    continue
+                fc['url'] = head + urllib.quote_plus(
+                    force_bytes(value, fq.encoding)) + tail
+                fc['name'] = _normalize_facet_name(name, fc['name'])
+                f['counts'].append(fc)
+            # add spaces to the facet name: "ContentType" -> "Content Type"
+            f['name'] = FACET_LABELS.get(name) or \
+                re.sub(r'(.)([A-Z])', r'\1 \2', name)
+            facets.append(f)
+    search_results['facets'] = facets
     return search_results
 
 
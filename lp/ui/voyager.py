@@ -1,4 +1,3 @@
-import copy
 import difflib
 import re
 import urllib
@@ -6,15 +5,19 @@ import urlparse
 
 import pycountry
 import pymarc
-from PyZ3950 import zoom
 
 from django.conf import settings
-from django.db import connection
 from django.utils.encoding import smart_str, DjangoUnicodeDecodeError
 
 from ui import apis
+from ui import clusters
 from ui import marc
+from ui import parallel
 from ui import z3950
+from ui.cache import TieredCache
+from ui.db import in_binds, IN_LIST_BUCKETS
+from ui.pool import connection
+from ui.records import Availability, ElectronicData, Holding, Item
 from ui.templatetags.launchpad_extras import cjk_info
 from ui.templatetags.launchpad_extras import clean_isbn
 from ui.templatetags.launchpad_extras import clean_lccn
@@ -25,6 +28,43 @@ from django.utils.http import urlquote
 GW_LIBRARY_IDS = [7, 11, 18, 21]
 
 
+def cache_settings():
+    conf = {
+        'BIB_TIMEOUT': 60 * 60 * 24,
+        'STATUS_TIMEOUT': 60 * 5,
+        'NEGATIVE_TIMEOUT': 60 * 5,
+        'LOCAL_SIZE': 1000,
+    }
+    conf.update(getattr(settings, 'VOYAGER_CACHE', {}))
+    return conf
+
+
+# bib data with its related bibs, holdings lists and mfhd tags change
+# rarely and are kept for BIB_TIMEOUT; item circulation rows and recall
+# counts are kept for STATUS_TIMEOUT, so refreshing an item page only
+# reads those again. Keyed by (kind, id).
+cache = TieredCache('voyager', size=cache_settings()['LOCAL_SIZE'],
+                    negative_timeout=cache_settings()['NEGATIVE_TIMEOUT'])
+
+
+def _cached_many(kind, ids, fetch, timeout, default=None):
+    """
+    Returns {id: value} for ids, calling fetch(ids) once for those not
+    already cached and caching each one's value (default when fetch
+    found nothing) under (kind, id).
+    """
+    ids = list(set(ids))
+    found = cache.get_many([(kind, i) for i in ids])
+    results = dict([(key[1], value) for key, value in found.items()])
+    missing = [i for i in ids if i not in results]
+    if missing:
+        fetched = fetch(missing)
+        for i in missing:
+            results[i] = fetched.get(i, default)
+            cache.set((kind, i), results[i], timeout)
+    return dict([(i, v) for i, v in results.items() if v != default])
+
+
 def _make_dict(cursor, first=False):
     desc = cursor.description
     mapped = [
@@ -45,29 +85,25 @@ def _make_dict(cursor, first=False):
     return mapped
 
 
-def get_added_authors(bib):
+# subfields making up the 700H/710H/711H headings in bib_index
+ADDED_AUTHOR_SUBFIELDS = {
+    '700': ('a', 'b', 'c', 'd', 'q'),
+    '710': ('a', 'b', 'c', 'd', 'n'),
+    '711': ('a', 'c', 'd', 'e', 'n', 'q'),
+}
+
+
+def get_added_authors(bib, rec):
     """Starting with the main author entry, build up a list of all authors."""
-    query = """
-SELECT bib_index.display_heading AS author
-FROM bib_index
-WHERE bib_index.bib_id = %s
-AND bib_index.index_code IN ('700H', '710H', '711H')"""
-    cursor = connection.cursor()
-    cursor.execute(query, [bib['BIB_ID']])
     authors = []
     if bib['AUTHOR']:
         authors.append(bib['AUTHOR'])
-    
-    while True:
-        try:
-            row = cursor.fetchone()
-            if row:
-                authors.append(smart_str(row[0]))
-            else:
-                break
-        except DjangoUnicodeDecodeError:
-            continue 
- 
+    for field in rec.get_fields(*sorted(ADDED_AUTHOR_SUBFIELDS)):
+        heading = ' '.join(
+            field.get_subfields(*ADDED_AUTHOR_SUBFIELDS[field.tag]))
+        if heading:
+            authors.append(_marc_str(heading))
+
     # trim whitespace
     if not authors:
         return []
@@ -83,6 +119,52 @@ AND bib_index.index_code IN ('700H', '710H', '711H')"""
     return authors
 
 
+def _marc_str(value):
+    # raw record bytes may not be utf-8, unlike the rest of the bib
+    try:
+        value.decode('utf-8')
+        return value
+    except UnicodeDecodeError:
+        return value.decode('iso-8859-1').encode('utf-8')
+
+
+def _subfield_pairs(field):
+    return zip(field.subfields[0::2], field.subfields[1::2])
+
+
+def _marc_field(rec, tag, code='', occurrence=1):
+    """
+    What wrlcdb.GetMarcField returns for a field of a parsed record:
+    'TAG:II:$cvalue' for subfield c, every subfield when code is empty and
+    an empty string when the record has no such field.
+    """
+    fields = rec.get_fields(tag)
+    if len(fields) < occurrence:
+        return ''
+    field = fields[occurrence - 1]
+    if code:
+        pairs = [(c, v) for c, v in _subfield_pairs(field) if c == code][:1]
+    else:
+        pairs = _subfield_pairs(field)
+    if not pairs:
+        return ''
+    value = '%s:%s:%s' % (tag, ''.join(field.indicators),
+                          ''.join(['$%s%s' % pair for pair in pairs]))
+    return _marc_str(value.rstrip())
+
+
+def _marc_880(rec):
+    """
+    The linked 880 fields, as wrlcdb.GetAllBibTag returns them for cjk_info:
+    the field each one links to, a space and its text, separated by ' // '.
+    """
+    fields = []
+    for field in rec.get_fields('880'):
+        text = ' '.join([v for c, v in _subfield_pairs(field) if c != '6'])
+        fields.append('%s %s' % (field['6'] or '', text))
+    return _marc_str(' // '.join(fields)) if fields else None
+
+
 def get_all_bibs(bibids):
     bibs = []
     for bib in bibids:
@@ -94,7 +176,7 @@ def get_marc_blob(bibid):
     query = """
 SELECT wrlcdb.getBibBlob(%s) AS marcblob
 from bib_master"""
-    cursor = connection.cursor()
+    cursor = connection.cursor('single')
     cursor.execute(query, [bibid])
     row = cursor.fetchone()
     raw_marc = str(row[0])
@@ -102,62 +184,96 @@ from bib_master"""
     return rec
 
 
-def get_bib_data(bibid, expand_ids=True, exclude_names=False):
+def get_marc_blobs(bibids):
+    """
+    Raw MARC21 strings for a list of bibids, keyed by bibid. Bibids without
+    a record are left out.
+    """
     query = """
+SELECT bib_id, wrlcdb.getBibBlob(bib_id) AS marcblob
+FROM bib_master
+WHERE bib_id IN (%s)"""
+    blobs = {}
+    cursor = connection.cursor()
+    # keep the IN lists within the largest bucket; Oracle refuses more
+    # than 1000 values in one list anyway
+    size = IN_LIST_BUCKETS[-1]
+    for i in range(0, len(bibids), size):
+        idclause, idargs = in_binds(bibids[i:i + size])
+        cursor.execute(query % idclause, idargs)
+        for bibid, blob in cursor.fetchall():
+            if blob is not None:
+                blobs[bibid] = str(blob)
+    return blobs
+
+
+def get_bib_data(bibid, expand_ids=True, exclude_names=False):
+    """
+    Bib data for a voyager bibid, through the voyager cache. Returns None
+    when there is no such unsuppressed bib.
+    """
+    return cache.get_or_set(
+        ('bib', str(bibid), expand_ids, exclude_names),
+        lambda: _fetch_bib_data(bibid, expand_ids, exclude_names),
+        cache_settings()['BIB_TIMEOUT'])
+
+
+def _fetch_bib_data(bibid, expand_ids=True, exclude_names=False):
+    # one round trip for the indexed bib_text columns and the marc record;
+    # everything else is read from the record here rather than by wrlcdb
+    # functions that each parse it again
+    if exclude_names:
+        query = """
+SELECT bib_text.bib_id, bib_format, library_name"""
+    else:
+        query = """
 SELECT bib_text.bib_id, lccn,
        edition, isbn, issn, network_number AS OCLC,
        pub_place, imPrint, bib_format,
        language, library_name, publisher_date,
-       RTRIM(wrlcdb.GetMarcField(%s,0,0,'856','','u',1)) AS LINK,
-       RTRIM(wrlcdb.GetMarcField(%s,0,0,'856','','z',1)) AS MESSAGE,
-       wrlcdb.GetAllBibTag(%s, '880', 1) AS CJK_INFO,
-       wrlcdb.GetBibTag(%s, '006') AS MARC006,
-       wrlcdb.GetBibTag(%s, '007') AS MARC007,
-       wrlcdb.GetBibTag(%s, '008') AS MARC008"""
-    if not exclude_names:
-        query += """
-,title, author, publisher,
-RTRIM(wrlcdb.GetMarcField(%s,0,0,'245','','',1)) AS TITLE_ALL
-        """
-    query += """
+       title, author, publisher"""
+    query += """,
+       wrlcdb.getBibBlob(bib_text.bib_id) AS MARCBLOB
 FROM bib_text, bib_master, library
 WHERE bib_text.bib_id=%s
 AND bib_text.bib_id=bib_master.bib_id
 AND bib_master.library_id=library.library_id
 AND bib_master.suppress_in_opac='N'"""
-    cursor = connection.cursor()
-    paramcount = 8 if not exclude_names else 7
-    cursor.execute(query, [bibid] * paramcount)
-    rec = get_marc_blob(bibid)
-    bib = {}
+    cursor = connection.cursor('single')
     try:
-        if exclude_names:
-            bib['TITLE'] = rec.title()
-            bib['AUTHOR'] = rec.author()
-            bib['PUBLISHER'] = rec.publisher()
-            title_fields = rec.get_fields('245')
-            bib['LIBRARY_NAME'] = get_library_name(bibid)
-            bib['TITLE_ALL'] = ''
-            bib['BIB_FORMAT'] = ''
-            bib['BIB_ID'] = bibid
-            for title in title_fields:
-                bib['TITLE_ALL'] += title.format_field().decode('iso-8859-1')\
-                    .encode('utf-8')
-        else:
-            bib = _make_dict(cursor, first=True)
+        cursor.execute(query, [bibid])
+        bib = _make_dict(cursor, first=True)
     except DjangoUnicodeDecodeError:
-        return get_bib_data(bibid=bibid, expand_ids=expand_ids,
-                            exclude_names=True)
+        if exclude_names:
+            raise
+        return _fetch_bib_data(bibid=bibid, expand_ids=expand_ids,
+                               exclude_names=True)
     # if bib is empty, there's no match -- return immediately
     if not bib:
         return None
+    rec = pymarc.record.Record(data=str(bib.pop('MARCBLOB')))
+    if exclude_names:
+        bib['TITLE'] = rec.title()
+        bib['AUTHOR'] = rec.author()
+        bib['PUBLISHER'] = rec.publisher()
+        bib['TITLE_ALL'] = ''
+        for title in rec.get_fields('245'):
+            bib['TITLE_ALL'] += title.format_field().decode('iso-8859-1')\
+                .encode('utf-8')
+    else:
+        bib['TITLE_ALL'] = _marc_field(rec, '245')
+    bib['LINK'] = _marc_field(rec, '856', 'u')
+    bib['MESSAGE'] = _marc_field(rec, '856', 'z')
+    bib['CJK_INFO'] = _marc_880(rec)
+    for tag in ('006', '007', '008'):
+        bib['MARC' + tag] = rec[tag].value() if rec[tag] else None
     if bib.get('LCCN'):
         bib['LCCN'] = clean_lccn(bib['LCCN'])
     # ensure the NETWORK_NUMBER is OCLC
     if not bib.get('OCLC', '') or not _is_oclc(bib.get('OCLC', '')):
         bib['OCLC'] = ''
     # get additional authors; main entry is AUTHOR, all are AUTHORS
-    bib['AUTHORS'] = get_added_authors(bib)
+    bib['AUTHORS'] = get_added_authors(bib, rec)
     # split up the 880 (CJK) fields/values if available
     if bib.get('CJK_INFO', ''):
         bib['CJK_INFO'] = cjk_info(bib['CJK_INFO'])
@@ -190,7 +306,8 @@ AND bib_master.suppress_in_opac='N'"""
                     bib['DISPLAY_%s_LIST' % num_type.upper()] = list(disp_set)
                     # use std nums to get related bibs
                     new_bibids = get_related_bibids(norm, num_type,
-                                                    bib.get('TITLE', ''))
+                                                    bib.get('TITLE', ''),
+                                                    bib['BIB_ID'])
                     for nb in new_bibids:
                         if nb['BIB_ID'] not in [x['BIB_ID'] for x in bibids]:
                             bibids.append(nb)
@@ -231,14 +348,15 @@ SELECT bib_index.bib_id, bib_master.library_id, library.library_name,
     bib_index.normal_heading, bib_index.display_heading
 FROM bib_index, bib_master, library
 WHERE bib_index.index_code IN (%s)
-AND bib_index.normal_heading = '%s'
+AND bib_index.normal_heading = %%s
 AND bib_index.bib_id=bib_master.bib_id
 AND bib_master.library_id=library.library_id
 AND bib_master.suppress_in_opac = 'N'
 AND ROWNUM < 12"""
     cursor = connection.cursor()
-    query = query % (_in_clause(settings.INDEX_CODES[num_type]), num)
-    cursor.execute(query, [])
+    indexclause, indexargs = in_binds(settings.INDEX_CODES[num_type])
+    query = query % indexclause
+    cursor.execute(query, indexargs + [num])
     bibs = _make_dict(cursor)
     if num_type == 'oclc':
         bibs = [b for b in bibs if b['NORMAL_HEADING'] != b['DISPLAY_HEADING']]
@@ -254,7 +372,7 @@ SELECT library_name
 FROM bib_master, library
 WHERE bib_master.bib_id = %s
 AND bib_master.library_id=library.library_id"""
-    cursor = connection.cursor()
+    cursor = connection.cursor('single')
     cursor.execute(query, [bibid])
     result = _make_dict(cursor)
     return result[0]['LIBRARY_NAME']
@@ -265,7 +383,7 @@ SELECT Count(hold_recall_items.item_id) AS recalls
 FROM hold_recall_items
 GROUP BY hold_recall_items.item_id
 HAVING hold_recall_items.item_id = %s """
-    cursor = connection.cursor()
+    cursor = connection.cursor('single')
     cursor.execute(query, [itemid])
     result = _make_dict(cursor)
     return result[0]['RECALLS'] if result else 0
@@ -280,15 +398,20 @@ def _normalize_num(num, num_type):
     return num
 
 
-def get_related_bibids(num_list, num_type, title):
+def _related_bibids_query(num_list, num_type):
+    """
+    The voyager query and args for get_related_bibids.
+    """
     query = [None] * 7
     query[0] = """
 SELECT DISTINCT bib_index.bib_id,
        bib_index.display_heading,
-       library.library_name
-FROM bib_index, library, bib_master
+       library.library_name,
+       bib_text.title
+FROM bib_index, library, bib_master, bib_text
 WHERE bib_index.bib_id=bib_master.bib_id
 AND bib_master.library_id=library.library_id
+AND bib_text.bib_id=bib_master.bib_id
 AND bib_master.suppress_in_opac='N'
 AND bib_index.index_code IN (%s)
 AND bib_index.normal_heading != 'OCOLC'"""
@@ -324,28 +447,37 @@ AND bib_index.normal_heading IN (
         )
     )
 ORDER BY bib_index.bib_id"""
-    indexclause = _in_clause(settings.INDEX_CODES[num_type])
-    numclause = _in_clause(num_list)
+    indexclause, indexargs = in_binds(settings.INDEX_CODES[num_type])
+    numclause, numargs = in_binds(num_list)
     likeclause1 = '%' + 'SET' + '%'
     likeclause2 = '%' + 'SER' + '%'
+    likeargs = [likeclause1, likeclause2]
     query[0] = query[0] % indexclause
     query[2] = query[2] % indexclause
     query[4] = query[4] % (indexclause, numclause)
     query = ''.join(query)
-    args = [likeclause1, likeclause2] * 3
-    cursor = connection.cursor()
-    cursor.execute(query, args)
-    results = _make_dict(cursor)
-    for row in results[:]:
-        if title is None:
-            title = ''
-        result = get_title(row['BIB_ID'])
-        new_title = result.get('TITLE', '')
-        # remove the holding if titles are different. No more than 8 chars
-        if new_title is None:
-            continue
-        if title[0:8].lower() != new_title[0:8].lower():
-            results.remove(row)
+    args = indexargs + likeargs + indexargs + likeargs + indexargs + \
+        numargs + likeargs
+    return query, args
+
+
+def get_related_bibids(num_list, num_type, title, bibid=None):
+    results = clusters.related(bibid, settings.INDEX_CODES[num_type],
+                               num_list, oclc=num_type == 'oclc', limit=11)
+    if results is None:
+        query, args = _related_bibids_query(num_list, num_type)
+        cursor = connection.cursor()
+        cursor.execute(query, args)
+        results = _make_dict(cursor)
+    else:
+        for row in results:
+            for k, v in row.items():
+                if isinstance(v, basestring):
+                    row[k] = v.strip()
+    # drop bibs whose titles differ within the first 8 characters
+    prefix = (title or '')[0:8].lower()
+    results = [row for row in results if row['TITLE'] is None or
+               row['TITLE'][0:8].lower() == prefix]
     output_keys = ('BIB_ID', 'LIBRARY_NAME')
     if num_type == 'oclc':
         return [dict([
@@ -362,12 +494,11 @@ SELECT bib_index.display_heading
     AND bib_index.index_code IN (%s)
     AND ROWNUM < 12
     ORDER BY bib_index.display_heading"""
-    indexclause = _in_clause(settings.INDEX_CODES['isbn'])
-    numclause = _in_clause(bibs)
+    indexclause, indexargs = in_binds(settings.INDEX_CODES['isbn'])
+    numclause, numargs = in_binds(bibs)
     cursor = connection.cursor()
-    #args = [numclause, indexclause]
     query = query % (numclause, indexclause)
-    cursor.execute(query, [])
+    cursor.execute(query, numargs + indexargs)
     results = cursor.fetchall()
     return [(clean_isbn(p[0])) for p in results]
 
@@ -376,7 +507,7 @@ def get_title(bibid):
     query = """
     SELECT TITLE FROM bib_text
     WHERE bib_text.bib_id = %s"""
-    cursor = connection.cursor()
+    cursor = connection.cursor('single')
     cursor.execute(query, [bibid])
     result = _make_dict(cursor, first=True)
     return result
@@ -388,7 +519,7 @@ SELECT normal_heading, display_heading
 FROM bib_index
 INNER JOIN bib_master ON bib_index.bib_id = bib_master.bib_id
 WHERE bib_index.index_code IN (%s)
-AND bib_index.bib_id = %s
+AND bib_index.bib_id = %%s
 AND bib_index.normal_heading != 'OCOLC'
 AND bib_master.suppress_in_opac='N'"""
     if num_type == 'oclc':
@@ -397,10 +528,14 @@ AND bib_index.normal_heading != bib_index.display_heading"""
     query = query + """
 AND ROWNUM < 12
 ORDER BY bib_index.normal_heading"""
-    query = query % (_in_clause(settings.INDEX_CODES[num_type]), bibid)
-    cursor = connection.cursor()
-    cursor.execute(query, [])
-    results = cursor.fetchall()
+    results = clusters.std_nums(bibid, settings.INDEX_CODES[num_type],
+                                oclc=num_type == 'oclc')
+    if results is None:
+        indexclause, indexargs = in_binds(settings.INDEX_CODES[num_type])
+        query = query % indexclause
+        cursor = connection.cursor()
+        cursor.execute(query, indexargs + [bibid])
+        results = cursor.fetchall()
     # cull out ISBNs for sets of books
     results = [pair for pair in results if 'SET' not in pair[0].upper()]
     if num_type == 'oclc':
@@ -434,14 +569,30 @@ AND bib_mfhd.bib_id = bib_master.bib_id
 AND bib_master.library_id=library.library_id
 ORDER BY library.library_name"""
     if bib_data.get('BIB_ID_LIST', []):
-        idclause = _in_clause([b['BIB_ID'] for b in bib_data['BIB_ID_LIST']])
+        idclause, idargs = in_binds(
+            [b['BIB_ID'] for b in bib_data['BIB_ID_LIST']])
     else:
-        idclause = "'%s'" % bib_data['BIB_ID']
+        idclause, idargs = in_binds([bib_data['BIB_ID']])
     query = query % idclause
-    cursor = connection.cursor()
+    mfhd_tags, mfhd_items, recalls = {}, {}, {}
     if not lib:
-        cursor.execute(query, [])
-        holdings = _make_dict(cursor)
+        def fetch_holdings():
+            cursor = connection.cursor()
+            cursor.execute(query, idargs)
+            return _make_dict(cursor)
+        holdings = [Holding(h) for h in
+                    cache.get_or_set(('holdings', tuple(idargs)),
+                                     fetch_holdings,
+                                     cache_settings()['BIB_TIMEOUT'])]
+        # load tags, items and recalls for every voyager mfhd in the
+        # cluster up front rather than querying once per holding
+        mfhd_ids = [h['MFHD_ID'] for h in holdings
+                    if h['LIBRARY_NAME'] not in ('GM', 'GT', 'DA')]
+        mfhd_tags = get_mfhd_tags(mfhd_ids)
+        mfhd_items = get_mfhd_items(mfhd_ids)
+        recalls = get_items_recalls([row['ITEM_ID']
+                                     for rows in mfhd_items.values()
+                                     for row in rows])
     if not translate_bib:
         holdings = init_z3950_holdings(bib_data['BIB_ID'], lib)
     illiad_link = get_illiad_link(bib_data)
@@ -452,6 +603,8 @@ ORDER BY library.library_name"""
         bib_data.update({'REFWORKS_LINK': ''})
     eligibility = False
     added_holdings = []
+    z3950_results = prefetch_z3950_holdings(holdings, bib_data,
+                                            translate_bib)
     for holding in holdings:
         HI_link = ''
         if (holding['LIBRARY_NAME'] == 'GM' or
@@ -461,9 +614,7 @@ ORDER BY library.library_name"""
                 continue
             else:
                 done.append(holding['BIB_ID'])
-            result = get_z3950_holdings(holding['BIB_ID'],
-                                        holding['LIBRARY_NAME'], 'bib',
-                                        '', bib_data, translate_bib)
+            result = z3950_results[holding['BIB_ID']]
             if len(result) > 0:
                 if (len(result[0]['items']) == 0 and
                         len(result[0]['mfhd']['marc856list']) == 0 and
@@ -480,8 +631,8 @@ ORDER BY library.library_name"""
             if len(result) == 0:
                 holding.update({'MFHD_DATA': {},
                                 'ITEMS': [],
-                                'AVAILABILITY': {},
-                                'ELECTRONIC_DATA': {}})
+                                'AVAILABILITY': Availability(),
+                                'ELECTRONIC_DATA': ElectronicData()})
                 holding['REMOVE'] = True
             if len(result) > 0:
                 if holding.get('AVAILABILITY', {}).get('PERMLOCATION', ''):
@@ -496,17 +647,19 @@ ORDER BY library.library_name"""
             if holding['LIBRARY_NAME'] == 'HI':
                 # check for eresource link on the bib linked to this holding
                 HI_link = get_himmelfarb_bib_and_link(holding['MFHD_ID'])
-            holding.update({'ELECTRONIC_DATA':
-                            get_electronic_data(holding['MFHD_ID']),
-                            'AVAILABILITY':
-                            get_items(holding['MFHD_ID'], first=True)})
-            holding.update({'MFHD_DATA': get_mfhd_data(holding['MFHD_ID']),
-                            'ITEMS': get_items(holding['MFHD_ID'])}),
+            # copy the preloaded rows, an mfhd can be attached to more
+            # than one bib in the cluster and each holding gets modified
+            tags = mfhd_tags.get(holding['MFHD_ID'], {})
+            rows = mfhd_items.get(holding['MFHD_ID'], [])
+            holding.update({'ELECTRONIC_DATA': _electronic_data(tags),
+                            'AVAILABILITY': Availability(rows[0] if rows
+                                                         else None)})
+            holding.update({'MFHD_DATA': _parse_mfhd_data(tags),
+                            'ITEMS': [Item(row) for row in rows]})
             if HI_link and not holding['ELECTRONIC_DATA']['LINK856U']:
                     holding['ELECTRONIC_DATA']['LINK856U'] = HI_link
                     HI_link = ''
         if holding.get('ITEMS', []):
-            i = 0
             for item in holding['ITEMS']:
                 if 'DUE' in item and item['DUE'] is not None:
                     item['ITEM_STATUS_DESC'] = 'DUE ' + item['DUE']
@@ -525,11 +678,9 @@ ORDER BY library.library_name"""
                 item['TEMPLOCATION'] = trim_item_temp_location(item)
                 # WRLC items have an id, check if there are recall notices 
                 if item['ITEM_ID'] is not 0:
-                    item['RECALLS'] = get_item_recalls(item['ITEM_ID'])
+                    item['RECALLS'] = recalls.get(item['ITEM_ID'], 0)
                 else:
                     item['RECALLS'] = 0
-                remove_duplicate_items(i, holding['ITEMS'])
-                i = i + 1
             holding['LIBRARY_FULL_NAME'] = \
                 holding['ITEMS'][0]['LIBRARY_FULL_NAME']
         holding.update({'ELIGIBLE': is_eligible(holding)})
@@ -550,7 +701,6 @@ ORDER BY library.library_name"""
     for item in added_holdings:
         holdings.append(item)
     for holding in holdings:
-        i = 0
         if holding.get('AVAILABILITY'):
             if holding['AVAILABILITY'].get('ITEM_STATUS_DESC'):
                 if holding['AVAILABILITY']['ITEM_STATUS_DESC'] == 'Charged':
@@ -561,18 +711,20 @@ ORDER BY library.library_name"""
         for item in holding.get('ITEMS', []):
             if item['ELIGIBLE'] is True:
                 eligibility = True
-            remove_duplicate_items(i, holding['ITEMS'])
-            i = i + 1
         if holding.get('ITEMS'):
-            for item in holding['ITEMS'][:]:
-                if 'REMOVE' in item:
-                    holding['ITEMS'].remove(item)
+            mark_duplicate_items(holding['ITEMS'])
+            holding['ITEMS'] = [item for item in holding['ITEMS']
+                                if 'REMOVE' not in item]
     if eligibility is False or bib_data['BIB_FORMAT'] == 'as':
         bib_data.update({'ILLIAD_LINK': illiad_link})
     else:
         bib_data.update({'ILLIAD_LINK': ''})
     holdings = correct_gt_holding(holdings)
-    # get 360Link API information where possible
+    # work out every 360Link, Open Library and HathiTrust lookup first so
+    # they can all run at once
+    calls = []
+    link_holdings = []
+    num = num_type = None
     for holding in holdings:
         holding['LinkResolverData'] = []
         links = holding.get('MFHD_DATA', {}).get('marc856list', [])
@@ -593,10 +745,10 @@ ORDER BY library.library_name"""
                         num = url[isbnindex + 5:]
                         stop = num.find('&')
                         num = num[:stop] if stop > -1 else num
-                if 'num' in locals():
-                    linkdata = apis.sersol360link(num, num_type)
-                    for ld in linkdata:
-                        holding['LinkResolverData'].append(ld)
+                # a link without a number reuses the last one found
+                if num is not None:
+                    calls.append((apis.sersol360link, (num, num_type)))
+                    link_holdings.append(holding)
     # get free electronic book link from open library and/or hathi trust
     # First, iterate through the holdings so far, look for an e-resource eg 14732552.
     # If none, then check for free  hathi trust or internet archive eg 2225666.
@@ -616,28 +768,34 @@ ORDER BY library.library_name"""
                     num = bib_data['NORMAL_ISBN_LIST'][0]
                 else:
                     num = bib_data[numformat]
-            
-            # Internet Archive / Open Library
-                openlibhold = apis.openlibrary(num, numformat)
-                title = ''
-                if openlibhold.get('MFHD_DATA', None):
-                    title = get_open_library_item_title(openlibhold['MFHD_DATA']
-                                                        ['marc856list'][0]['u'])
-                if openlibhold:
+                # Internet Archive / Open Library
+                calls.append((apis.openlibrary, (num, numformat)))
+                # HathiTrust. No need to check title, and OCLC match is
+                # sufficient.
+                if numformat == 'OCLC':
+                    calls.append((apis.hathitrust, (num, numformat)))
+    results = apis.call_all(calls)
+    for holding, linkdata in zip(link_holdings, results):
+        for ld in linkdata or []:
+            holding['LinkResolverData'].append(ld)
+    for (func, args), result in zip(calls, results)[len(link_holdings):]:
+        if func == apis.openlibrary:
+            openlibhold = result or {}
+            title = ''
+            if openlibhold.get('MFHD_DATA', None):
+                title = get_open_library_item_title(openlibhold['MFHD_DATA']
+                                                    ['marc856list'][0]['u'])
+            if openlibhold:
                 # Compare the title. Can't trust Open Library match.
-                    bib_title = bib_data['TITLE'][0:10].lower()
-                    open_title = title[0:10].lower()
-                    ratio = difflib.SequenceMatcher(None, bib_title,
-                                                    open_title).ratio()
-                    if ratio >= settings.TITLE_SIMILARITY_RATIO:
-                        holdings.append(openlibhold)
-                    
-            # HathiTrust. No need to check title, and OCLC match is sufficient. 
-                if numformat == 'OCLC': 
-                    hathitrusthold = apis.hathitrust(num, numformat)
-                    if hathitrusthold:
-                        holdings.append(hathitrusthold)
-    
+                bib_title = bib_data['TITLE'][0:10].lower()
+                open_title = title[0:10].lower()
+                ratio = difflib.SequenceMatcher(None, bib_title,
+                                                open_title).ratio()
+                if ratio >= settings.TITLE_SIMILARITY_RATIO:
+                    holdings.append(openlibhold)
+        elif result:
+            holdings.append(result)
+
     for holding in holdings:
         # consider putting DDA info in a dictionary
         dda_isbn = bib_data.get('ISBN', '')
@@ -661,7 +819,7 @@ def get_open_library_item_title(link):
 
 def init_z3950_holdings(bibid, lib):
     holdings = []
-    data = {}
+    data = Holding()
     data['MFHD_ID'] = ''
     data['LIBRARY_NAME'] = lib
     data['LOCATION_NAME'] = ''
@@ -676,9 +834,9 @@ def init_z3950_holdings(bibid, lib):
 def get_additional_holdings(result, holding):
     i = 1
     added_holdings = []
-    item = {}
     while i < len(result):
-        item = copy.deepcopy(holding)
+        # a shallow copy is enough, the nested data is all replaced below
+        item = holding.copy()
         item.update({'MFHD_DATA': result[i]['mfhd'],
                      'ITEMS': result[i]['items'],
                      'ELECTRONIC_DATA': result[i]['electronic'],
@@ -707,6 +865,23 @@ def get_additional_holdings(result, holding):
     return added_holdings
 
 
+def mark_duplicate_items(items):
+    """
+    Sets REMOVE on the items that lose out to another copy of the same
+    ITEM_ID. Items are grouped by ITEM_ID first, so only copies of one
+    item get compared with each other, under the rules in
+    remove_duplicate_items.
+    """
+    copies = {}
+    for item in items:
+        # the rules only apply to items with a status date
+        if 'ITEM_STATUS_DATE' in item:
+            copies.setdefault(item['ITEM_ID'], []).append(item)
+    for group in copies.values():
+        for i in range(len(group) - 1):
+            remove_duplicate_items(i, group)
+
+
 def remove_duplicate_items(i, items):
     #check if the item has already been processed
     if items[i].get('REMOVE'):
@@ -767,10 +942,6 @@ def trim_item_temp_location(item):
     return item['TEMPLOCATION']
 
 
-def _in_clause(items):
-    return ','.join(["'" + smart_str(item) + "'" for item in items])
-
-
 # deprecated
 def get_electronic_data(mfhd_id):
     query = """
@@ -784,7 +955,7 @@ SELECT mfhd_master.mfhd_id,
        RTRIM(wrlcdb.GetMfHDsubfield(%s,'856','3')) as LINK8563
 FROM mfhd_master
 WHERE mfhd_master.mfhd_id=%s"""
-    cursor = connection.cursor()
+    cursor = connection.cursor('single')
     cursor.execute(query, [mfhd_id] * 8)
     results = _make_dict(cursor, first=True)
     string = results.get('LINK856U')
@@ -798,9 +969,13 @@ SELECT RTRIM(wrlcdb.GetAllTags(%s,'M','852',2)) as MARC852,
        RTRIM(wrlcdb.GetAllTags(%s,'M','866',2)) as MARC866
 FROM mfhd_master
 WHERE mfhd_master.mfhd_id=%s"""
-    cursor = connection.cursor()
+    cursor = connection.cursor('single')
     cursor.execute(query, [mfhd_id] * 4)
     results = _make_dict(cursor, first=True)
+    return _parse_mfhd_data(results)
+
+
+def _parse_mfhd_data(results):
     # parse notes from 852
     string = results.get('MARC852', '')
     marc852 = ''
@@ -836,7 +1011,7 @@ def get_himmelfarb_bib_and_link(mfhdid):
         BIB_MFHD INNER JOIN BIB_MASTER ON BIB_MFHD.BIB_ID = BIB_MASTER.BIB_ID
         WHERE 
         BIB_MFHD.MFHD_ID= %s"""
-        cursor = connection.cursor()
+        cursor = connection.cursor('single')
         cursor.execute(query, [mfhdid])
         result = _make_dict(cursor, first=True)
         himmelfarb_bib = result['BIB_ID']
@@ -856,7 +1031,7 @@ def get_himmelfarb_linkonbib(bibid):
         FROM BIB_MASTER
         WHERE 
         BIB_MASTER.BIB_ID= %s"""
-        cursor = connection.cursor()
+        cursor = connection.cursor('single')
         cursor.execute(query, [bibid]*2)
         bib856result = _make_dict(cursor, first=True)
         # Updated to ignore new services/borrowing links
@@ -892,7 +1067,7 @@ SELECT RTRIM(wrlcdb.GetAllTags(%s,'M','852',2)) as MARC852,
        RTRIM(wrlcdb.GetAllTags(%s,'M','866',2)) as MARC866
 FROM mfhd_master
 WHERE mfhd_master.mfhd_id=%s"""
-    cursor = connection.cursor()
+    cursor = connection.cursor('single')
     cursor.execute(query, [mfhd_id] * 4)
     return _make_dict(cursor, first=True)
 
@@ -928,77 +1103,198 @@ ORDER BY PermLocation, TempLocation, item_status_date desc"""
     return _make_dict(cursor)
 
 
+ELECTRONIC_DATA_KEYS = ('MFHD_ID', 'LINK856U', 'LINK856Z', 'LINK852Z',
+                        'LINK852A', 'LINK852H', 'LINK866', 'LINK8563')
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def get_mfhd_tags(mfhd_ids):
+    """
+    Fetch the 852/856/866 data for a list of mfhds in one pass. Returns a
+    dictionary keyed by MFHD_ID holding the columns that get_electronic_data
+    and get_mfhd_data fetch for a single mfhd.
+    """
+    return _cached_many('mfhd_tags', mfhd_ids, _fetch_mfhd_tags,
+                        cache_settings()['BIB_TIMEOUT'])
+
+
+def _fetch_mfhd_tags(mfhd_ids):
+    query = """
+SELECT mfhd_master.mfhd_id,
+       RTRIM(wrlcdb.GetMfHDsubfield(mfhd_master.mfhd_id,'856','u')) as LINK856u,
+       RTRIM(wrlcdb.GetMfHDsubfield(mfhd_master.mfhd_id,'856','z')) as LINK856z,
+       RTRIM(wrlcdb.GetMfHDsubfield(mfhd_master.mfhd_id,'852','z')) as LINK852z,
+       RTRIM(wrlcdb.GetMfHDsubfield(mfhd_master.mfhd_id,'852','a')) as LINK852a,
+       RTRIM(wrlcdb.GetMfHDsubfield(mfhd_master.mfhd_id,'852','h')) as LINK852h,
+       RTRIM(wrlcdb.GetMfHDsubfield(mfhd_master.mfhd_id,'856','3')) as LINK8563,
+       RTRIM(wrlcdb.GetAllTags(mfhd_master.mfhd_id,'M','852',2)) as MARC852,
+       RTRIM(wrlcdb.GetAllTags(mfhd_master.mfhd_id,'M','856',2)) as MARC856,
+       RTRIM(wrlcdb.GetAllTags(mfhd_master.mfhd_id,'M','866',2)) as MARC866
+FROM mfhd_master
+WHERE mfhd_master.mfhd_id IN (%s)"""
+    tags = {}
+    mfhd_ids = list(set(mfhd_ids))
+    for chunk in _chunks(mfhd_ids, IN_LIST_BUCKETS[-1]):
+        cursor = connection.cursor('bulk')
+        binds, args = in_binds(chunk)
+        cursor.execute(query % binds, args)
+        for row in _make_dict(cursor):
+            # LINK866 and MARC866 are the same GetAllTags call
+            row['LINK866'] = row['MARC866']
+            tags[row['MFHD_ID']] = row
+    return tags
+
+
+def get_mfhd_items(mfhd_ids):
+    """
+    Fetch the items for a list of mfhds in one pass. Returns a dictionary
+    keyed by MFHD_ID with the rows get_items returns for each mfhd, in the
+    same order.
+    """
+    return _cached_many('mfhd_items', mfhd_ids, _fetch_mfhd_items,
+                        cache_settings()['STATUS_TIMEOUT'])
+
+
+def _fetch_mfhd_items(mfhd_ids):
+    query = """
+SELECT DISTINCT display_call_no, item_status_desc, item_status.item_status,
+       permLocation.location_display_name as PermLocation,
+       tempLocation.location_display_name as TempLocation,
+       mfhd_item.item_enum, mfhd_item.chron, item.item_id, item_status_date,
+       bib_master.bib_id, bib_mfhd.mfhd_id,
+       to_char(CIRC_TRANSACTIONS.current_DUE_DATE, 'mm-dd-yyyy') AS DUE
+FROM bib_master
+JOIN library ON library.library_id = bib_master.library_id
+JOIN bib_mfhd ON bib_master.bib_id = bib_mfhd.bib_id
+JOIN mfhd_master ON mfhd_master.mfhd_id = bib_mfhd.mfhd_id
+JOIN mfhd_item on mfhd_item.mfhd_id = mfhd_master.mfhd_id
+JOIN item ON item.item_id = mfhd_item.item_id
+JOIN item_status ON item_status.item_id = item.item_id
+JOIN item_status_type ON
+    item_status.item_status = item_status_type.item_status_type
+JOIN location permLocation ON permLocation.location_id = item.perm_location
+LEFT OUTER JOIN location tempLocation ON
+    tempLocation.location_id = item.temp_location
+LEFT OUTER JOIN circ_transactions on item.item_id = circ_transactions.item_id
+WHERE bib_mfhd.mfhd_id IN (%s)
+AND mfhd_master.suppress_in_opac = 'N'
+ORDER BY PermLocation, TempLocation, item_status_date desc"""
+    items = {}
+    mfhd_ids = list(set(mfhd_ids))
+    for chunk in _chunks(mfhd_ids, IN_LIST_BUCKETS[-1]):
+        cursor = connection.cursor('bulk')
+        binds, args = in_binds(chunk)
+        cursor.execute(query % binds, args)
+        for row in _make_dict(cursor):
+            items.setdefault(row.pop('MFHD_ID'), []).append(row)
+    return items
+
+
+def get_items_recalls(item_ids):
+    """
+    Count the recall notices for a list of items in one pass. Returns a
+    dictionary keyed by ITEM_ID; items without recalls are left out.
+    """
+    return _cached_many('recalls', [i for i in item_ids if i],
+                        _fetch_items_recalls,
+                        cache_settings()['STATUS_TIMEOUT'], default=0)
+
+
+def _fetch_items_recalls(item_ids):
+    query = """
+SELECT hold_recall_items.item_id, Count(hold_recall_items.item_id) AS recalls
+FROM hold_recall_items
+WHERE hold_recall_items.item_id IN (%s)
+GROUP BY hold_recall_items.item_id"""
+    recalls = {}
+    item_ids = list(set([i for i in item_ids if i]))
+    for chunk in _chunks(item_ids, IN_LIST_BUCKETS[-1]):
+        cursor = connection.cursor('bulk')
+        binds, args = in_binds(chunk)
+        cursor.execute(query % binds, args)
+        for item_id, count in cursor.fetchall():
+            recalls[item_id] = count
+    return recalls
+
+
+def _electronic_data(tags):
+    if not tags:
+        return ElectronicData()
+    return ElectronicData([(k, tags[k]) for k in ELECTRONIC_DATA_KEYS])
+
+
 def get_z3950_bib_data(bibid, lib):
-    conn = None
-    res = []
-    id_list = []
-    bib = None
-    try:
-        conn = _get_z3950_connection(settings.Z3950_SERVERS[lib])
-    except:
-        return None
-    query = zoom.Query('PQF', '@attr 1=12 %s' % bibid.encode('utf-8'))
+    """
+    Bib data for a GM/GT/DA record from its z39.50 server, through the
+    z3950 cache. Returns None when the record can't be found or fetched.
+    """
     try:
-        res = conn.search(query)
-        for r in res:
-            bib = {}
-            rec = pymarc.record.Record(r.data.bibliographicRecord.encoding[1])
-            bib['LIBRARY_NAME'] = lib
-            bib['AUTHOR'] = rec.author()
-            bib['BIB_ID'] = bibid
-            bib['BIB_FORMAT'] = rec['000']
-            id_list.append({'BIB_ID': bibid, 'LIBRARY_NAME': lib})
-            bib['BIB_ID_LIST'] = id_list
-            if rec['250']:
-                bib['EDITION'] = rec['250']['a']
-            else:
-                bib['EDITION'] = None
-            bib['IMPRINT'] = rec['260'].format_field()
-            bib['LANGUAGE'] = rec['008'].value()[35:38]
-            if rec['856']:
-                bib['LINK'] = rec['856']['u']
-            else:
-                bib['LINK'] = []
-            if rec['006']:
-                bib['MARC006'] = rec['006'].value()
-            else:
-                bib['MARC006'] = None
-            if rec['007']:
-                bib['MARC007'] = rec['007'].value()
-            else:
-                bib['MARC007'] = None
-            if rec['008']:
-                bib['MARC008'] = rec['008'].value()
-            else:
-                bib['MARC008'] = None
-            if rec['MESSAGE']:
-                bib['MESSAGE'] = rec['856']['z']
-            else:
-                bib['MESSAGE'] = None
-            if rec['035']:
-                num = rec['035']['a']
-                if _is_oclc(num):
-                    bib['OCLC'] = num
-            else:
-                bib['OCLC'] = None
-            bib['PUBLISHER'] = rec.publisher()
-            bib['PUBLISHER_DATE'] = rec.pubyear()
-            if rec['260']:
-                bib['PUB_PLACE'] = rec['260']['a']
-            else:
-                bib['PUB_PLACE'] = None
-            bib['TITLE'] = rec.title()
-            bib['TITLE_ALL'] = rec.title().decode('iso-8859-1').encode('utf8')
+        return z3950.cache.get_or_set(
+            ('bib', lib, bibid), lambda: _fetch_z3950_bib_data(bibid, lib),
+            z3950.cache_settings()['BIB_TIMEOUT'])
     except:
         return None
-    return bib
 
 
-def _get_z3950_connection(server):
-    conn = zoom.Connection(server['IP'], server['PORT'])
-    conn.databaseName = server['DB']
-    conn.preferredRecordSyntax = server['SYNTAX']
-    return conn
+def _fetch_z3950_bib_data(bibid, lib):
+    res = []
+    id_list = []
+    bib = None
+    pool = z3950.get_server_pool(settings.Z3950_SERVERS[lib])
+    res = pool.search(z3950.bib_query(bibid), limit=None)
+    for r in res:
+        bib = {}
+        rec = pymarc.record.Record(r.data.bibliographicRecord.encoding[1])
+        bib['LIBRARY_NAME'] = lib
+        bib['AUTHOR'] = rec.author()
+        bib['BIB_ID'] = bibid
+        bib['BIB_FORMAT'] = rec['000']
+        id_list.append({'BIB_ID': bibid, 'LIBRARY_NAME': lib})
+        bib['BIB_ID_LIST'] = id_list
+        if rec['250']:
+            bib['EDITION'] = rec['250']['a']
+        else:
+            bib['EDITION'] = None
+        bib['IMPRINT'] = rec['260'].format_field()
+        bib['LANGUAGE'] = rec['008'].value()[35:38]
+        if rec['856']:
+            bib['LINK'] = rec['856']['u']
+        else:
+            bib['LINK'] = []
+        if rec['006']:
+            bib['MARC006'] = rec['006'].value()
+        else:
+            bib['MARC006'] = None
+        if rec['007']:
+            bib['MARC007'] = rec['007'].value()
+        else:
+            bib['MARC007'] = None
+        if rec['008']:
+            bib['MARC008'] = rec['008'].value()
+        else:
+            bib['MARC008'] = None
+        if rec['MESSAGE']:
+            bib['MESSAGE'] = rec['856']['z']
+        else:
+            bib['MESSAGE'] = None
+        if rec['035']:
+            num = rec['035']['a']
+            if _is_oclc(num):
+                bib['OCLC'] = num
+        else:
+            bib['OCLC'] = None
+        bib['PUBLISHER'] = rec.publisher()
+        bib['PUBLISHER_DATE'] = rec.pubyear()
+        if rec['260']:
+            bib['PUB_PLACE'] = rec['260']['a']
+        else:
+            bib['PUB_PLACE'] = None
+        bib['TITLE'] = rec.title()
+        bib['TITLE_ALL'] = rec.title().decode('iso-8859-1').encode('utf8')
+    return bib
 
 
 def _GetValue(skey, tlist):
@@ -1012,7 +1308,6 @@ def _GetValue(skey, tlist):
 def get_z3950_holdings(id, school, id_type, query_type, bib_data,
                        translate_bib=True):
     conn = None
-    zoomrecord = None
     results = res = dataset = []
     availability = electronic = {}
     item_status = 0
@@ -1030,22 +1325,16 @@ def get_z3950_holdings(id, school, id_type, query_type, bib_data,
         return z3950_holdings_exception(bib, school, bib_data)
     try:
         if school in ['GT', 'DA'] and isinstance(bib, list):
-            zoomrecord = conn.zoom_record(bib[0])
-            result = get_z3950_holding_data(zoomrecord, conn, bib[0], school,
-                                            bib_data)
+            result = get_z3950_holding_data(conn, bib[0], school, bib_data)
             return result
         elif school in ['GT', 'DA'] and not isinstance(bib, list):
-            zoomrecord = conn.zoom_record(str(id))
-            result = get_z3950_holding_data(zoomrecord, conn, str(id), school,
-                                            bib_data)
+            result = get_z3950_holding_data(conn, str(id), school, bib_data)
             return result
         elif school == 'GM' and isinstance(bib, list):
             correctbib = get_correct_gm_bib(bib)
             if not translate_bib:
                 correctbib = bib
-            zoomrecord = conn.zoom_record(correctbib)
-            return get_z3950_holding_data(zoomrecord, conn, correctbib, school,
-                                          bib_data)
+            return get_z3950_holding_data(conn, correctbib, school, bib_data)
     except:
         return z3950_holdings_exception(bib, school, bib_data)
     if school == 'GM' and bib and not isinstance(bib, list):
@@ -1082,6 +1371,39 @@ def get_z3950_holdings(id, school, id_type, query_type, bib_data,
         return dataset
 
 
+def prefetch_z3950_holdings(holdings, bib_data, translate_bib=True):
+    """
+    Run get_z3950_holdings for every GM, GT and DA bib in holdings at the
+    same time, giving each catalog its configured TIMEOUT (or
+    Z3950_TIMEOUT). Returns the results keyed by BIB_ID; lookups that fail
+    or time out get the z3950_holdings_exception placeholder.
+    """
+    calls = []
+    seen = set()
+    for holding in holdings:
+        school = holding['LIBRARY_NAME']
+        if school not in ('GM', 'GT', 'DA') or holding['BIB_ID'] in seen:
+            continue
+        seen.add(holding['BIB_ID'])
+        timeout = settings.Z3950_SERVERS.get(school, {}).get(
+            'TIMEOUT', getattr(settings, 'Z3950_TIMEOUT', 10))
+        calls.append(((holding['BIB_ID'], school, 'bib', '', bib_data,
+                       translate_bib), timeout))
+    if not calls:
+        return {}
+
+    def fallback(bibid, school, *args):
+        return z3950_holdings_exception(bibid, school, bib_data)
+
+    def pool_for(bibid, school, *args):
+        if school in settings.Z3950_SERVERS:
+            return z3950.get_server_threads(settings.Z3950_SERVERS[school])
+
+    results = parallel.fan_out(get_z3950_holdings, calls, fallback, pool_for)
+    return dict([(args[0], result)
+                 for (args, timeout), result in zip(calls, results)])
+
+
 def z3950_holdings_exception(bib, school, bib_data):
     results = []
     dataset = []
@@ -1115,9 +1437,8 @@ def get_correct_gm_bib(bib_list):
     return correctbib
 
 
-def get_z3950_holding_data(zoomrecord, conn, correctbib, school, bib_data):
-    hold = conn.get_holding(bibid=correctbib, zoom_record=zoomrecord,
-                            school=school)
+def get_z3950_holding_data(conn, correctbib, school, bib_data):
+    hold = conn.cached_holding(correctbib, school=school)
     results = []
     dataset = []
     msg = note = status = location = url = callno = ''
@@ -1149,6 +1470,20 @@ def get_z3950_holding_data(zoomrecord, conn, correctbib, school, bib_data):
 
 
 def get_nongwbib_from_gwbib(bibid, school):
+    """
+    The George Mason or Georgetown catalog ids recorded on a voyager bib,
+    through the voyager cache.
+    """
+    try:
+        return cache.get_or_set(
+            ('catalog_ids', school, str(bibid)),
+            lambda: _fetch_nongwbib_from_gwbib(bibid, school),
+            cache_settings()['BIB_TIMEOUT'])
+    except:
+        return [bibid]
+
+
+def _fetch_nongwbib_from_gwbib(bibid, school):
     if school == 'GM':
         query = """
 SELECT bib_index.normal_heading
@@ -1163,29 +1498,14 @@ SELECT LOWER(SUBSTR(bib_index.normal_heading, 0,
 FROM bib_index
 WHERE bib_index.bib_id = %s
 AND bib_index.index_code ='907A'"""
-    try:
-        cursor = connection.cursor()
-        cursor.execute(query, [bibid])
-        results = _make_dict(cursor)
-    except:
-        return [bibid]
+    cursor = connection.cursor()
+    cursor.execute(query, [bibid])
+    results = _make_dict(cursor)
     return [row['NORMAL_HEADING'] for row in results]
 
 
 def get_gtbib_from_gwbib(bibid):
-    query = """
-SELECT LOWER(SUBSTR(bib_index.normal_heading, 0,
-    LENGTH(bib_index.normal_heading)-1))  \"NORMAL_HEADING\"
-FROM bib_index
-WHERE bib_index.bib_id = %s
-AND bib_index.index_code ='907A'"""
-    try:
-        cursor = connection.cursor()
-        cursor.execute(query, [bibid])
-        results = _make_dict(cursor)
-    except:
-        return [bibid]
-    return [row['NORMAL_HEADING'] for row in results]
+    return get_nongwbib_from_gwbib(bibid, 'GT')
 
 
 def get_wrlcbib_from_gtbib(gtbibid):
@@ -1196,7 +1516,7 @@ WHERE bib_index.normal_heading = %s
 AND bib_index.index_code = '907A'
 AND bib_index.bib_id = bib_master.bib_id
 AND bib_master.library_id IN ('14', '15')"""
-    cursor = connection.cursor()
+    cursor = connection.cursor('single')
     cursor.execute(query, [gtbibid.upper()])
     results = _make_dict(cursor)
     return results[0]['BIB_ID'] if results else None
@@ -1211,7 +1531,7 @@ AND bib_index.bib_id=bib_master.bib_id
 AND bib_index.normal_heading=bib_index.display_heading
 AND bib_master.library_id = '6'
 AND bib_index.normal_heading = %s"""
-    cursor = connection.cursor()
+    cursor = connection.cursor('single')
     cursor.execute(query, [gmbibid])
     results = _make_dict(cursor)
     return results[0]['BIB_ID'] if results else None
@@ -1280,7 +1600,6 @@ def is_item_eligible(item, library_name):
 
 def get_z3950_availability_data(bib, school, location, status, callno,
                                 item_status, found=True):
-    availability = {}
     catlink = ''
     if bib and school == 'GT':
         catlink = '''Click on the following link to get the information about
@@ -1296,41 +1615,28 @@ this item from Dahlgren library Catalog <br>
 http://catalog.library.georgetown.edu/record=b%s~S4'''
     if bib:
         catlink = catlink % bib
-    if found:
-        availability = {'BIB_ID': bib,
-                        'CHRON': None,
-                        'DISPLAY_CALL_NO': callno,
-                        'ITEM_ENUM': None,
-                        'ITEM_ID': None,
-                        'ITEM_STATUS': item_status,
-                        'ITEM_STATUS_DATE': '',
-                        'ITEM_STATUS_DESC': status,
-                        'PERMLOCATION': location,
-                        'TEMPLOCATION': None}
-    else:
-        availability = {'BIB_ID': bib,
-                        'CHRON': None,
-                        'DISPLAY_CALL_NO': callno,
-                        'ITEM_ENUM': None,
-                        'ITEM_ID': None,
-                        'ITEM_STATUS': item_status,
-                        'ITEM_STATUS_DATE': '',
-                        'ITEM_STATUS_DESC': status,
-                        'PERMLOCATION': catlink,
-                        'TEMPLOCATION': None}
-    return availability
+    return Availability({'BIB_ID': bib,
+                         'CHRON': None,
+                         'DISPLAY_CALL_NO': callno,
+                         'ITEM_ENUM': None,
+                         'ITEM_ID': None,
+                         'ITEM_STATUS': item_status,
+                         'ITEM_STATUS_DATE': '',
+                         'ITEM_STATUS_DESC': status,
+                         'PERMLOCATION': location if found else catlink,
+                         'TEMPLOCATION': None})
 
 
 def get_z3950_electronic_data(school, link, message, note, Found=True):
     link852h = ''
     if link != '':
         link852h = school + ': Electronic Resource'
-    electronic = {'LINK852A': None,
-                  'LINK852H': link852h,
-                  'LINK856Z': message,
-                  'LINK856U': link,
-                  'LINK866': None,
-                  'MFHD_ID': None}
+    electronic = ElectronicData({'LINK852A': None,
+                                 'LINK852H': link852h,
+                                 'LINK856Z': message,
+                                 'LINK856U': link,
+                                 'LINK866': None,
+                                 'MFHD_ID': None})
     return electronic
 
 
@@ -1397,7 +1703,7 @@ def get_z3950_mfhd_data(id, school, links, internet_items, bib_data):
             library_full_name = settings.LIB_LOOKUP[bib_data['LIBRARY_NAME']]
             display_call_no = bib_data['LIBRARY_NAME'] + \
                 ' Electronic Resource'
-            item = {
+            item = Item({
                 'ITEM_ENUM': None, 'ELIGIBLE': False,
                 'ITEM_STATUS': 1, 'ITEM_STATUS_DATE': '',
                 'TEMPLOCATION': None, 'ITEM_STATUS_DESC': '',
@@ -1407,7 +1713,7 @@ def get_z3950_mfhd_data(id, school, links, internet_items, bib_data):
                 'TRIMMED_LOCATION_DISPLAY_NAME': 'ONLINE',
                 'DISPLAY_CALL_NO': display_call_no,
                 'CHRON': None
-            }
+            })
             items.append(item)
         else:
             return []
@@ -1425,18 +1731,18 @@ def get_z3950_mfhd_data(id, school, links, internet_items, bib_data):
             m866list.append(link['STATUS'])
         elif (link['STATUS'] != '' or link['LOCATION'] != '' or
                 link['CALLNO'] != ''):
-            val = {'ITEM_ENUM': None,
-                   'ELIGIBLE': '',
-                   'ITEM_STATUS': 0,
-                   'TEMPLOCATION': None,
-                   'ITEM_STATUS_DESC': link['STATUS'],
-                   'BIB_ID': id,
-                   'ITEM_ID': 0,
-                   'LIBRARY_FULL_NAME': '',
-                   'PERMLOCATION': link['LOCATION'],
-                   'TRIMMED_LOCATION_DISPLAY_NAME': '',
-                   'DISPLAY_CALL_NO': link['CALLNO'],
-                   'CHRON': None}
+            val = Item({'ITEM_ENUM': None,
+                        'ELIGIBLE': '',
+                        'ITEM_STATUS': 0,
+                        'TEMPLOCATION': None,
+                        'ITEM_STATUS_DESC': link['STATUS'],
+                        'BIB_ID': id,
+                        'ITEM_ID': 0,
+                        'LIBRARY_FULL_NAME': '',
+                        'PERMLOCATION': link['LOCATION'],
+                        'TRIMMED_LOCATION_DISPLAY_NAME': '',
+                        'DISPLAY_CALL_NO': link['CALLNO'],
+                        'CHRON': None})
             items.append(val)
     res.append(m866list)
     res.append(m856list)
@@ -1549,12 +1855,13 @@ def get_illiad_link(bib_data):
         if bib_data.get('ISSN', ''):
             query_args['rft.issn'] = bib_data['ISSN']
         query_args['rft.jtitle'] = smart_str(title)
-        if bib_data['openurl']['params'].get('sid'):
-            query_args['rfr_id'] = bib_data['openurl']['params']['sid'] + ':'\
-                + settings.ILLIAD_SID
-        elif bib_data['openurl']['params'].get('rfr_id'):
-            query_args['rfr_id'] = bib_data['openurl']['params']['rfr_id'] +\
-                ':' + settings.ILLIAD_SID
+        # cached item data is built before the request's openurl is added
+        params = bib_data.get('openurl', {}).get('params', {})
+        if params.get('sid'):
+            query_args['rfr_id'] = params['sid'] + ':' + settings.ILLIAD_SID
+        elif params.get('rfr_id'):
+            query_args['rfr_id'] = params['rfr_id'] + ':' + \
+                settings.ILLIAD_SID
         else:
             query_args['rfr_id'] = settings.ILLIAD_SID
     else:
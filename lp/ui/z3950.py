@@ -1,32 +1,250 @@
 from datetime import datetime
+import logging
 import pymarc
 import re
+import threading
+import time
 from PyZ3950 import zoom
 
+from django.conf import settings
 
-class Z3950Catalog():
+from ui import parallel
+from ui.cache import TieredCache
+from ui.profiling import timed
 
-    def __init__(self, ip, port, name, syntax):
+
+logger = logging.getLogger(__name__)
+
+# seconds between tries for a free connection slot
+SLOT_POLL_INTERVAL = 0.05
+
+
+class PoolBusy(Exception):
+    """
+    Every connection to a server stayed in use for as long as the caller
+    was willing to wait.
+    """
+
+
+class ConnectionPool(object):
+    """
+    Warm ZOOM connections to one Z39.50 server. At most `size` searches
+    run against the server at once, and a search that can't get a turn
+    within `timeout` seconds raises PoolBusy rather than queueing behind a
+    server that has stopped answering; the same timeout is set on each
+    connection's socket. Connections left idle for more than `idle_timeout`
+    seconds are closed rather than reused, and a reused connection that
+    fails is replaced and the search tried once more.
+    """
+
+    def __init__(self, ip, port, name, syntax, size=4, idle_timeout=300,
+                 timeout=10):
         self.ip = ip
         self.port = port
         self.name = name
         self.syntax = syntax
-        self.conn = self._getconn(ip, port, name, syntax)
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.idle = []
 
-    def _getconn(self, ip, port, name, syntax):
-        conn = zoom.Connection(ip, port)
-        conn.databaseName = name
-        conn.preferredRecordSyntax = syntax
+    def _connect(self):
+        conn = zoom.Connection(self.ip, self.port)
+        conn.databaseName = self.name
+        conn.preferredRecordSyntax = self.syntax
+        # zoom.Connection takes no timeout, so set one on the socket its
+        # client opened
+        sock = getattr(getattr(conn, '_cli', None), 'sock', None)
+        if sock is not None and self.timeout is not None:
+            sock.settimeout(self.timeout)
         return conn
 
-    def zoom_record(self, bibid):
-        query = zoom.Query('PQF', '@attr 1=12 %s' % bibid.encode('utf-8'))
+    def _acquire(self, timeout):
+        """
+        Take a connection slot, raising PoolBusy if none frees up within
+        `timeout` seconds. Python 2 semaphores can't wait with a timeout,
+        so this polls.
+        """
+        deadline = time.time() + (timeout or 0)
+        while not self.slots.acquire(False):
+            if time.time() >= deadline:
+                raise PoolBusy('no free z39.50 connection to %s:%s' %
+                               (self.ip, self.port))
+            time.sleep(SLOT_POLL_INTERVAL)
+
+    def _close(self, conn):
         try:
-            results = self.conn.search(query)
-            if len(results) > 0:
-                return results[0]
+            conn.close()
         except:
-            raise
+            pass
+
+    def _checkout(self):
+        """
+        Returns (conn, reused), evicting connections that sat idle too long.
+        """
+        now = time.time()
+        stale = []
+        conn = None
+        with self.lock:
+            while self.idle:
+                candidate, last_used = self.idle.pop()
+                if now - last_used > self.idle_timeout:
+                    stale.append(candidate)
+                else:
+                    conn = candidate
+                    break
+        for candidate in stale:
+            self._close(candidate)
+        if conn is not None:
+            return conn, True
+        return self._connect(), False
+
+    def _checkin(self, conn):
+        with self.lock:
+            self.idle.append((conn, time.time()))
+
+    def search(self, query, limit=1, timeout=None):
+        """
+        Run a zoom.Query and return up to `limit` records (all of them when
+        limit is None). Records are fetched before the connection goes back
+        to the pool since a result set reads them through the connection.
+        `timeout` is how long to wait for a free connection, the pool's
+        timeout by default.
+        """
+        self._acquire(self.timeout if timeout is None else timeout)
+        try:
+            conn, reused = self._checkout()
+            try:
+                records = self._search(conn, query, limit)
+            except Exception:
+                self._close(conn)
+                if not reused:
+                    raise
+                logger.warning('z39.50 connection to %s:%s failed, '
+                               'reconnecting' % (self.ip, self.port))
+                conn = self._connect()
+                try:
+                    records = self._search(conn, query, limit)
+                except Exception:
+                    self._close(conn)
+                    raise
+            self._checkin(conn)
+            return records
+        finally:
+            self.slots.release()
+
+    def _search(self, conn, query, limit):
+        with timed('z3950'):
+            results = conn.search(query)
+            count = len(results) if limit is None else \
+                min(limit, len(results))
+            return [results[i] for i in range(count)]
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn, last_used in idle:
+            self._close(conn)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(ip, port, name, syntax):
+    """
+    Returns the process-wide ConnectionPool for a server, sized from the
+    MAX_CONNECTIONS of its Z3950_SERVERS entry (or Z3950_POOL_SIZE) and
+    timing out after its TIMEOUT (or Z3950_TIMEOUT).
+    """
+    key = (ip, str(port), name, syntax)
+    with _pools_lock:
+        if key not in _pools:
+            size = getattr(settings, 'Z3950_POOL_SIZE', 4)
+            timeout = getattr(settings, 'Z3950_TIMEOUT', 10)
+            for server in settings.Z3950_SERVERS.values():
+                if (server.get('IP'), str(server.get('PORT')),
+                        server.get('DB'), server.get('SYNTAX')) == key:
+                    size = server.get('MAX_CONNECTIONS', size)
+                    timeout = server.get('TIMEOUT', timeout)
+            _pools[key] = ConnectionPool(
+                ip, port, name, syntax, size=size,
+                idle_timeout=getattr(settings, 'Z3950_IDLE_TIMEOUT', 300),
+                timeout=timeout)
+        return _pools[key]
+
+
+def get_server_pool(server):
+    """
+    Returns the ConnectionPool for a Z3950_SERVERS entry.
+    """
+    return get_pool(server['IP'], server['PORT'], server['DB'],
+                    server['SYNTAX'])
+
+
+def get_server_threads(server):
+    """
+    Returns the thread pool lookups against a Z3950_SERVERS entry are fanned
+    out on, one thread per connection the server allows.
+    """
+    pool = get_server_pool(server)
+    return parallel.get_named_pool(
+        ('z3950', pool.ip, str(pool.port), pool.name), pool.size)
+
+
+def cache_settings():
+    conf = {
+        'BIB_TIMEOUT': 60 * 60 * 24,
+        'STATUS_TIMEOUT': 60 * 5,
+        'NEGATIVE_TIMEOUT': 60 * 5,
+        'LOCAL_SIZE': 1000,
+    }
+    conf.update(getattr(settings, 'Z3950_CACHE', {}))
+    return conf
+
+
+# bib records and circulation status fetched over z39.50, keyed by
+# (kind, server, record id)
+cache = TieredCache('z3950', size=cache_settings()['LOCAL_SIZE'],
+                    negative_timeout=cache_settings()['NEGATIVE_TIMEOUT'])
+
+
+def bib_query(bibid):
+    return zoom.Query('PQF', '@attr 1=12 %s' % bibid.encode('utf-8'))
+
+
+class Z3950Catalog():
+
+    def __init__(self, ip, port, name, syntax):
+        self.ip = ip
+        self.port = port
+        self.name = name
+        self.syntax = syntax
+        self.pool = get_pool(ip, port, name, syntax)
+
+    def zoom_record(self, bibid):
+        results = self.pool.search(bib_query(bibid))
+        if len(results) > 0:
+            return results[0]
+
+    def cached_holding(self, bibid, school=''):
+        """
+        get_holding for a bibid, kept in the z3950 cache for the status
+        timeout since it carries circulation data.
+        """
+        def fetch():
+            zoom_record = self.zoom_record(bibid)
+            if zoom_record is None:
+                return None
+            return self.get_holding(bibid=bibid, zoom_record=zoom_record,
+                                    school=school)
+        key = ('holding', self.ip, self.port, self.name, bibid, school)
+        holding = cache.get_or_set(key, fetch,
+                                   cache_settings()['STATUS_TIMEOUT'])
+        # an unknown bibid gets the same empty holding get_holding returns
+        return holding or self.get_holding()
 
     def get_holding(self, bibid=None, zoom_record=None, school=''):
         # This retrieves and parses both GM and GT z3950 responses, which are